@@ -0,0 +1,225 @@
+"""
+Actions Module
+Runs an ordered batch of browser actions (click, type, key, scroll,
+wait_for_selector, navigate) in one locked pass on a session's driver, so a
+scripted flow costs one request and one final frame
+"""
+
+import time
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from metrics import metrics
+
+# Longest batch accepted by /api/actions
+MAX_ACTIONS = 50
+
+# wait_for_selector default and ceiling, in milliseconds
+DEFAULT_WAIT_MS = 5000
+MAX_WAIT_MS = 30000
+
+# Seconds navigate waits for document.readyState to be complete
+NAVIGATE_TIMEOUT = 10
+
+# Seconds a whole batch may hold the session lock
+MAX_BATCH_SECONDS = 60
+
+# Actions that usually start network requests or DOM changes wait for the page
+# to settle afterwards unless the action sets "settle": false
+SETTLE_BY_DEFAULT = {'click': True, 'type': False, 'key': True, 'scroll': False,
+                     'wait_for_selector': False, 'navigate': False}
+
+# DevTools key definitions for Input.dispatchKeyEvent
+KEYS = {
+    'Enter': {'code': 'Enter', 'windowsVirtualKeyCode': 13, 'text': '\r'},
+    'Tab': {'code': 'Tab', 'windowsVirtualKeyCode': 9},
+    'Escape': {'code': 'Escape', 'windowsVirtualKeyCode': 27},
+    'Backspace': {'code': 'Backspace', 'windowsVirtualKeyCode': 8},
+    'Delete': {'code': 'Delete', 'windowsVirtualKeyCode': 46},
+    'ArrowLeft': {'code': 'ArrowLeft', 'windowsVirtualKeyCode': 37},
+    'ArrowUp': {'code': 'ArrowUp', 'windowsVirtualKeyCode': 38},
+    'ArrowRight': {'code': 'ArrowRight', 'windowsVirtualKeyCode': 39},
+    'ArrowDown': {'code': 'ArrowDown', 'windowsVirtualKeyCode': 40},
+    'Home': {'code': 'Home', 'windowsVirtualKeyCode': 36},
+    'End': {'code': 'End', 'windowsVirtualKeyCode': 35},
+    'PageUp': {'code': 'PageUp', 'windowsVirtualKeyCode': 33},
+    'PageDown': {'code': 'PageDown', 'windowsVirtualKeyCode': 34},
+    'Space': {'code': 'Space', 'windowsVirtualKeyCode': 32, 'text': ' ', 'key': ' '}
+}
+
+CLICK_SCRIPT = '''
+var element = arguments[0] ? document.querySelector(arguments[0])
+                           : document.elementFromPoint(arguments[1], arguments[2]);
+if (!element) return false;
+element.click();
+return true;
+'''
+
+FOCUS_SCRIPT = '''
+var element = document.querySelector(arguments[0]);
+if (!element) return false;
+element.focus();
+return true;
+'''
+
+SCROLL_SCRIPT = '''
+var element = arguments[0] ? document.querySelector(arguments[0]) : null;
+if (arguments[0] && !element) return false;
+(element || window).scrollBy(arguments[1], arguments[2]);
+return true;
+'''
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ActionError(Exception):
+    """Raised when a batch is invalid or one of its actions fails"""
+
+    def __init__(self, message: str, index: int = None, results: List[Dict] = None):
+        super().__init__(message)
+        self.index = index
+        self.results = results or []
+
+
+def validate_actions(actions) -> List[Dict]:
+    """
+    Check a batch before anything runs
+
+    Raises:
+        ActionError: Not a list, too long, or an action is malformed
+    """
+    if not isinstance(actions, list) or not actions:
+        raise ActionError('actions must be a non-empty list')
+    if len(actions) > MAX_ACTIONS:
+        raise ActionError(f'At most {MAX_ACTIONS} actions per request')
+
+    for index, action in enumerate(actions):
+        if not isinstance(action, dict) or action.get('type') not in SETTLE_BY_DEFAULT:
+            raise ActionError(f"Action {index}: type must be one of {', '.join(SETTLE_BY_DEFAULT)}", index)
+        kind = action['type']
+        if kind == 'click' and not action.get('selector') and not all(
+                _is_number(action.get(axis)) for axis in ('x', 'y')):
+            raise ActionError(f'Action {index}: click needs a selector or x and y', index)
+        for field in ('x', 'y', 'dx', 'dy'):
+            if field in action and not _is_number(action[field]):
+                raise ActionError(f'Action {index}: {field} must be a number', index)
+        if 'timeout' in action and not (_is_number(action['timeout']) and action['timeout'] >= 0):
+            raise ActionError(f'Action {index}: timeout must be a number of milliseconds', index)
+        if 'settle' in action and not isinstance(action['settle'], bool):
+            raise ActionError(f'Action {index}: settle must be true or false', index)
+        if kind == 'type' and not isinstance(action.get('text'), str):
+            raise ActionError(f'Action {index}: type needs text', index)
+        if kind == 'key' and action.get('key') not in KEYS:
+            raise ActionError(f"Action {index}: key must be one of {', '.join(KEYS)}", index)
+        if kind == 'wait_for_selector' and not action.get('selector'):
+            raise ActionError(f'Action {index}: wait_for_selector needs a selector', index)
+        if kind == 'navigate' and urlparse(str(action.get('url', ''))).scheme not in ('http', 'https'):
+            raise ActionError(f'Action {index}: navigate needs an http(s) url', index)
+    return actions
+
+
+def _click(browser, action: Dict, deadline: float) -> None:
+    if not browser.driver.execute_script(CLICK_SCRIPT, action.get('selector'),
+                                         action.get('x', 0), action.get('y', 0)):
+        raise ActionError('Nothing to click there')
+
+
+def _type(browser, action: Dict, deadline: float) -> None:
+    driver = browser.driver
+    if action.get('selector') and not driver.execute_script(FOCUS_SCRIPT, action['selector']):
+        raise ActionError(f"No element matches {action['selector']}")
+    driver.switch_to.active_element.send_keys(action['text'])
+
+
+def _key(browser, action: Dict, deadline: float) -> None:
+    definition = dict(KEYS[action['key']])
+    definition.setdefault('key', action['key'])
+    text = definition.pop('text', None)
+    down = dict(definition, type='keyDown')
+    if text:
+        down['text'] = text
+    browser.driver.execute_cdp_cmd('Input.dispatchKeyEvent', down)
+    browser.driver.execute_cdp_cmd('Input.dispatchKeyEvent', dict(definition, type='keyUp'))
+
+
+def _scroll(browser, action: Dict, deadline: float) -> None:
+    if not browser.driver.execute_script(SCROLL_SCRIPT, action.get('selector'),
+                                         action.get('dx', 0), action.get('dy', 0)):
+        raise ActionError(f"No element matches {action['selector']}")
+
+
+def _wait_for_selector(browser, action: Dict, deadline: float) -> None:
+    timeout = min(action.get('timeout', DEFAULT_WAIT_MS), MAX_WAIT_MS) / 1000
+    deadline = min(time.time() + timeout, deadline)
+    while not browser.driver.execute_script('return !!document.querySelector(arguments[0])',
+                                            action['selector']):
+        if time.time() >= deadline:
+            raise ActionError(f"Timed out waiting for {action['selector']}")
+        time.sleep(0.1)
+
+
+def _navigate(browser, action: Dict, deadline: float) -> None:
+    driver = browser.driver
+    browser.blocker().apply(action['url'])
+    driver.get(action['url'])
+    deadline = min(time.time() + NAVIGATE_TIMEOUT, deadline)
+    while driver.execute_script('return document.readyState') != 'complete' and time.time() < deadline:
+        time.sleep(0.1)
+
+
+HANDLERS = {
+    'click': _click,
+    'type': _type,
+    'key': _key,
+    'scroll': _scroll,
+    'wait_for_selector': _wait_for_selector,
+    'navigate': _navigate
+}
+
+
+def run_actions(browser, actions: List[Dict], max_seconds: float = MAX_BATCH_SECONDS) -> List[Dict]:
+    """
+    Run validated actions in order (caller holds the session lock)
+
+    Args:
+        browser: BrowserSession to act on
+        actions: Batch checked by validate_actions
+        max_seconds: Time limit for the whole batch; waits are cut short to fit
+
+    Returns:
+        Per-action results with timings in milliseconds
+
+    Raises:
+        ActionError: An action failed or the batch ran out of time; carries
+            its index and earlier results
+    """
+    results = []
+    settle = browser.settle_detector()
+    deadline = time.time() + max_seconds
+    for index, action in enumerate(actions):
+        kind = action['type']
+        if time.time() >= deadline:
+            raise ActionError(f'Action {index} ({kind}) not run: batch time limit of {max_seconds:g}s reached',
+                              index, results)
+        wait = action.get('settle', SETTLE_BY_DEFAULT[kind])
+        start = time.perf_counter()
+        if wait:
+            settle.mark()
+        try:
+            HANDLERS[kind](browser, action, deadline)
+        except Exception as e:
+            results.append({'type': kind, 'ms': round((time.perf_counter() - start) * 1000), 'error': str(e)})
+            raise ActionError(f'Action {index} ({kind}) failed: {e}', index, results) from e
+
+        result = {'type': kind}
+        if wait:
+            settle_seconds, settled = settle.wait()
+            result.update(settle_ms=round(settle_seconds * 1000), settled=settled)
+        result['ms'] = round((time.perf_counter() - start) * 1000)
+        results.append(result)
+        metrics.observe(f'browser.action_seconds.{kind}', result['ms'] / 1000)
+
+    metrics.observe('browser.action_batch_size', len(actions))
+    return results
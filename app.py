@@ -3,78 +3,91 @@ Web Proxy VPN - Bypass Network Restrictions
 Access any website through this secure proxy portal
 """
 
-from flask import Flask, render_template, request, redirect, Response
+from flask import Flask, render_template, request, redirect, Response, g, send_from_directory
 import requests
-from urllib.parse import urljoin, urlparse
-import re
+from urllib.parse import urljoin
+import os
+
+from cookie_jar import CookieJarStore
+from link_rewriter import prepare_for_service_worker, SERVICE_WORKER_REGISTER_SCRIPT
+from metrics import metrics
+from rewrite_pool import RewritePool
+from shared_store import SharedStore
+from upstream_client import UpstreamClient
 
 app = Flask(__name__)
 
 # Disable SSL warnings for proxied requests
 requests.packages.urllib3.disable_warnings()
 
+# Upstream cookies stay on the server; the client only holds a session id
+cookie_jar = CookieJarStore(shared_store=SharedStore.from_env())
+
+# Origin fetches; multiplexed over HTTP/2 when PROXY_HTTP2=1 and httpx[http2] is installed
+upstream = UpstreamClient()
+
+# Large pages are rewritten in worker processes instead of holding the GIL
+rewrite_pool = RewritePool()
+
+MAX_REDIRECTS = 10
+
+# Optional client-side rewriting: pages register static/proxy-sw.js, and once
+# it is active the server stops rewriting HTML for that session
+SERVICE_WORKER_ENABLED = os.environ.get('PROXY_SERVICE_WORKER', '0') == '1'
+SERVICE_WORKER_COOKIE_NAME = 'proxy_sw'
+
+
+def get_jar_session_id():
+    """Get the cookie jar session id for this client, assigning one if needed"""
+    session_id = request.cookies.get(CookieJarStore.SESSION_COOKIE_NAME)
+    if not session_id:
+        session_id = CookieJarStore.new_session_id()
+        g.new_jar_session_id = session_id
+    return session_id
+
+
+def fetch_upstream(method, url, headers, data, session_id):
+    """
+    Request a URL, following redirects by hand so every hop only
+    carries the cookies that apply to it
+
+    Returns:
+        Tuple of (final response, final URL)
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        hop_headers = dict(headers)
+        cookie_header = cookie_jar.cookie_header(session_id, url)
+        if cookie_header:
+            hop_headers['Cookie'] = cookie_header
+
+        response = upstream.request(method, url, headers=hop_headers, data=data)
+        cookie_jar.store_from_headers(session_id, url, response.set_cookie_headers)
+
+        if not response.is_redirect:
+            return response, url
+
+        url = urljoin(url, response.headers['Location'])
+        if response.status_code == 303 or (response.status_code in (301, 302) and method == 'POST'):
+            method = 'GET'
+            data = None
+            headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
 
-def make_absolute_url(url, base_url):
-    """Convert relative URLs to absolute URLs"""
-    if url.startswith('//'):
-        return 'https:' + url
-    elif url.startswith('/'):
-        parsed = urlparse(base_url)
-        return f"{parsed.scheme}://{parsed.netloc}{url}"
-    elif not url.startswith(('http://', 'https://')):
-        return urljoin(base_url, url)
-    return url
-
-
-def proxy_url(url):
-    """Convert external URL to proxied URL through our server"""
-    if url.startswith(('http://', 'https://', '//')):
-        return f"/proxy?url={url}"
-    return url
-
-
-def rewrite_links(html_content, base_url):
-    """Rewrite all links in HTML to go through proxy"""
-    # Rewrite href attributes
-    html_content = re.sub(
-        r'href=["\']([^"\']+)["\']',
-        lambda m: f'href="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
-        html_content
-    )
-
-    # Rewrite src attributes (images, scripts, etc)
-    html_content = re.sub(
-        r'src=["\']([^"\']+)["\']',
-        lambda m: f'src="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
-        html_content
-    )
-
-    # Rewrite action attributes in forms
-    html_content = re.sub(
-        r'action=["\']([^"\']+)["\']',
-        lambda m: f'action="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
-        html_content
-    )
-
-    # Rewrite CSS url() references
-    html_content = re.sub(
-        r'url\(["\']?([^"\')\s]+)["\']?\)',
-        lambda m: f'url({proxy_url(make_absolute_url(m.group(1), base_url))})',
-        html_content
-    )
-
-    # Rewrite JavaScript location redirects
-    parsed = urlparse(base_url)
-    base_domain = f"{parsed.scheme}://{parsed.netloc}"
-
-    # Rewrite window.location and location.href
-    html_content = re.sub(
-        r'(window\.location|location\.href)\s*=\s*["\']([^"\']+)["\']',
-        lambda m: f'{m.group(1)}="/proxy?url={make_absolute_url(m.group(2), base_url)}"',
-        html_content
-    )
-
-    return html_content
+    raise requests.exceptions.TooManyRedirects(f'Exceeded {MAX_REDIRECTS} redirects')
+
+
+@app.after_request
+def attach_jar_session_cookie(response):
+    """Give new clients their cookie jar session id"""
+    session_id = g.pop('new_jar_session_id', None)
+    if session_id:
+        response.set_cookie(
+            CookieJarStore.SESSION_COOKIE_NAME,
+            session_id,
+            max_age=cookie_jar.idle_timeout,
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
 
 
 @app.route('/')
@@ -83,6 +96,31 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/api/metrics')
+def api_metrics():
+    """Get proxy metrics (aggregated across workers under serve.py)"""
+    snapshot = metrics.snapshot()
+    snapshot['cookie_jar'] = cookie_jar.stats()
+
+    # Share of service-worker session subresources rewritten on the client
+    # (page loads are counted separately as sw.navigations)
+    counters = snapshot['counters']
+    client_rewrites = counters.get('sw.client_rewrites', 0)
+    server_requests = counters.get('sw.server_requests', 0)
+    if client_rewrites + server_requests:
+        snapshot['sw_hit_rate'] = client_rewrites / (client_rewrites + server_requests)
+    return snapshot
+
+
+@app.route('/proxy-sw.js')
+def service_worker():
+    """Serve the URL-rewriting service worker with a root scope"""
+    response = send_from_directory(app.static_folder, 'proxy-sw.js', max_age=0)
+    response.headers['Content-Type'] = 'application/javascript'
+    response.headers['Service-Worker-Allowed'] = '/'
+    return response
+
+
 @app.route('/browse', methods=['POST', 'GET'])
 def browse():
     """Handle URL submission and redirect to proxy"""
@@ -109,11 +147,19 @@ def proxy():
     if not target_url:
         return redirect('/')
 
+    sw_session = SERVICE_WORKER_ENABLED and request.cookies.get(SERVICE_WORKER_COOKIE_NAME) == '1'
+    if sw_session:
+        # Page loads always come straight to /proxy, so they're not part of the hit rate
+        if request.headers.get('Sec-Fetch-Mode') == 'navigate':
+            metrics.incr('sw.navigations')
+        else:
+            metrics.incr('sw.client_rewrites' if request.headers.get('X-Proxy-SW') else 'sw.server_requests')
+
     try:
-        # Forward headers from client
+        # Forward headers from client (cookies come from the server-side jar)
         headers = {}
         for key, value in request.headers:
-            if key.lower() not in ['host', 'connection', 'content-length', 'content-encoding']:
+            if key.lower() not in ['host', 'connection', 'content-length', 'content-encoding', 'cookie', 'x-proxy-sw']:
                 headers[key] = value
 
         # Ensure we have a proper User-Agent
@@ -121,38 +167,38 @@ def proxy():
             headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 
         # Make request to target URL (handle both GET and POST)
-        if request.method == 'POST':
-            response = requests.post(
-                target_url,
-                data=request.get_data(),
-                headers=headers,
-                cookies=request.cookies,
-                timeout=30,
-                allow_redirects=True,
-                verify=False
-            )
-        else:
-            response = requests.get(
-                target_url,
-                headers=headers,
-                cookies=request.cookies,
-                timeout=30,
-                allow_redirects=True,
-                verify=False
-            )
+        data = request.get_data() if request.method == 'POST' else None
+        response, final_url = fetch_upstream(
+            request.method,
+            target_url,
+            headers,
+            data,
+            get_jar_session_id()
+        )
 
         content_type = response.headers.get('Content-Type', '')
 
         # Prepare response headers
         response_headers = {}
         for key, value in response.headers.items():
-            if key.lower() not in ['content-encoding', 'content-length', 'transfer-encoding', 'connection']:
+            if key.lower() not in ['content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie']:
                 response_headers[key] = value
 
+        # Answers to conditional requests have no body to rewrite
+        if response.status_code == 304:
+            return Response(status=304, headers=response_headers)
+
         # If it's HTML, rewrite links to go through proxy
         if 'text/html' in content_type:
             content = response.text
-            content = rewrite_links(content, target_url)
+            if sw_session:
+                content = prepare_for_service_worker(content, final_url)
+                metrics.incr('sw.html_rewrites_skipped')
+                # Relative links now resolve against the original site
+                home_url = request.host_url
+            else:
+                content = rewrite_pool.rewrite(content, final_url)
+                home_url = '/'
 
             # Add a banner to show the proxied URL
             banner = f'''
@@ -162,36 +208,25 @@ def proxy():
                         <span style="font-weight: bold;">🔓 Proxy Active</span>
                         <span style="opacity: 0.9; font-size: 14px;">Viewing: {target_url}</span>
                     </div>
-                    <a href="/" style="background: white; color: #1a73e8; padding: 5px 15px; border-radius: 4px; text-decoration: none; font-size: 14px;">New URL</a>
+                    <a href="{home_url}" style="background: white; color: #1a73e8; padding: 5px 15px; border-radius: 4px; text-decoration: none; font-size: 14px;">New URL</a>
                 </div>
             </div>
             <div style="height: 50px;"></div>
             '''
+            if SERVICE_WORKER_ENABLED and not sw_session:
+                banner += SERVICE_WORKER_REGISTER_SCRIPT
             content = content.replace('<body', banner + '<body', 1)
 
             response_headers['Content-Type'] = 'text/html; charset=utf-8'
 
-            # Create response with cookies
-            flask_response = Response(content, headers=response_headers)
-
-            # Forward cookies from the proxied site
-            for cookie in response.cookies:
-                flask_response.set_cookie(
-                    cookie.name,
-                    cookie.value,
-                    max_age=cookie.expires,
-                    path=cookie.path or '/',
-                    domain=None,  # Don't set domain to allow cookie on our proxy
-                    secure=False,
-                    httponly=cookie.has_nonstandard_attr('HttpOnly')
-                )
-
-            return flask_response
+            return Response(content, headers=response_headers)
         else:
             # For non-HTML content (images, CSS, JS, etc), pass through as-is
             response_headers['Cache-Control'] = 'public, max-age=3600'
+            # Keep partial content (206) for range requests, e.g. media seeking
             return Response(
                 response.content,
+                status=response.status_code,
                 headers=response_headers
             )
 
@@ -12,18 +12,35 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
 import secrets
-import base64
 import time
 import os
-from urllib.parse import urlparse, urljoin
+from urllib.parse import quote, urlparse, urljoin
 import re
 
+from actions import ActionError, run_actions, validate_actions
+from blocking import profile_for_url
+from browser_contexts import ContextBrowserPool
+from browser_manager import BrowserManager, BrowserCapacityError
+from browser_pool import DriverPool
+from browser_worker import RemoteBrowserPool
+from crypto_manager import CryptoManager
+from dom_view import PROXY_VIEWS, default_view, dom_view_response, resource_response
+from frame_diff import FrameDiffer, delta_response
+from frames import frame_payload, frame_response, frame_url
+from metrics import metrics
+from nav_jobs import NavigationExecutor, async_navigation_enabled, job_events
+from page_tiles import scroll_to_point, tile_response
+from profile_store import ProfileStore
+from render_cache import RenderCache, may_share_render, render_key
+from screencast import screencast_events, stream_slots
+from serve import add_warmup_hook
+from session_registry import SessionRegistry, SessionRouter
+from viewport import DEFAULT_VIEWPORT, Viewport, parse_viewport
+
 app = Flask(__name__)
+# serve.py gives every worker the same SECRET_KEY; a random one only suits a single process
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 
-# Store browser sessions
-browser_sessions = {}
-
 def get_chrome_options():
     """Configure Chrome options for headless browsing"""
     chrome_options = Options()
@@ -39,42 +56,166 @@ def get_chrome_options():
     return chrome_options
 
 
+# Hide the fact that we're using Selenium
+HIDE_WEBDRIVER_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+
+def launch_driver():
+    """Launch a configured headless Chrome"""
+    driver = webdriver.Chrome(options=get_chrome_options())
+    driver.execute_script(HIDE_WEBDRIVER_SCRIPT)
+    return driver
+
+
+# Warm drivers ready for new sessions
+driver_pool = DriverPool(launch_driver, name='direct')
+
+# Sessions as isolated contexts in a few shared Chromes instead of one Chrome each
+# (BROWSER_CONTEXT_MODE=1, BROWSER_CONTEXT_HOSTS, BROWSER_CONTEXTS_PER_HOST)
+context_pool = None
+if os.environ.get('BROWSER_CONTEXT_MODE') == '1':
+    context_pool = ContextBrowserPool(launch_driver, init_script=HIDE_WEBDRIVER_SCRIPT)
+
+# Sessions on browser_worker.py nodes instead of this host (BROWSER_WORKER_NODES, BROWSER_WORKER_TOKEN)
+remote_pool = None
+if os.environ.get('BROWSER_WORKER_NODES'):
+    remote_pool = RemoteBrowserPool()
+elif context_pool is None:
+    add_warmup_hook(app, driver_pool.start)
+
+
+def acquire_driver(use_proxy=False):
+    """Driver for a new browser session"""
+    if remote_pool is not None:
+        return remote_pool.checkout()
+    if context_pool is not None:
+        return context_pool.checkout()
+    return driver_pool.checkout()
+
+
+# Encrypted cookie/localStorage snapshots of closed sessions (BROWSER_PROFILE_TTL_HOURS)
+profile_store = ProfileStore(CryptoManager())
+
+# Which worker holds each session's browser, when serve.py runs several workers
+session_registry = SessionRegistry.from_env()
+
+# Bounded set of per-user browsers (BROWSER_MAX_SESSIONS, BROWSER_QUEUE_TIMEOUT, ...)
+browser_manager = BrowserManager(acquire_driver, profile_store=profile_store, registry=session_registry)
+add_warmup_hook(app, browser_manager.start)
+
+# Requests for a browser held by another worker are relayed to it
+session_router = SessionRouter(app, session_registry, browser_manager)
+
+# Tile deltas between a client's last frame and the new one
+frame_differ = FrameDiffer()
+
+# Renders shared between anonymous users (BROWSER_RENDER_CACHE_MB, BROWSER_RENDER_CACHE_TTL)
+render_cache = RenderCache()
+
+# Page loads run off the request thread; /proxy streams their progress (BROWSER_NAV_WORKERS)
+navigation_jobs = NavigationExecutor()
+
+# Seconds a result request waits on a navigation job that is still running
+JOB_RESULT_TIMEOUT = 30
+
+
 def get_browser_session(session_id):
-    """Get or create a browser session for the user"""
-    if session_id not in browser_sessions:
-        try:
-            chrome_options = get_chrome_options()
-            driver = webdriver.Chrome(options=chrome_options)
-            # Hide the fact that we're using Selenium
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            browser_sessions[session_id] = {
-                'driver': driver,
-                'last_access': time.time()
-            }
-        except Exception as e:
-            print(f"Error creating browser: {e}")
-            return None
+    """
+    Get or create a browser session for the user
+
+    Raises:
+        BrowserCapacityError: if every browser slot is busy
+    """
+    try:
+        browser = browser_manager.get_or_create(session_id)
+    except BrowserCapacityError:
+        raise
+    except Exception as e:
+        print(f"Error creating browser: {e}")
+        return None
+
+    try:
+        browser.set_viewport(client_viewport())
+    except Exception as e:
+        print(f"Could not resize browser: {e}")
+    return browser
 
-    # Update last access time
-    browser_sessions[session_id]['last_access'] = time.time()
-    return browser_sessions[session_id]['driver']
 
+def client_viewport():
+    """Viewport the client reported to /api/viewport, else the default window"""
+    return Viewport.from_key(session.get('viewport')) or DEFAULT_VIEWPORT
 
-def cleanup_old_sessions():
-    """Remove browser sessions that haven't been used in 10 minutes"""
-    current_time = time.time()
-    sessions_to_remove = []
 
-    for session_id, session_data in browser_sessions.items():
-        if current_time - session_data['last_access'] > 600:  # 10 minutes
-            sessions_to_remove.append(session_id)
+def render_in_browser(browser, target_url, timeout=10, progress=None):
+    """
+    Load a URL in the session's browser and capture it
 
-    for session_id in sessions_to_remove:
+    Args:
+        progress: Optional callback for navigation jobs, called with stage names
+
+    Returns:
+        Tuple of (final URL, frame, page source)
+    """
+    progress = progress or (lambda stage, **data: None)
+    with browser.lock:
+        progress('started')
+        driver = browser.driver
+        browser.blocker().apply(target_url)
+
+        # Navigate to the URL
+        navigate_start = time.perf_counter()
+        driver.get(target_url)
+        progress('dom_ready')
+
+        # Wait for page to load
         try:
-            browser_sessions[session_id]['driver'].quit()
-        except:
-            pass
-        del browser_sessions[session_id]
+            WebDriverWait(driver, timeout).until(
+                lambda d: d.execute_script('return document.readyState') == 'complete'
+            )
+        except TimeoutException:
+            pass  # Continue anyway if timeout
+        progress('load_complete')
+        metrics.observe('browser.navigate_seconds', time.perf_counter() - navigate_start)
+
+        # Get the page source after JavaScript execution
+        page_source = driver.page_source
+
+        # Get the current URL (might have changed due to redirects)
+        current_url = driver.current_url
+
+        # Take a screenshot
+        frame = browser.capture_frame()
+        progress('frame_ready', **frame_payload(frame))
+
+    return current_url, frame, page_source
+
+
+def browsers_busy_page(error, url):
+    """Fast 503 for when no browser can be admitted"""
+    return render_template('error.html',
+                         error=f'All browsers are busy. Please try again in {error.retry_after} seconds.',
+                         url=url), 503, {'Retry-After': str(error.retry_after)}
+
+
+def navigating_page(job, result_url):
+    """Progress page that follows a navigation job, then loads its result"""
+    return render_template('navigating.html',
+                         url=job.url,
+                         events_url=f'/api/jobs/{job.job_id}/events',
+                         result_url=result_url)
+
+
+def job_result_error(job, url):
+    """Error page for a navigation job that failed or is still running, else None"""
+    if not job.wait(JOB_RESULT_TIMEOUT):
+        return render_template('error.html',
+                             error='The page is still loading. Please try again shortly.',
+                             url=url)
+    if job.result is None:
+        return render_template('error.html',
+                             error=f"Browser error: {job.events[-1].get('error')}",
+                             url=url)
+    return None
 
 
 @app.route('/')
@@ -118,38 +259,81 @@ def proxy():
 
     session_id = session['session_id']
 
-    # Cleanup old sessions periodically
-    cleanup_old_sessions()
-
-    try:
-        # Get browser for this session
-        driver = get_browser_session(session_id)
+    # Screenshot or sanitized DOM; an explicit choice sticks for the session
+    view = request.args.get('view')
+    if view in PROXY_VIEWS:
+        session['proxy_view'] = view
+    view = session.get('proxy_view', default_view())
+
+    # Result of a navigation job an earlier request started
+    job = navigation_jobs.get(request.args.get('job', ''), session_id)
+    cached = None
+
+    if not job:
+        # Renders for anonymous sessions can be shared; a browser the user has
+        # clicked or typed in, or one that will get their saved profile back,
+        # may hold their logins
+        existing = browser_manager.get(session_id)
+        profile = existing.blocker().profile_for(target_url) if existing else profile_for_url(target_url)
+        cache_key = render_key(target_url, client_viewport().key, profile)
+        cacheable = (render_cache.enabled and not (existing and existing.interacted)
+                     and not profile_store.has(session_id)
+                     and not request.cache_control.no_cache)
+        cached = render_cache.get(cache_key) if cacheable else None
+
+    if not job and not cached:
+        try:
+            # Get browser for this session
+            browser = get_browser_session(session_id)
+        except BrowserCapacityError as e:
+            return browsers_busy_page(e, target_url)
 
-        if not driver:
+        if not browser:
             return render_template('error.html',
                                  error='Failed to initialize browser. Chrome/Chromium may not be installed.',
                                  url=target_url)
 
-        # Navigate to the URL
-        driver.get(target_url)
+        if async_navigation_enabled():
+            session.pop('cached_render', None)
+            session.pop('cached_frame', None)
 
-        # Wait for page to load (max 10 seconds)
-        try:
-            WebDriverWait(driver, 10).until(
-                lambda d: d.execute_script('return document.readyState') == 'complete'
-            )
-        except TimeoutException:
-            pass  # Continue anyway if timeout
+            def render(progress):
+                with browser.lock:
+                    share = cacheable and may_share_render(browser, target_url)
+                    result = render_in_browser(browser, target_url, progress=progress)
+                if share and not browser.interacted:
+                    render_cache.put(cache_key, *result)
+                return result
 
-        # Get the page source after JavaScript execution
-        page_source = driver.page_source
+            job = navigation_jobs.submit(browser, target_url, render)
+            return navigating_page(job, f'/proxy?job={job.job_id}&url={quote(target_url, safe="")}')
 
-        # Get the current URL (might have changed due to redirects)
-        current_url = driver.current_url
-
-        # Take a screenshot
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+    try:
+        if job:
+            error_page = job_result_error(job, target_url)
+            if error_page:
+                return error_page
+            current_url, frame, page_source = job.result
+        elif cached:
+            current_url, frame, page_source = cached.final_url, cached.frame, cached.page_source
+            # Interactive mode has to load the page in this session's own browser
+            session['cached_render'] = current_url
+            # Only a session that was sent a shared render may fetch its frame
+            session['cached_frame'] = frame.frame_id
+            # The frame is in this worker's cache; route the session's requests here
+            if session_registry is not None:
+                session_registry.claim(session_id)
+        else:
+            with browser.lock:
+                share = cacheable and may_share_render(browser, target_url)
+                current_url, frame, page_source = render_in_browser(browser, target_url)
+            session.pop('cached_render', None)
+            session.pop('cached_frame', None)
+            if share and not browser.interacted:
+                render_cache.put(cache_key, current_url, frame, page_source)
+
+        if view == 'dom':
+            return dom_view_response(page_source, current_url)
 
         # Create an interactive HTML page with screenshot and iframe
         html_content = f'''
@@ -254,6 +438,7 @@ def proxy():
                     </div>
                     <div class="proxy-controls">
                         <a href="/interact?url={current_url}" class="proxy-btn">Interact</a>
+                        <a href="/proxy?view=dom&url={quote(current_url, safe='')}" class="proxy-btn">Text view</a>
                         <a href="/" class="proxy-btn">New URL</a>
                     </div>
                 </div>
@@ -265,7 +450,7 @@ def proxy():
                     Click "Interact" to type, click, and interact with the page.
                 </div>
 
-                <img src="data:image/png;base64,{screenshot_b64}" class="screenshot" alt="Page Screenshot">
+                <img src="{frame_url(frame)}" class="screenshot" alt="Page Screenshot">
 
                 <div class="interaction-form">
                     <h3>Quick Actions</h3>
@@ -291,6 +476,40 @@ def proxy():
                              url=target_url)
 
 
+@app.route('/resource')
+def resource():
+    """Pass an image, stylesheet, font or media file through for the text view"""
+    return resource_response(request.args.get('url', ''), request.headers)
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Get proxy metrics (aggregated across workers under serve.py)"""
+    snapshot = metrics.snapshot()
+    snapshot['browsers'] = browser_manager.stats()
+    snapshot['driver_pools'] = [driver_pool.stats()]
+    if context_pool is not None:
+        snapshot['browser_hosts'] = context_pool.stats()
+    if remote_pool is not None:
+        snapshot['browser_workers'] = remote_pool.stats()
+    snapshot['render_cache'] = render_cache.stats()
+    snapshot['profiles'] = profile_store.stats()
+    snapshot['navigation_jobs'] = navigation_jobs.stats()
+    if session_registry is not None:
+        snapshot['session_registry'] = session_registry.stats()
+    return snapshot
+
+
+@app.route('/api/browsers')
+def api_browsers():
+    """Per-browser RSS, CPU, tabs and renderer processes (this worker only)"""
+    return {
+        'browsers': browser_manager.sampler.snapshot(session.get('session_id')),
+        'limits': browser_manager.sampler.limits(),
+        'capacity': browser_manager.stats()
+    }
+
+
 @app.route('/interact')
 def interact():
     """Interactive mode for complex sites"""
@@ -299,63 +518,268 @@ def interact():
     if not target_url:
         return redirect('/')
 
+    if 'session_id' not in session:
+        session['session_id'] = secrets.token_hex(16)
+
+    # Pages served from the render cache were never loaded in this user's browser
+    browser = browser_manager.get(session['session_id'])
+    if browser is None or session.get('cached_render') == target_url:
+        try:
+            browser = get_browser_session(session['session_id'])
+        except BrowserCapacityError as e:
+            return browsers_busy_page(e, target_url)
+        if not browser:
+            return render_template('error.html',
+                                 error='Failed to initialize browser. Chrome/Chromium may not be installed.',
+                                 url=target_url)
+        try:
+            render_in_browser(browser, target_url)
+        except Exception as e:
+            return render_template('error.html', error=str(e), url=target_url)
+        session.pop('cached_render', None)
+        session.pop('cached_frame', None)
+
     return render_template('interact.html', url=target_url)
 
 
+@app.route('/api/viewport', methods=['POST'])
+def api_viewport():
+    """Size the session's browser to the client's viewport and pixel ratio"""
+    try:
+        viewport = parse_viewport(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    session['viewport'] = viewport.key
+    browser = browser_manager.get(session['session_id']) if 'session_id' in session else None
+    if browser is not None:
+        try:
+            browser.set_viewport(viewport)
+        except Exception as e:
+            return {'error': str(e)}, 500
+    return {'viewport': viewport.to_dict()}
+
+
 @app.route('/api/screenshot')
 def api_screenshot():
     """Get current screenshot"""
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    browser = browser_manager.get(session['session_id'])
 
-    if not driver:
+    if not browser:
         return {'error': 'No browser session'}, 400
 
     try:
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
-        current_url = driver.current_url
+        with browser.lock:
+            frame = browser.capture_frame(request.args.get('format'))
 
-        return {
-            'screenshot': screenshot_b64,
-            'url': current_url
-        }
+            return frame_payload(frame, request.args.get('since', type=int))
     except Exception as e:
         return {'error': str(e)}, 500
 
 
-@app.route('/api/click', methods=['POST'])
-def api_click():
-    """Click at coordinates"""
+@app.route('/api/frame')
+@app.route('/api/frame/<int:frame_id>')
+def api_frame(frame_id=None):
+    """Serve a captured frame as a binary image (the latest one if no id)"""
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    if frame_id is not None and frame_id == session.get('cached_frame'):
+        cached_frame = render_cache.frame(frame_id)
+        if cached_frame is not None:
+            return frame_response(cached_frame)
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    frame = browser.frames.get(frame_id)
+    if frame is None:
+        if frame_id is not None:
+            return {'error': 'Frame expired'}, 404
+        try:
+            with browser.lock:
+                frame = browser.capture_frame(request.args.get('format'))
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+    if frame_id is not None:
+        browser.acknowledge_frame(frame_id)
+    return frame_response(frame, immutable=frame_id is not None)
+
+
+@app.route('/api/tiles')
+def api_tiles():
+    """Describe the full-page tile pyramid of the current page state"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    try:
+        with browser.lock:
+            return browser.page_tiles().manifest()
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@app.route('/api/tiles/<state>/<int:level>/<int:x>/<int:y>')
+def api_tile(state, level, x, y):
+    """Serve one full-page tile, rendering it on first request"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    try:
+        with browser.lock:
+            tile = browser.page_tiles().tile(state, level, x, y)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    if tile is None:
+        # The page changed; the client fetches a new manifest
+        return {'error': 'Page changed'}, 410
+    return tile_response(*tile)
+
+
+@app.route('/api/frame/<int:frame_id>/delta/<int:since>')
+def api_frame_delta(frame_id, since):
+    """Serve only the tiles that changed between two frames"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    frame = browser.frames.get(frame_id)
+    if frame is None:
+        return {'error': 'Frame expired'}, 404
+
+    browser.acknowledge_frame(frame_id)
+    return delta_response(frame_differ, frame, browser.frames.get(since))
+
 
-    if not driver:
+@app.route('/api/screencast')
+def api_screencast():
+    """Announce new frames as the page repaints (server-sent events)"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
         return {'error': 'No browser session'}, 400
 
+    # Each stream holds a request thread; past the limit clients poll instead
+    if not stream_slots.acquire():
+        return {'error': 'Too many live streams'}, 503
+
+    screencast = browser.screencast()
     try:
-        data = request.get_json()
-        x = data.get('x', 0)
-        y = data.get('y', 0)
+        subscriber = screencast.subscribe()
+    except Exception as e:
+        stream_slots.release()
+        return {'error': f'Screencast unavailable: {e}'}, 501
 
-        # Execute JavaScript to click at coordinates
-        driver.execute_script(f'''
-            var element = document.elementFromPoint({x}, {y});
-            if (element) element.click();
-        ''')
+    response = Response(screencast_events(screencast, subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(stream_slots.release)
+    return response
 
-        time.sleep(1)  # Wait for any page changes
 
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Progress of a navigation job"""
+    job = navigation_jobs.get(job_id, session.get('session_id'))
+    if not job:
+        return {'error': 'Job not found'}, 404
+    return job.status()
+
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """Stream a navigation job's progress (server-sent events)"""
+    job = navigation_jobs.get(job_id, session.get('session_id'))
+    if not job:
+        return {'error': 'Job not found'}, 404
+    return Response(job_events(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/blocking', methods=['GET', 'POST'])
+def api_blocking():
+    """Get or choose this session's resource blocking profile"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
 
-        return {'screenshot': screenshot_b64, 'url': driver.current_url}
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    blocker = browser.blocker()
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            blocker.select(data.get('profile'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+    return blocker.stats()
+
+
+@app.route('/api/click', methods=['POST'])
+def api_click():
+    """Click at coordinates"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    try:
+        with browser.lock:
+            driver = browser.driver
+            data = request.get_json()
+            x = data.get('x', 0)
+            y = data.get('y', 0)
+            # The full-page view sends page coordinates
+            if data.get('page'):
+                x, y = scroll_to_point(driver, x, y)
+
+            browser.interacted = True
+            settle = browser.settle_detector()
+            settle.mark()
+
+            # Execute JavaScript to click at coordinates
+            driver.execute_script(f'''
+                var element = document.elementFromPoint({x}, {y});
+                if (element) element.click();
+            ''')
+
+            # Wait for requests and DOM changes the click started to finish
+            settle_seconds, settled = settle.wait()
+
+            frame = browser.capture_frame()
+
+            payload = frame_payload(frame, data.get('since'))
+            payload.update(settle_ms=round(settle_seconds * 1000), settled=settled)
+            return payload
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -366,25 +790,69 @@ def api_type():
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    browser = browser_manager.get(session['session_id'])
 
-    if not driver:
+    if not browser:
         return {'error': 'No browser session'}, 400
 
     try:
-        data = request.get_json()
-        text = data.get('text', '')
+        with browser.lock:
+            driver = browser.driver
+            data = request.get_json()
+            text = data.get('text', '')
+
+            browser.interacted = True
+            settle = browser.settle_detector()
+            settle.mark()
+
+            # Find the active element and type into it
+            driver.switch_to.active_element.send_keys(text)
+
+            settle_seconds, settled = settle.wait()
 
-        # Find the active element and type into it
-        driver.switch_to.active_element.send_keys(text)
+            frame = browser.capture_frame()
 
-        time.sleep(0.5)
+            payload = frame_payload(frame, data.get('since'))
+            payload.update(settle_ms=round(settle_seconds * 1000), settled=settled)
+            return payload
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@app.route('/api/actions', methods=['POST'])
+def api_actions():
+    """Run a list of actions in one pass and return a single frame"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
 
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+    browser = browser_manager.get(session['session_id'])
 
-        return {'screenshot': screenshot_b64, 'url': driver.current_url}
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    data = request.get_json(silent=True) or {}
+    try:
+        actions = validate_actions(data.get('actions'))
+    except ActionError as e:
+        return {'error': str(e), 'failed_index': e.index}, 400
+
+    try:
+        with browser.lock:
+            browser.interacted = True
+            failure = None
+            try:
+                results = run_actions(browser, actions)
+            except ActionError as e:
+                failure, results = e, e.results
+
+            frame = browser.capture_frame()
+
+            payload = frame_payload(frame, data.get('since'))
+            payload['actions'] = results
+            if failure is not None:
+                payload.update(error=str(failure), failed_index=failure.index)
+                return payload, 422
+            return payload
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -8,10 +8,9 @@ from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.proxy import Proxy, ProxyType
 import secrets
-import base64
 import time
 import os
-from urllib.parse import urlparse, urljoin, quote_plus
+from urllib.parse import quote, urlparse, urljoin, quote_plus
 from pathlib import Path
 import json
 
@@ -19,8 +18,27 @@ import json
 from network_checker import NetworkChecker
 from crypto_manager import CryptoManager, ProxyConfig, GoogleTokenManager
 from google_integration import GoogleDriveManager
+from actions import ActionError, run_actions, validate_actions
+from blocking import profile_for_url
+from browser_contexts import ContextBrowserPool
+from browser_manager import BrowserManager, BrowserCapacityError
+from browser_pool import DriverPool
+from browser_worker import RemoteBrowserPool
+from dom_view import PROXY_VIEWS, default_view, dom_view_response, resource_response
+from frame_diff import FrameDiffer, delta_response
+from frames import frame_payload, frame_response, frame_url
+from metrics import metrics
+from nav_jobs import NavigationExecutor, async_navigation_enabled, job_events
+from page_tiles import scroll_to_point, tile_response
+from profile_store import ProfileStore
+from render_cache import RenderCache, may_share_render, render_key
+from screencast import screencast_events, stream_slots
+from serve import add_warmup_hook
+from session_registry import SessionRegistry, SessionRouter
+from viewport import DEFAULT_VIEWPORT, Viewport, parse_viewport
 
 app = Flask(__name__)
+# serve.py gives every worker the same SECRET_KEY; a random one only suits a single process
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 
 # Initialize managers
@@ -29,9 +47,6 @@ proxy_manager = ProxyConfig(crypto_manager)
 token_manager = GoogleTokenManager(crypto_manager)
 google_manager = GoogleDriveManager(crypto_manager=crypto_manager)
 
-# Store browser sessions
-browser_sessions = {}
-
 # Upload directory
 UPLOAD_DIR = Path('uploads')
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -74,40 +89,168 @@ def get_chrome_options(use_proxy=False):
     return chrome_options
 
 
+# Hide the fact that we're using Selenium
+HIDE_WEBDRIVER_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+
+def launch_driver(use_proxy=False):
+    """Launch a configured headless Chrome"""
+    driver = webdriver.Chrome(options=get_chrome_options(use_proxy=use_proxy))
+    driver.execute_script(HIDE_WEBDRIVER_SCRIPT)
+    return driver
+
+
+# Warm drivers for new sessions, kept separately for direct and proxy-routed browsing
+driver_pools = {
+    False: DriverPool(lambda: launch_driver(use_proxy=False), name='direct'),
+    True: DriverPool(lambda: launch_driver(use_proxy=True), name='proxy',
+                     should_fill=lambda: proxy_manager.get_proxy() is not None),
+}
+
+# Direct sessions as isolated contexts in a few shared Chromes instead of one Chrome
+# each (BROWSER_CONTEXT_MODE=1, BROWSER_CONTEXT_HOSTS, BROWSER_CONTEXTS_PER_HOST).
+# The upstream proxy is a Chrome-wide flag, so proxied sessions keep their own Chrome.
+context_pool = None
+if os.environ.get('BROWSER_CONTEXT_MODE') == '1':
+    context_pool = ContextBrowserPool(lambda: launch_driver(use_proxy=False),
+                                      init_script=HIDE_WEBDRIVER_SCRIPT)
+
+# Direct sessions on browser_worker.py nodes instead of this host (BROWSER_WORKER_NODES,
+# BROWSER_WORKER_TOKEN); proxied sessions stay local, as nodes don't know the upstream proxy
+remote_pool = None
+if os.environ.get('BROWSER_WORKER_NODES'):
+    remote_pool = RemoteBrowserPool()
+
+for _use_proxy, _pool in driver_pools.items():
+    if _use_proxy or (context_pool is None and remote_pool is None):
+        add_warmup_hook(app, _pool.start)
+
+
+def acquire_driver(use_proxy=False):
+    """Driver for a new browser session"""
+    if remote_pool is not None and not use_proxy:
+        return remote_pool.checkout()
+    if context_pool is not None and not use_proxy:
+        return context_pool.checkout()
+    return driver_pools[use_proxy].checkout()
+
+
+# Encrypted cookie/localStorage snapshots of closed sessions (BROWSER_PROFILE_TTL_HOURS)
+profile_store = ProfileStore(crypto_manager)
+
+# Which worker holds each session's browser, when serve.py runs several workers
+session_registry = SessionRegistry.from_env()
+
+# Bounded set of per-user browsers (BROWSER_MAX_SESSIONS, BROWSER_QUEUE_TIMEOUT, ...)
+browser_manager = BrowserManager(acquire_driver, profile_store=profile_store, registry=session_registry)
+add_warmup_hook(app, browser_manager.start)
+
+# Requests for a browser held by another worker are relayed to it
+session_router = SessionRouter(app, session_registry, browser_manager)
+
+# Tile deltas between a client's last frame and the new one
+frame_differ = FrameDiffer()
+
+# Renders shared between anonymous users (BROWSER_RENDER_CACHE_MB, BROWSER_RENDER_CACHE_TTL)
+render_cache = RenderCache()
+
+# Page loads run off the request thread; /proxy streams their progress (BROWSER_NAV_WORKERS)
+navigation_jobs = NavigationExecutor()
+
+# Seconds a result request waits on a navigation job that is still running
+JOB_RESULT_TIMEOUT = 30
+
+
 def get_browser_session(session_id, use_proxy=False):
-    """Get or create a browser session for the user"""
-    if session_id not in browser_sessions:
-        try:
-            chrome_options = get_chrome_options(use_proxy=use_proxy)
-            driver = webdriver.Chrome(options=chrome_options)
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            browser_sessions[session_id] = {
-                'driver': driver,
-                'last_access': time.time()
-            }
-        except Exception as e:
-            print(f"Error creating browser: {e}")
-            return None
+    """
+    Get or create a browser session for the user
 
-    browser_sessions[session_id]['last_access'] = time.time()
-    return browser_sessions[session_id]['driver']
+    Raises:
+        BrowserCapacityError: if every browser slot is busy
+    """
+    try:
+        browser = browser_manager.get_or_create(session_id, use_proxy=use_proxy)
+    except BrowserCapacityError:
+        raise
+    except Exception as e:
+        print(f"Error creating browser: {e}")
+        return None
+
+    try:
+        browser.set_viewport(client_viewport())
+    except Exception as e:
+        print(f"Could not resize browser: {e}")
+    return browser
+
+
+def client_viewport():
+    """Viewport the client reported to /api/viewport, else the default window"""
+    return Viewport.from_key(session.get('viewport')) or DEFAULT_VIEWPORT
 
 
-def cleanup_old_sessions():
-    """Remove browser sessions that haven't been used in 10 minutes"""
-    current_time = time.time()
-    sessions_to_remove = []
+def render_in_browser(browser, target_url, timeout=10, progress=None):
+    """
+    Load a URL in the session's browser and capture it
 
-    for session_id, session_data in browser_sessions.items():
-        if current_time - session_data['last_access'] > 600:
-            sessions_to_remove.append(session_id)
+    Args:
+        progress: Optional callback for navigation jobs, called with stage names
+
+    Returns:
+        Tuple of (final URL, frame, page source)
+    """
+    progress = progress or (lambda stage, **data: None)
+    with browser.lock:
+        progress('started')
+        driver = browser.driver
+        browser.blocker().apply(target_url)
+        navigate_start = time.perf_counter()
+        driver.get(target_url)
+        progress('dom_ready')
 
-    for session_id in sessions_to_remove:
         try:
-            browser_sessions[session_id]['driver'].quit()
-        except:
+            from selenium.webdriver.support.ui import WebDriverWait
+            WebDriverWait(driver, timeout).until(
+                lambda d: d.execute_script('return document.readyState') == 'complete'
+            )
+        except Exception:
             pass
-        del browser_sessions[session_id]
+        progress('load_complete')
+        metrics.observe('browser.navigate_seconds', time.perf_counter() - navigate_start)
+
+        page_source = driver.page_source
+        current_url = driver.current_url
+        frame = browser.capture_frame()
+        progress('frame_ready', **frame_payload(frame))
+
+    return current_url, frame, page_source
+
+
+def browsers_busy_page(error, url):
+    """Fast 503 for when no browser can be admitted"""
+    return render_template('error.html',
+                         error=f'All browsers are busy. Please try again in {error.retry_after} seconds.',
+                         url=url), 503, {'Retry-After': str(error.retry_after)}
+
+
+def navigating_page(job, result_url):
+    """Progress page that follows a navigation job, then loads its result"""
+    return render_template('navigating.html',
+                         url=job.url,
+                         events_url=f'/api/jobs/{job.job_id}/events',
+                         result_url=result_url)
+
+
+def job_result_error(job, url):
+    """Error page for a navigation job that failed or is still running, else None"""
+    if not job.wait(JOB_RESULT_TIMEOUT):
+        return render_template('error.html',
+                             error='The page is still loading. Please try again shortly.',
+                             url=url)
+    if job.result is None:
+        return render_template('error.html',
+                             error=f"Browser error: {job.events[-1].get('error')}",
+                             url=url)
+    return None
 
 
 @app.route('/')
@@ -152,6 +295,8 @@ def save_proxy():
         return jsonify({'error': 'Host is required'}), 400
 
     proxy_manager.save_proxy(proxy_type, host, port, username, password)
+    # Warm proxy-routed drivers were launched with the old settings
+    driver_pools[True].drain()
     return jsonify({'success': True, 'message': 'Proxy configuration saved'})
 
 
@@ -159,6 +304,7 @@ def save_proxy():
 def delete_proxy():
     """Delete proxy configuration"""
     proxy_manager.delete_proxy()
+    driver_pools[True].drain()
     return jsonify({'success': True, 'message': 'Proxy configuration deleted'})
 
 
@@ -223,41 +369,50 @@ def google_direct():
     if not google_manager.is_authenticated():
         return redirect('/google-login')
 
-    # Get the target URL from session or default to Drive
-    target_url = session.pop('return_to_url', 'https://drive.google.com')
-
     if 'session_id' not in session:
         session['session_id'] = secrets.token_hex(16)
 
     session_id = session['session_id']
-    cleanup_old_sessions()
 
-    # Use proxy if configured
-    use_proxy = proxy_manager.get_proxy() is not None
+    # Result of the navigation job an earlier request started
+    job = navigation_jobs.get(request.args.get('job', ''), session_id)
 
-    try:
-        driver = get_browser_session(session_id, use_proxy=use_proxy)
+    # Get the target URL from session or default to Drive
+    target_url = job.url if job else session.pop('return_to_url', 'https://drive.google.com')
+
+    if not job:
+        # Use proxy if configured
+        use_proxy = proxy_manager.get_proxy() is not None
+
+        try:
+            browser = get_browser_session(session_id, use_proxy=use_proxy)
+        except BrowserCapacityError as e:
+            return browsers_busy_page(e, target_url)
 
-        if not driver:
+        if not browser:
             return render_template('error.html',
                                  error='Failed to initialize browser.',
                                  url=target_url)
 
-        # Navigate to Google OAuth to get cookies
-        # This ensures the browser session is authenticated
-        driver.get(target_url)
+        # Never share renders of a signed-in browser
+        browser.interacted = True
 
-        try:
-            from selenium.webdriver.support.ui import WebDriverWait
-            WebDriverWait(driver, 15).until(
-                lambda d: d.execute_script('return document.readyState') == 'complete'
-            )
-        except:
-            pass
+        if async_navigation_enabled():
+            job = navigation_jobs.submit(
+                browser, target_url,
+                lambda progress: render_in_browser(browser, target_url, timeout=15, progress=progress))
+            return navigating_page(job, f'/google-direct?job={job.job_id}')
 
-        current_url = driver.current_url
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+    try:
+        if job:
+            error_page = job_result_error(job, target_url)
+            if error_page:
+                return error_page
+            current_url, frame, _ = job.result
+        else:
+            # Navigate to Google OAuth to get cookies
+            # This ensures the browser session is authenticated
+            current_url, frame, _ = render_in_browser(browser, target_url, timeout=15)
 
         html_content = f'''
         <!DOCTYPE html>
@@ -315,7 +470,7 @@ def google_direct():
                     <strong>✓ Authenticated Access:</strong> You're viewing this Google service with your authenticated account.
                     Use "Interact" mode to click, type, and navigate. For file operations, use the Drive Browser.
                 </div>
-                <img src="data:image/png;base64,{screenshot_b64}" class="screenshot" alt="Page Screenshot">
+                <img src="{frame_url(frame)}" class="screenshot" alt="Page Screenshot">
             </div>
         </body>
         </html>
@@ -445,32 +600,85 @@ def proxy():
         session['session_id'] = secrets.token_hex(16)
 
     session_id = session['session_id']
-    cleanup_old_sessions()
+
+    # Screenshot or sanitized DOM; an explicit choice sticks for the session
+    view = request.args.get('view')
+    if view in PROXY_VIEWS:
+        session['proxy_view'] = view
+    view = session.get('proxy_view', default_view())
 
     # Determine if proxy should be used
     use_proxy = proxy_manager.get_proxy() is not None
 
-    try:
-        driver = get_browser_session(session_id, use_proxy=use_proxy)
+    # Result of a navigation job an earlier request started
+    job = navigation_jobs.get(request.args.get('job', ''), session_id)
+    cached = None
+
+    if not job:
+        # Renders for anonymous sessions can be shared; a browser the user has
+        # clicked or typed in, signed in to Google with, or that will get their
+        # saved profile back may hold their logins
+        existing = browser_manager.get(session_id)
+        profile = existing.blocker().profile_for(target_url) if existing else profile_for_url(target_url)
+        cache_key = render_key(target_url, client_viewport().key, profile, 'proxy' if use_proxy else 'direct')
+        cacheable = (render_cache.enabled and not google_manager.is_authenticated()
+                     and not (existing and existing.interacted)
+                     and not profile_store.has(session_id)
+                     and not request.cache_control.no_cache)
+        cached = render_cache.get(cache_key) if cacheable else None
+
+    if not job and not cached:
+        try:
+            browser = get_browser_session(session_id, use_proxy=use_proxy)
+        except BrowserCapacityError as e:
+            return browsers_busy_page(e, target_url)
 
-        if not driver:
+        if not browser:
             return render_template('error.html',
                                  error='Failed to initialize browser. Chrome/Chromium may not be installed.',
                                  url=target_url)
 
-        driver.get(target_url)
+        if async_navigation_enabled():
+            session.pop('cached_render', None)
+            session.pop('cached_frame', None)
 
-        try:
-            from selenium.webdriver.support.ui import WebDriverWait
-            WebDriverWait(driver, 10).until(
-                lambda d: d.execute_script('return document.readyState') == 'complete'
-            )
-        except:
-            pass
+            def render(progress):
+                with browser.lock:
+                    share = cacheable and may_share_render(browser, target_url)
+                    result = render_in_browser(browser, target_url, progress=progress)
+                if share and not browser.interacted:
+                    render_cache.put(cache_key, *result)
+                return result
 
-        current_url = driver.current_url
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+            job = navigation_jobs.submit(browser, target_url, render)
+            return navigating_page(job, f'/proxy?job={job.job_id}&url={quote(target_url, safe="")}')
+
+    try:
+        if job:
+            error_page = job_result_error(job, target_url)
+            if error_page:
+                return error_page
+            current_url, frame, page_source = job.result
+        elif cached:
+            current_url, frame, page_source = cached.final_url, cached.frame, cached.page_source
+            # Interactive mode has to load the page in this session's own browser
+            session['cached_render'] = current_url
+            # Only a session that was sent a shared render may fetch its frame
+            session['cached_frame'] = frame.frame_id
+            # The frame is in this worker's cache; route the session's requests here
+            if session_registry is not None:
+                session_registry.claim(session_id)
+        else:
+            with browser.lock:
+                share = cacheable and may_share_render(browser, target_url)
+                current_url, frame, page_source = render_in_browser(browser, target_url)
+            session.pop('cached_render', None)
+            session.pop('cached_frame', None)
+            if share and not browser.interacted:
+                render_cache.put(cache_key, current_url, frame, page_source)
+
+        if view == 'dom':
+            return dom_view_response(page_source, current_url)
 
         html_content = f'''
         <!DOCTYPE html>
@@ -518,6 +726,7 @@ def proxy():
                     </div>
                     <div class="proxy-controls">
                         <a href="/interact?url={current_url}" class="proxy-btn">Interact</a>
+                        <a href="/proxy?view=dom&url={quote(current_url, safe='')}" class="proxy-btn">Text view</a>
                         <a href="/" class="proxy-btn">Dashboard</a>
                     </div>
                 </div>
@@ -527,7 +736,7 @@ def proxy():
                     <strong>📸 Live Screenshot:</strong> Page rendered with full JavaScript support.
                     Click "Interact" to type, click, and interact with the page.
                 </div>
-                <img src="data:image/png;base64,{screenshot_b64}" class="screenshot" alt="Page Screenshot">
+                <img src="{frame_url(frame)}" class="screenshot" alt="Page Screenshot">
             </div>
         </body>
         </html>
@@ -539,65 +748,309 @@ def proxy():
         return render_template('error.html', error=str(e), url=target_url)
 
 
+@app.route('/resource')
+def resource():
+    """Pass an image, stylesheet, font or media file through for the text view"""
+    # Same route to the origin as the browser that rendered the page
+    return resource_response(request.args.get('url', ''), request.headers, proxies=proxy_manager.get_proxy_dict())
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Get proxy metrics (aggregated across workers under serve.py)"""
+    snapshot = metrics.snapshot()
+    snapshot['browsers'] = browser_manager.stats()
+    snapshot['driver_pools'] = [pool.stats() for pool in driver_pools.values()]
+    if context_pool is not None:
+        snapshot['browser_hosts'] = context_pool.stats()
+    if remote_pool is not None:
+        snapshot['browser_workers'] = remote_pool.stats()
+    snapshot['render_cache'] = render_cache.stats()
+    snapshot['profiles'] = profile_store.stats()
+    snapshot['navigation_jobs'] = navigation_jobs.stats()
+    if session_registry is not None:
+        snapshot['session_registry'] = session_registry.stats()
+    return snapshot
+
+
+@app.route('/api/browsers')
+def api_browsers():
+    """Per-browser RSS, CPU, tabs and renderer processes (this worker only)"""
+    return {
+        'browsers': browser_manager.sampler.snapshot(session.get('session_id')),
+        'limits': browser_manager.sampler.limits(),
+        'capacity': browser_manager.stats()
+    }
+
+
 @app.route('/interact')
 def interact():
     """Interactive mode for complex sites"""
     target_url = request.args.get('url', '')
     if not target_url:
         return redirect('/')
+
+    if 'session_id' not in session:
+        session['session_id'] = secrets.token_hex(16)
+
+    # Pages served from the render cache were never loaded in this user's browser
+    browser = browser_manager.get(session['session_id'])
+    if browser is None or session.get('cached_render') == target_url:
+        use_proxy = proxy_manager.get_proxy() is not None
+        try:
+            browser = get_browser_session(session['session_id'], use_proxy=use_proxy)
+        except BrowserCapacityError as e:
+            return browsers_busy_page(e, target_url)
+        if not browser:
+            return render_template('error.html',
+                                 error='Failed to initialize browser. Chrome/Chromium may not be installed.',
+                                 url=target_url)
+        try:
+            render_in_browser(browser, target_url)
+        except Exception as e:
+            return render_template('error.html', error=str(e), url=target_url)
+        session.pop('cached_render', None)
+        session.pop('cached_frame', None)
+
     return render_template('interact.html', url=target_url)
 
 
+@app.route('/api/viewport', methods=['POST'])
+def api_viewport():
+    """Size the session's browser to the client's viewport and pixel ratio"""
+    try:
+        viewport = parse_viewport(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    session['viewport'] = viewport.key
+    browser = browser_manager.get(session['session_id']) if 'session_id' in session else None
+    if browser is not None:
+        try:
+            browser.set_viewport(viewport)
+        except Exception as e:
+            return {'error': str(e)}, 500
+    return {'viewport': viewport.to_dict()}
+
+
 @app.route('/api/screenshot')
 def api_screenshot():
     """Get current screenshot"""
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    browser = browser_manager.get(session['session_id'])
 
-    if not driver:
+    if not browser:
         return {'error': 'No browser session'}, 400
 
     try:
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
-        current_url = driver.current_url
+        with browser.lock:
+            frame = browser.capture_frame(request.args.get('format'))
 
-        return {'screenshot': screenshot_b64, 'url': current_url}
+            return frame_payload(frame, request.args.get('since', type=int))
     except Exception as e:
         return {'error': str(e)}, 500
 
 
-@app.route('/api/click', methods=['POST'])
-def api_click():
-    """Click at coordinates"""
+@app.route('/api/frame')
+@app.route('/api/frame/<int:frame_id>')
+def api_frame(frame_id=None):
+    """Serve a captured frame as a binary image (the latest one if no id)"""
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    if frame_id is not None and frame_id == session.get('cached_frame'):
+        cached_frame = render_cache.frame(frame_id)
+        if cached_frame is not None:
+            return frame_response(cached_frame)
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    frame = browser.frames.get(frame_id)
+    if frame is None:
+        if frame_id is not None:
+            return {'error': 'Frame expired'}, 404
+        try:
+            with browser.lock:
+                frame = browser.capture_frame(request.args.get('format'))
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+    if frame_id is not None:
+        browser.acknowledge_frame(frame_id)
+    return frame_response(frame, immutable=frame_id is not None)
+
+
+@app.route('/api/tiles')
+def api_tiles():
+    """Describe the full-page tile pyramid of the current page state"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
 
-    if not driver:
+    if not browser:
         return {'error': 'No browser session'}, 400
 
     try:
-        data = request.get_json()
-        x = data.get('x', 0)
-        y = data.get('y', 0)
+        with browser.lock:
+            return browser.page_tiles().manifest()
+    except Exception as e:
+        return {'error': str(e)}, 500
 
-        driver.execute_script(f'''
-            var element = document.elementFromPoint({x}, {y});
-            if (element) element.click();
-        ''')
 
-        time.sleep(1)
+@app.route('/api/tiles/<state>/<int:level>/<int:x>/<int:y>')
+def api_tile(state, level, x, y):
+    """Serve one full-page tile, rendering it on first request"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
 
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+    browser = browser_manager.get(session['session_id'])
 
-        return {'screenshot': screenshot_b64, 'url': driver.current_url}
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    try:
+        with browser.lock:
+            tile = browser.page_tiles().tile(state, level, x, y)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    if tile is None:
+        # The page changed; the client fetches a new manifest
+        return {'error': 'Page changed'}, 410
+    return tile_response(*tile)
+
+
+@app.route('/api/frame/<int:frame_id>/delta/<int:since>')
+def api_frame_delta(frame_id, since):
+    """Serve only the tiles that changed between two frames"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    frame = browser.frames.get(frame_id)
+    if frame is None:
+        return {'error': 'Frame expired'}, 404
+
+    browser.acknowledge_frame(frame_id)
+    return delta_response(frame_differ, frame, browser.frames.get(since))
+
+
+@app.route('/api/screencast')
+def api_screencast():
+    """Announce new frames as the page repaints (server-sent events)"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    # Each stream holds a request thread; past the limit clients poll instead
+    if not stream_slots.acquire():
+        return {'error': 'Too many live streams'}, 503
+
+    screencast = browser.screencast()
+    try:
+        subscriber = screencast.subscribe()
+    except Exception as e:
+        stream_slots.release()
+        return {'error': f'Screencast unavailable: {e}'}, 501
+
+    response = Response(screencast_events(screencast, subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Progress of a navigation job"""
+    job = navigation_jobs.get(job_id, session.get('session_id'))
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.status())
+
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """Stream a navigation job's progress (server-sent events)"""
+    job = navigation_jobs.get(job_id, session.get('session_id'))
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(job_events(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/blocking', methods=['GET', 'POST'])
+def api_blocking():
+    """Get or choose this session's resource blocking profile"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    blocker = browser.blocker()
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            blocker.select(data.get('profile'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+    return blocker.stats()
+
+
+@app.route('/api/click', methods=['POST'])
+def api_click():
+    """Click at coordinates"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    try:
+        with browser.lock:
+            driver = browser.driver
+            data = request.get_json()
+            x = data.get('x', 0)
+            y = data.get('y', 0)
+            # The full-page view sends page coordinates
+            if data.get('page'):
+                x, y = scroll_to_point(driver, x, y)
+
+            browser.interacted = True
+            settle = browser.settle_detector()
+            settle.mark()
+
+            driver.execute_script(f'''
+                var element = document.elementFromPoint({x}, {y});
+                if (element) element.click();
+            ''')
+
+            settle_seconds, settled = settle.wait()
+
+            frame = browser.capture_frame()
+
+            payload = frame_payload(frame, data.get('since'))
+            payload.update(settle_ms=round(settle_seconds * 1000), settled=settled)
+            return payload
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -608,23 +1061,67 @@ def api_type():
     if 'session_id' not in session:
         return {'error': 'No session'}, 400
 
-    session_id = session['session_id']
-    driver = browser_sessions.get(session_id, {}).get('driver')
+    browser = browser_manager.get(session['session_id'])
 
-    if not driver:
+    if not browser:
         return {'error': 'No browser session'}, 400
 
     try:
-        data = request.get_json()
-        text = data.get('text', '')
+        with browser.lock:
+            driver = browser.driver
+            data = request.get_json()
+            text = data.get('text', '')
 
-        driver.switch_to.active_element.send_keys(text)
-        time.sleep(0.5)
+            browser.interacted = True
+            settle = browser.settle_detector()
+            settle.mark()
 
-        screenshot = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+            driver.switch_to.active_element.send_keys(text)
+            settle_seconds, settled = settle.wait()
 
-        return {'screenshot': screenshot_b64, 'url': driver.current_url}
+            frame = browser.capture_frame()
+
+            payload = frame_payload(frame, data.get('since'))
+            payload.update(settle_ms=round(settle_seconds * 1000), settled=settled)
+            return payload
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@app.route('/api/actions', methods=['POST'])
+def api_actions():
+    """Run a list of actions in one pass and return a single frame"""
+    if 'session_id' not in session:
+        return {'error': 'No session'}, 400
+
+    browser = browser_manager.get(session['session_id'])
+
+    if not browser:
+        return {'error': 'No browser session'}, 400
+
+    data = request.get_json(silent=True) or {}
+    try:
+        actions = validate_actions(data.get('actions'))
+    except ActionError as e:
+        return {'error': str(e), 'failed_index': e.index}, 400
+
+    try:
+        with browser.lock:
+            browser.interacted = True
+            failure = None
+            try:
+                results = run_actions(browser, actions)
+            except ActionError as e:
+                failure, results = e, e.results
+
+            frame = browser.capture_frame()
+
+            payload = frame_payload(frame, data.get('since'))
+            payload['actions'] = results
+            if failure is not None:
+                payload.update(error=str(failure), failed_index=failure.index)
+                return payload, 422
+            return payload
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -0,0 +1,313 @@
+"""
+Headless Browser Benchmarks
+Repeatable microbenchmarks of the Selenium path against the bundled static
+site in benchmarks/site, written as JSON so Chrome flag sets and releases can
+be compared
+
+Usage:
+    python benchmarks/bench_browser.py --output before.json
+    python benchmarks/bench_browser.py --add-arg=--disable-extensions --baseline before.json
+
+Measures driver cold start against warm pool checkout, driver.get to
+readyState complete, screenshot capture per format, click-to-frame latency
+(click, settle, capture, as /api/click does) and sessions per GB of Chrome
+RSS, both for a Chrome per session and for browser contexts.
+"""
+
+import argparse
+import functools
+import http.server
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site')
+sys.path.insert(0, ROOT)
+
+# Keep the imported app from warming drivers of its own
+os.environ.setdefault('BROWSER_POOL_SIZE', '0')
+
+from selenium import webdriver  # noqa: E402
+from selenium.webdriver.support.ui import WebDriverWait  # noqa: E402
+
+from browser_contexts import ContextBrowserPool  # noqa: E402
+from browser_manager import BrowserSession  # noqa: E402
+from browser_pool import DriverPool  # noqa: E402
+from frames import capture_image  # noqa: E402
+from process_stats import driver_pid, process_tree_rss  # noqa: E402
+
+PAGES = ('index.html', 'long.html', 'click.html')
+FORMATS = ('png', 'jpeg', 'webp')
+
+# Default relative slowdown of a median (or drop in sessions per GB) reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Timing summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'median_ms': round(statistics.median(ordered) * 1000, 2),
+        'p90_ms': round(ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)] * 1000, 2),
+        'min_ms': round(ordered[0] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2)
+    }
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def serve_site() -> str:
+    """Serve the static site on a free local port; returns its base URL"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(QuietHandler, directory=SITE_DIR)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}/'
+
+
+class Launcher:
+    """Starts Chrome with an app's get_chrome_options, adjusted by the command line"""
+
+    def __init__(self, app_module: str, add_args: List[str], remove_args: List[str]):
+        self.module = importlib.import_module(app_module)
+        self.add_args = add_args
+        self.remove_args = remove_args
+
+    def options(self):
+        options = self.module.get_chrome_options()
+        for prefix in self.remove_args:
+            for argument in [a for a in options.arguments if a.startswith(prefix)]:
+                options.arguments.remove(argument)
+        for argument in self.add_args:
+            options.add_argument(argument)
+        return options
+
+    def __call__(self):
+        driver = webdriver.Chrome(options=self.options())
+        script = getattr(self.module, 'HIDE_WEBDRIVER_SCRIPT', None)
+        if script:
+            driver.execute_script(script)
+        return driver
+
+
+def load(driver, url: str, timeout: float = 30) -> None:
+    driver.get(url)
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script('return document.readyState') == 'complete'
+    )
+
+
+def bench_cold_start(launch: Launcher, iterations: int) -> Dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        driver = launch()
+        samples.append(time.perf_counter() - start)
+        driver.quit()
+    return summarize(samples)
+
+
+def bench_warm_checkout(launch: Launcher, iterations: int) -> Dict:
+    pool = DriverPool(launch, size=1, name='bench')
+    samples = []
+    try:
+        for _ in range(iterations):
+            pool.start()
+            deadline = time.time() + 60
+            while pool.stats()['idle'] < 1 and time.time() < deadline:
+                time.sleep(0.1)
+            start = time.perf_counter()
+            driver = pool.checkout()
+            samples.append(time.perf_counter() - start)
+            driver.quit()
+    finally:
+        pool.shutdown()
+    return summarize(samples)
+
+
+def bench_navigate(driver, base_url: str, iterations: int) -> Dict:
+    results = {}
+    for page in PAGES:
+        load(driver, 'about:blank')
+        results[page] = summarize([timed(lambda: load(driver, base_url + page)) for _ in range(iterations)])
+    return results
+
+
+def bench_capture(driver, base_url: str, iterations: int) -> Dict:
+    load(driver, base_url + 'index.html')
+    results = {}
+    for fmt in FORMATS:
+        samples, sizes, actual = [], [], fmt
+        for _ in range(iterations):
+            start = time.perf_counter()
+            data, actual = capture_image(driver, fmt)
+            samples.append(time.perf_counter() - start)
+            sizes.append(len(data))
+        results[fmt] = dict(summarize(samples), bytes=int(statistics.median(sizes)), format=actual)
+    return results
+
+
+CLICK_SCRIPT = '''
+var rect = document.getElementById('load').getBoundingClientRect();
+var element = document.elementFromPoint(rect.left + rect.width / 2, rect.top + rect.height / 2);
+if (element) element.click();
+'''
+
+
+def bench_click_to_frame(driver, base_url: str, iterations: int) -> Dict:
+    browser = BrowserSession('bench', driver)
+    samples, settle_samples, unsettled = [], [], 0
+    for _ in range(iterations):
+        load(driver, base_url + 'click.html')
+        with browser.lock:
+            start = time.perf_counter()
+            settle = browser.settle_detector()
+            settle.mark()
+            driver.execute_script(CLICK_SCRIPT)
+            settle_seconds, settled = settle.wait()
+            browser.capture_frame()
+            samples.append(time.perf_counter() - start)
+        settle_samples.append(settle_seconds)
+        unsettled += not settled
+    return dict(summarize(samples), settle=summarize(settle_samples), unsettled=unsettled)
+
+
+def bench_density(launch: Launcher, base_url: str, sessions: int, contexts: bool) -> Dict:
+    """Chrome RSS with `sessions` pages open, as one Chrome each and as contexts"""
+    results = {}
+
+    drivers = []
+    try:
+        for _ in range(sessions):
+            driver = launch()
+            load(driver, base_url + 'index.html')
+            drivers.append(driver)
+        rss = sum(process_tree_rss(driver_pid(driver)) for driver in drivers)
+        results['drivers'] = {'sessions': sessions, 'rss': rss,
+                              'sessions_per_gb': round(sessions / (rss / 1024 ** 3), 2) if rss else None}
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+    if contexts:
+        pool = ContextBrowserPool(launch, hosts=1, contexts_per_host=sessions)
+        try:
+            for _ in range(sessions):
+                load(pool.checkout(), base_url + 'index.html')
+            stats = pool.stats()
+            results['contexts'] = {'sessions': stats['sessions'], 'rss': stats['rss'],
+                                   'sessions_per_gb': round(stats['sessions_per_gb'], 2)
+                                   if stats['sessions_per_gb'] else None}
+        except Exception as e:
+            results['contexts'] = {'error': str(e)}
+        finally:
+            pool.shutdown()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, path: str = '') -> List[str]:
+    """Regressions of results against a baseline run, as messages"""
+    regressions = []
+    for key, value in results.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f'{path}.{key}' if path else key
+        if isinstance(value, dict) and isinstance(old, dict):
+            regressions.extend(compare(value, old, tolerance, name))
+        elif key == 'median_ms' and old and value > old * (1 + tolerance):
+            regressions.append(f'{name}: {old} -> {value} ms')
+        elif key == 'sessions_per_gb' and old and value and value < old * (1 - tolerance):
+            regressions.append(f'{name}: {old} -> {value}')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the headless browser path')
+    parser.add_argument('--app', default='app_advanced', help='module whose get_chrome_options is used')
+    parser.add_argument('--add-arg', action='append', default=[], help='extra Chrome argument (repeatable)')
+    parser.add_argument('--remove-arg', action='append', default=[],
+                        help='drop Chrome arguments starting with this (repeatable)')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--sessions', type=int, default=4, help='pages open for the density benchmark')
+    parser.add_argument('--no-contexts', action='store_true', help='skip browser contexts in the density benchmark')
+    parser.add_argument('--only', action='append', default=[],
+                        help='run only these benchmarks (cold_start, warm_checkout, navigate, '
+                             'capture, click_to_frame, density)')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON output to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+    launch = Launcher(options.app, options.add_arg, options.remove_arg)
+    base_url = serve_site()
+
+    def wanted(name: str) -> bool:
+        return not options.only or name in options.only
+
+    report = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {'platform': platform.platform(), 'cpus': os.cpu_count(), 'python': platform.python_version()},
+        'app': options.app,
+        'chrome_args': launch.options().arguments,
+        'iterations': options.iterations,
+        'results': {}
+    }
+    results = report['results']
+
+    if wanted('cold_start'):
+        results['cold_start'] = bench_cold_start(launch, options.iterations)
+    if wanted('warm_checkout'):
+        results['warm_checkout'] = bench_warm_checkout(launch, options.iterations)
+
+    if wanted('navigate') or wanted('capture') or wanted('click_to_frame'):
+        driver = launch()
+        try:
+            report['chrome_version'] = driver.capabilities.get('browserVersion')
+            if wanted('navigate'):
+                results['navigate'] = bench_navigate(driver, base_url, options.iterations)
+            if wanted('capture'):
+                results['capture'] = bench_capture(driver, base_url, options.iterations)
+            if wanted('click_to_frame'):
+                results['click_to_frame'] = bench_click_to_frame(driver, base_url, options.iterations)
+        finally:
+            driver.quit()
+
+    if wanted('density'):
+        results['density'] = bench_density(launch, base_url, options.sessions, not options.no_contexts)
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f).get('results', {}), options.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
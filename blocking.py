@@ -0,0 +1,228 @@
+"""
+Blocking Module
+Resource blocking profiles for headless Chrome navigation: ad/tracker domains
+through DevTools Network.setBlockedURLs and whole resource types (media,
+fonts, images) through Fetch request interception
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from devtools import DevToolsError
+from metrics import metrics
+
+# Built-in ad and tracker domains (extend with BROWSER_BLOCKED_DOMAINS)
+TRACKER_DOMAINS = (
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com',
+    'google-analytics.com', 'googletagmanager.com', 'googletagservices.com',
+    'adservice.google.com', 'amazon-adsystem.com', 'adnxs.com', 'criteo.com',
+    'criteo.net', 'taboola.com', 'outbrain.com', 'scorecardresearch.com',
+    'quantserve.com', 'moatads.com', 'pubmatic.com', 'rubiconproject.com',
+    'casalemedia.com', 'openx.net', 'hotjar.com', 'chartbeat.com',
+    'connect.facebook.net', 'ads-twitter.com', 'bat.bing.com', 'mixpanel.com',
+    'cdn.segment.com'
+)
+
+PROFILES = {
+    'none': {'block_trackers': False, 'resource_types': ()},
+    'lite': {'block_trackers': True, 'resource_types': ()},
+    'fast': {'block_trackers': True, 'resource_types': ('Media', 'Font')},
+    'text': {'block_trackers': True, 'resource_types': ('Media', 'Font', 'Image')}
+}
+
+DEFAULT_PROFILE = 'none'
+
+# Typical transfer sizes, used to estimate bytes saved by blocked requests
+ESTIMATED_BYTES = {
+    'Image': 40 * 1024,
+    'Media': 500 * 1024,
+    'Font': 30 * 1024,
+    'Script': 25 * 1024,
+    'Stylesheet': 15 * 1024,
+    'XHR': 5 * 1024,
+    'Fetch': 5 * 1024
+}
+ESTIMATED_BYTES_OTHER = 5 * 1024
+
+# URL patterns used when only chromedriver's own DevTools access is available
+TYPE_URL_PATTERNS = {
+    'Media': ('*.mp4*', '*.webm*', '*.m3u8*', '*.mp3*', '*.ogg*'),
+    'Font': ('*.woff*', '*.woff2*', '*.ttf*', '*.otf*'),
+    'Image': ('*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*')
+}
+
+
+def tracker_domains():
+    """Built-in tracker domains plus BROWSER_BLOCKED_DOMAINS (comma separated)"""
+    extra = os.environ.get('BROWSER_BLOCKED_DOMAINS', '')
+    return TRACKER_DOMAINS + tuple(domain.strip() for domain in extra.split(',') if domain.strip())
+
+
+def site_profiles() -> Dict[str, str]:
+    """Per-site profiles from BROWSER_BLOCKING_SITES, e.g. {"news.example": "text"}"""
+    raw = os.environ.get('BROWSER_BLOCKING_SITES', '')
+    if not raw:
+        return {}
+    try:
+        sites = json.loads(raw)
+    except ValueError:
+        print("Ignoring BROWSER_BLOCKING_SITES: not valid JSON")
+        return {}
+    return {host.lower(): profile for host, profile in sites.items() if profile in PROFILES}
+
+
+def default_profile() -> str:
+    profile = os.environ.get('BROWSER_BLOCKING_PROFILE', DEFAULT_PROFILE)
+    return profile if profile in PROFILES else DEFAULT_PROFILE
+
+
+def profile_for_url(url: str, override: Optional[str] = None) -> str:
+    """Profile for a navigation: the session's choice, else per-site, else default"""
+    if override:
+        return override
+
+    host = (urlparse(url).hostname or '').lower()
+    sites = site_profiles()
+    # Most specific matching site wins
+    for site in sorted(sites, key=len, reverse=True):
+        if host == site or host.endswith('.' + site):
+            return sites[site]
+    return default_profile()
+
+
+def domain_patterns(domains) -> list:
+    patterns = []
+    for domain in domains:
+        patterns.append(f'*://{domain}/*')
+        patterns.append(f'*://*.{domain}/*')
+    return patterns
+
+
+class ResourceBlocker:
+    """
+    Applies a blocking profile to one browser session and counts what it saved
+
+    The profile is chosen per session (select), else by the target site
+    (BROWSER_BLOCKING_SITES), else BROWSER_BLOCKING_PROFILE.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.override: Optional[str] = None
+        self.applied: Optional[str] = None
+        self._devtools = None
+        self._lock = threading.Lock()
+        self.blocked_requests = 0
+        self.blocked_bytes_estimate = 0
+        self.blocked_by_type: Dict[str, int] = {}
+
+    def select(self, profile: Optional[str]) -> None:
+        """
+        Choose a profile for this session (None returns to per-site defaults)
+
+        Raises:
+            ValueError: Unknown profile
+        """
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(f"Unknown blocking profile '{profile}'")
+        self.override = profile
+
+    def profile_for(self, url: str) -> str:
+        """Profile that applies to a navigation to url"""
+        return profile_for_url(url, self.override)
+
+    def apply(self, url: str) -> str:
+        """
+        Apply the right profile before navigating to url (caller holds the session lock)
+
+        Returns:
+            Name of the applied profile
+        """
+        profile = self.profile_for(url)
+        try:
+            devtools = self.browser.devtools()
+        except Exception:
+            devtools = None
+
+        if devtools is not None and devtools is not self._devtools:
+            self._attach(devtools)
+            self.applied = None
+
+        if profile == self.applied:
+            return profile
+
+        try:
+            if devtools is not None:
+                self._apply_devtools(devtools, PROFILES[profile])
+            else:
+                self._apply_driver(PROFILES[profile])
+            self.applied = profile
+        except Exception as e:
+            print(f"Could not apply blocking profile '{profile}': {e}")
+        return profile
+
+    def _attach(self, devtools) -> None:
+        devtools.on('Fetch.requestPaused', self._on_paused)
+        devtools.on('Network.loadingFailed', self._on_failed)
+        self._devtools = devtools
+
+    def _apply_devtools(self, devtools, profile: dict) -> None:
+        devtools.send('Network.enable')
+        domains = tracker_domains() if profile['block_trackers'] else ()
+        devtools.send('Network.setBlockedURLs', {'urls': domain_patterns(domains)})
+
+        if profile['resource_types']:
+            devtools.send('Fetch.enable', {'patterns': [
+                {'urlPattern': '*', 'resourceType': resource_type, 'requestStage': 'Request'}
+                for resource_type in profile['resource_types']
+            ]})
+        else:
+            devtools.send('Fetch.disable')
+
+    def _apply_driver(self, profile: dict) -> None:
+        """Fallback through chromedriver: URL patterns only, no counting"""
+        patterns = domain_patterns(tracker_domains()) if profile['block_trackers'] else []
+        for resource_type in profile['resource_types']:
+            patterns.extend(TYPE_URL_PATTERNS.get(resource_type, ()))
+        self.browser.driver.execute_cdp_cmd('Network.enable', {})
+        self.browser.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+    def _count(self, resource_type: str) -> None:
+        estimate = ESTIMATED_BYTES.get(resource_type, ESTIMATED_BYTES_OTHER)
+        with self._lock:
+            self.blocked_requests += 1
+            self.blocked_bytes_estimate += estimate
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+        metrics.incr('browser.blocked_requests')
+        metrics.incr(f'browser.blocked_requests.{resource_type.lower()}')
+        metrics.observe('browser.blocked_bytes_estimate', estimate)
+
+    def _on_paused(self, params: dict) -> None:
+        # Only blocked resource types are intercepted; runs on the reader thread
+        try:
+            self._devtools.send_nowait('Fetch.failRequest', {
+                'requestId': params['requestId'],
+                'errorReason': 'BlockedByClient'
+            })
+        except DevToolsError:
+            return
+        self._count(params.get('resourceType', 'Other'))
+
+    def _on_failed(self, params: dict) -> None:
+        # setBlockedURLs blocks are reported as failures blocked by the inspector
+        if params.get('blockedReason') == 'inspector':
+            self._count(params.get('type', 'Other'))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'profile': self.applied,
+                'override': self.override,
+                'blocked_requests': self.blocked_requests,
+                'blocked_bytes_estimate': self.blocked_bytes_estimate,
+                'blocked_by_type': dict(self.blocked_by_type),
+                'profiles': sorted(PROFILES)
+            }
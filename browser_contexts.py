@@ -0,0 +1,298 @@
+"""
+Browser Contexts Module
+Hosts many isolated sessions in a few Chrome processes: each session gets its
+own DevTools browser context (separate cookies, storage and cache) and page,
+driven through a WebDriver-like facade
+"""
+
+import atexit
+import base64
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from devtools import DevToolsError, DevToolsSession
+from metrics import metrics
+from process_stats import driver_pid, process_tree_rss
+
+# Chrome processes shared by all context sessions (BROWSER_CONTEXT_HOSTS env var)
+DEFAULT_HOSTS = 2
+
+# Contexts per Chrome process before it counts as full (BROWSER_CONTEXTS_PER_HOST env var)
+DEFAULT_CONTEXTS_PER_HOST = 20
+
+DEFAULT_WINDOW = (1920, 1080)
+
+# Seconds get() waits for the load event, like chromedriver's page load timeout
+PAGE_LOAD_TIMEOUT = 30
+
+
+class ContextElement:
+    """The focused element of a ContextPage, for send_keys"""
+
+    def __init__(self, page: 'ContextPage'):
+        self.page = page
+
+    def send_keys(self, text: str) -> None:
+        self.page.execute_cdp_cmd('Input.insertText', {'text': text})
+
+
+class ContextSwitchTo:
+    def __init__(self, page: 'ContextPage'):
+        self.page = page
+
+    @property
+    def active_element(self) -> ContextElement:
+        return ContextElement(self.page)
+
+
+class ContextPage:
+    """
+    A page in its own browser context, with the subset of the Selenium
+    WebDriver interface the apps use (get, execute_script, page_source,
+    current_url, execute_cdp_cmd, screenshots, send_keys, quit)
+    """
+
+    def __init__(self, host: 'BrowserHost', context_id: str, target_id: str, session_id: str):
+        self.host = host
+        self.context_id = context_id
+        self.target_id = target_id
+        self.session = host.connection.target_session(session_id)
+        self.switch_to = ContextSwitchTo(self)
+        self.created = time.time()
+        self.closed = False
+
+    # Not a Selenium driver: no chromedriver process of its own
+    service = None
+    capabilities: Dict = {}
+
+    def devtools_session(self):
+        """DevTools access for screencast, settle detection and blocking"""
+        return self.session
+
+    def execute_cdp_cmd(self, cmd: str, params: Optional[dict] = None) -> dict:
+        return self.session.send(cmd, params or {})
+
+    def _evaluate(self, expression: str):
+        result = self.session.send('Runtime.evaluate', {
+            'expression': expression,
+            'returnByValue': True,
+            'awaitPromise': True
+        })
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            message = details.get('exception', {}).get('description') or details.get('text')
+            raise DevToolsError(f'Script error: {message}')
+        return result.get('result', {}).get('value')
+
+    def execute_script(self, script: str, *args):
+        """Run a Selenium-style script body (may use `return` and `arguments`)"""
+        return self._evaluate(f'(function() {{ {script} }}).apply(null, {json.dumps(list(args))})')
+
+    def get(self, url: str) -> None:
+        """Navigate and wait for the load event, like WebDriver get"""
+        loaded = threading.Event()
+
+        def on_load(params):
+            loaded.set()
+
+        self.session.on('Page.loadEventFired', on_load)
+        try:
+            self.session.send('Page.enable')
+            result = self.session.send('Page.navigate', {'url': url})
+            if result.get('errorText'):
+                raise DevToolsError(f"Navigation failed: {result['errorText']}")
+            loaded.wait(PAGE_LOAD_TIMEOUT)
+        finally:
+            self.session.off('Page.loadEventFired', on_load)
+
+    @property
+    def current_url(self) -> str:
+        return self._evaluate('location.href')
+
+    @property
+    def page_source(self) -> str:
+        return self._evaluate('document.documentElement ? document.documentElement.outerHTML : ""')
+
+    @property
+    def title(self) -> str:
+        return self._evaluate('document.title')
+
+    def host_pid(self) -> Optional[int]:
+        """Process shared with other sessions, for resource sampling"""
+        return driver_pid(self.host.driver)
+
+    def estimated_rss(self) -> int:
+        """This session's share of its host's memory"""
+        return self.host.rss() // max(len(self.host.pages), 1)
+
+    def get_screenshot_as_png(self) -> bytes:
+        result = self.session.send('Page.captureScreenshot', {'format': 'png'})
+        return base64.b64decode(result['data'])
+
+    def quit(self) -> None:
+        """Close the page and dispose of its context"""
+        if self.closed:
+            return
+        self.closed = True
+        self.session.close()
+        self.host.release(self)
+
+
+class BrowserHost:
+    """One Chrome process hosting many browser contexts"""
+
+    def __init__(self, driver, window=DEFAULT_WINDOW, init_script: Optional[str] = None):
+        self.driver = driver
+        self.window = window
+        self.init_script = init_script
+        self.connection = DevToolsSession.for_browser(driver)
+        self.pages: List[ContextPage] = []
+        self._lock = threading.Lock()
+        self._rss = 0
+        self._rss_measured = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return not self.connection.closed
+
+    def new_page(self) -> ContextPage:
+        """Create an isolated context with one blank page"""
+        context_id = self.connection.send('Target.createBrowserContext', {'disposeOnDetach': True})['browserContextId']
+        try:
+            target_id = self.connection.send('Target.createTarget', {
+                'url': 'about:blank',
+                'browserContextId': context_id,
+                'width': self.window[0],
+                'height': self.window[1]
+            })['targetId']
+            session_id = self.connection.send('Target.attachToTarget', {
+                'targetId': target_id,
+                'flatten': True
+            })['sessionId']
+        except DevToolsError:
+            self._dispose(context_id)
+            raise
+
+        page = ContextPage(self, context_id, target_id, session_id)
+        page.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+            'width': self.window[0], 'height': self.window[1],
+            'deviceScaleFactor': 1, 'mobile': False
+        })
+        if self.init_script:
+            page.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': self.init_script})
+
+        with self._lock:
+            self.pages.append(page)
+        metrics.incr('browser.contexts_created')
+        return page
+
+    def _dispose(self, context_id: str) -> None:
+        try:
+            self.connection.send('Target.disposeBrowserContext', {'browserContextId': context_id})
+        except DevToolsError:
+            pass
+
+    def release(self, page: ContextPage) -> None:
+        with self._lock:
+            if page in self.pages:
+                self.pages.remove(page)
+        try:
+            self.connection.send('Target.closeTarget', {'targetId': page.target_id})
+        except DevToolsError:
+            pass
+        self._dispose(page.context_id)
+
+    def rss(self, max_age: float = 5.0) -> int:
+        """The whole Chrome process tree's RSS, cached for max_age seconds"""
+        if time.time() - self._rss_measured > max_age:
+            self._rss = process_tree_rss(driver_pid(self.driver))
+            self._rss_measured = time.time()
+        return self._rss
+
+    def quit(self) -> None:
+        self.connection.close()
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class ContextBrowserPool:
+    """
+    Places sessions as browser contexts on a few shared Chrome processes
+
+    New sessions go to the live host with the fewest contexts; hosts are
+    launched on demand up to the configured count and replaced if they die.
+    Drop-in for DriverPool.checkout as a BrowserManager driver source.
+    """
+
+    def __init__(self, launch_host: Callable[[], object], hosts: Optional[int] = None,
+                 contexts_per_host: Optional[int] = None, init_script: Optional[str] = None,
+                 window=DEFAULT_WINDOW):
+        """
+        Initialize context pool
+
+        Args:
+            launch_host: Launches a Selenium Chrome driver to host contexts
+            hosts: Chrome processes to use (BROWSER_CONTEXT_HOSTS env var)
+            contexts_per_host: Soft limit per process (BROWSER_CONTEXTS_PER_HOST env var)
+            init_script: Script run in every new document of every context
+            window: Page size for new contexts
+        """
+        env = os.environ
+        self.launch_host = launch_host
+        self.max_hosts = hosts or int(env.get('BROWSER_CONTEXT_HOSTS', DEFAULT_HOSTS))
+        self.contexts_per_host = contexts_per_host or int(env.get('BROWSER_CONTEXTS_PER_HOST', DEFAULT_CONTEXTS_PER_HOST))
+        self.init_script = init_script
+        self.window = window
+        self.hosts: List[BrowserHost] = []
+        self._lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+
+    def _place(self) -> Optional[BrowserHost]:
+        """Pick the least loaded live host, or None if a new one should start (caller holds _lock)"""
+        self.hosts = [host for host in self.hosts if host.alive or host.pages]
+        live = [host for host in self.hosts if host.alive]
+        if live:
+            best = min(live, key=lambda host: len(host.pages))
+            if len(best.pages) < self.contexts_per_host or len(live) >= self.max_hosts:
+                return best
+        return None
+
+    def checkout(self) -> ContextPage:
+        """Create a new isolated session page"""
+        with self._lock:
+            host = self._place()
+            if host is None:
+                with metrics.timer('browser.host_launch_seconds'):
+                    host = BrowserHost(self.launch_host(), self.window, self.init_script)
+                self.hosts.append(host)
+        with metrics.timer('browser.context_create_seconds'):
+            return host.new_page()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            hosts = list(self.hosts)
+            self.hosts.clear()
+        for host in hosts:
+            host.quit()
+
+    def stats(self) -> Dict:
+        """Contexts per host, memory, and sessions per GB of Chrome RSS"""
+        with self._lock:
+            hosts = list(self.hosts)
+        per_host = []
+        for host in hosts:
+            per_host.append({'contexts': len(host.pages), 'rss': host.rss(), 'alive': host.alive})
+        sessions = sum(item['contexts'] for item in per_host)
+        rss = sum(item['rss'] for item in per_host)
+        return {
+            'hosts': per_host,
+            'sessions': sessions,
+            'rss': rss,
+            'sessions_per_gb': sessions / (rss / 1024 ** 3) if rss else None
+        }
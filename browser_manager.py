@@ -0,0 +1,537 @@
+"""
+Browser Manager Module
+Capacity-managed registry of per-user headless browser sessions with admission
+control, per-session locking and memory-aware eviction
+"""
+
+import atexit
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from blocking import ResourceBlocker
+from browser_sampler import BrowserSampler
+from devtools import DevToolsSession
+from frames import Frame, FrameRing
+from metrics import metrics
+from page_tiles import PageTiles
+from process_stats import driver_pid, process_tree_rss
+from screencast import Screencast
+from settle import SettleDetector
+from viewport import DEFAULT_VIEWPORT, Viewport, apply_viewport
+
+
+class BrowserCapacityError(Exception):
+    """Raised when no browser could be admitted before the queue timeout"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BrowserSession:
+    """
+    One user's browser
+
+    Selenium drivers are not thread-safe: hold `lock` for every driver call.
+    """
+
+    def __init__(self, session_id: str, driver, use_proxy: bool = False):
+        self.session_id = session_id
+        self.driver = driver
+        self.use_proxy = use_proxy
+        self.lock = threading.RLock()
+        self.created = time.time()
+        self.last_access = self.created
+        self.rss = 0
+        self.rss_measured = 0.0
+        # Set once the user clicks or types, or a page is loaded while the
+        # browser has cookies for its site; such browsers may hold logins
+        self.interacted = False
+        self.frames = FrameRing()
+        self.viewport = DEFAULT_VIEWPORT
+        # Latest BrowserSampler measurement, consecutive over-limit samples, restarts
+        self.usage = None
+        self.usage_strikes = 0
+        self.restarts = 0
+        self._devtools = None
+        self._screencast = None
+        self._settle = None
+        self._blocker = None
+        self._tiles = None
+        # Guards lazy construction of the helpers below, which don't touch the
+        # driver, so a request can reach them while a navigation holds `lock`
+        self._lazy_lock = threading.Lock()
+
+    def touch(self) -> None:
+        self.last_access = time.time()
+
+    def devtools(self) -> DevToolsSession:
+        """
+        Get the DevTools connection to the current tab, connecting on first use
+
+        Raises:
+            DevToolsError: websocket-client is missing or Chrome is unreachable
+        """
+        with self.lock:
+            if self._devtools is None or self._devtools.closed:
+                if hasattr(self.driver, 'devtools_session'):
+                    # Context pages already have a session on their host's connection
+                    self._devtools = self.driver.devtools_session()
+                else:
+                    self._devtools = DevToolsSession.for_driver(self.driver)
+            return self._devtools
+
+    def screencast(self) -> Screencast:
+        """Get the session's screencast, shared by all of its clients"""
+        with self._lazy_lock:
+            if self._screencast is None:
+                self._screencast = Screencast(self)
+            return self._screencast
+
+    def settle_detector(self) -> SettleDetector:
+        """Get the session's settle detector (use while holding lock)"""
+        with self._lazy_lock:
+            if self._settle is None:
+                self._settle = SettleDetector(self)
+            return self._settle
+
+    def blocker(self) -> ResourceBlocker:
+        """Get the session's resource blocker"""
+        with self._lazy_lock:
+            if self._blocker is None:
+                self._blocker = ResourceBlocker(self)
+            return self._blocker
+
+    def page_tiles(self) -> PageTiles:
+        """Get the session's full-page tile pyramid"""
+        with self._lazy_lock:
+            if self._tiles is None:
+                self._tiles = PageTiles(self)
+            return self._tiles
+
+    def acknowledge_frame(self, frame_id: int) -> None:
+        """Tell the screencast (if any) that a client fetched a frame"""
+        if self._screencast is not None:
+            self._screencast.acknowledge(frame_id)
+
+    def close(self) -> None:
+        """Stop streaming and quit the driver"""
+        if self._screencast is not None:
+            self._screencast.close()
+        if self._devtools is not None:
+            self._devtools.close()
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+    def set_viewport(self, viewport: Viewport) -> None:
+        """Resize the page to a client's viewport (no-op if unchanged)"""
+        with self.lock:
+            if viewport == self.viewport:
+                return
+            apply_viewport(self.driver, viewport)
+            self.viewport = viewport
+
+    def replace_driver(self, driver) -> None:
+        """Quit the driver and continue the session on a new one (caller holds lock)"""
+        override = self._blocker.override if self._blocker is not None else None
+        self.close()
+        self.driver = driver
+        self._devtools = None
+        self._screencast = None
+        self._settle = None
+        self._blocker = None
+        self._tiles = None
+        if override is not None:
+            self.blocker().select(override)
+        self.rss_measured = 0.0
+        self.usage = None
+        self.usage_strikes = 0
+        self.restarts += 1
+        if self.viewport != DEFAULT_VIEWPORT:
+            try:
+                apply_viewport(driver, self.viewport)
+            except Exception as e:
+                print(f"Could not restore viewport: {e}")
+                self.viewport = DEFAULT_VIEWPORT
+
+    def capture_frame(self, fmt: Optional[str] = None, quality: Optional[int] = None) -> Frame:
+        """Capture a new frame of the current page (caller holds lock)"""
+        return self.frames.capture(self.driver, fmt, quality)
+
+    def measure_rss(self, max_age: float = 5.0) -> int:
+        """Measure the driver's process tree RSS, cached for max_age seconds"""
+        if time.time() - self.rss_measured > max_age:
+            if hasattr(self.driver, 'estimated_rss'):
+                self.rss = self.driver.estimated_rss()
+            else:
+                self.rss = process_tree_rss(driver_pid(self.driver))
+            self.rss_measured = time.time()
+        return self.rss
+
+
+class BrowserManager:
+    """
+    Bounded set of browser sessions
+
+    New sessions are admitted while there is room under both the driver count
+    and the total memory budget. When full, idle sessions are evicted by a
+    score combining idle time (LRU) and measured Chrome RSS; if nothing can be
+    evicted the request waits in a bounded queue and gives up with
+    BrowserCapacityError after the queue timeout.
+
+    Idle sessions are closed by a background reaper thread driven by a heap of
+    expiry times, and drivers are quit on a small executor, so no request ever
+    waits on browser teardown. Memory measurements and registry writes happen
+    on a snapshot of the sessions outside `_cond`, which every request takes.
+    """
+
+    def __init__(self, acquire_driver: Callable[[bool], object],
+                 max_browsers: Optional[int] = None,
+                 queue_timeout: Optional[float] = None,
+                 max_queue: Optional[int] = None,
+                 max_total_rss_mb: Optional[int] = None,
+                 idle_timeout: float = 600,
+                 min_idle_for_eviction: float = 30,
+                 profile_store=None,
+                 registry=None):
+        """
+        Initialize browser manager
+
+        Args:
+            acquire_driver: Returns a new driver, given whether to route via proxy
+            max_browsers: Driver limit (BROWSER_MAX_SESSIONS env var, default 8)
+            queue_timeout: Seconds to wait for a slot (BROWSER_QUEUE_TIMEOUT, default 10)
+            max_queue: Waiting requests allowed (BROWSER_MAX_QUEUE, default 16)
+            max_total_rss_mb: Memory budget for all drivers (BROWSER_MAX_TOTAL_RSS_MB, 0 = off)
+            idle_timeout: Seconds of inactivity before a session is closed
+            min_idle_for_eviction: Sessions used more recently than this are never evicted
+            profile_store: Optional ProfileStore that keeps closed sessions' logins
+            registry: Optional SessionRegistry told which sessions this worker holds
+        """
+        env = os.environ
+        self.acquire_driver = acquire_driver
+        self.max_browsers = max_browsers or int(env.get('BROWSER_MAX_SESSIONS', 8))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(env.get('BROWSER_QUEUE_TIMEOUT', 10))
+        self.max_queue = max_queue if max_queue is not None else int(env.get('BROWSER_MAX_QUEUE', 16))
+        rss_mb = max_total_rss_mb if max_total_rss_mb is not None else int(env.get('BROWSER_MAX_TOTAL_RSS_MB', 0))
+        self.max_total_rss = rss_mb * 1024 * 1024 if rss_mb else None
+        self.idle_timeout = idle_timeout
+        self.min_idle_for_eviction = min_idle_for_eviction
+        self.profile_store = profile_store
+        self.registry = registry
+
+        self._sessions: Dict[str, BrowserSession] = {}
+        self._pending = set()
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+        # (expiry, seq, session_id, browser); entries go stale when a session is
+        # touched or removed and are re-checked when they reach the top
+        self._expiry_heap = []
+        self._seq = itertools.count()
+        self._reaper = None
+        self._stopped = False
+        self._quit_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='browser-quit')
+
+        # Per-session RSS/CPU/tab accounting and runaway ceilings
+        self.sampler = BrowserSampler(self)
+
+        atexit.register(self.shutdown)
+
+    def start(self) -> None:
+        """Start the background reaper thread (idempotent)"""
+        with self._cond:
+            if self._reaper is None and not self._stopped:
+                self._reaper = threading.Thread(target=self._reap_loop, name='browser-reaper', daemon=True)
+                self._reaper.start()
+                self.sampler.start()
+
+    def get(self, session_id: str) -> Optional[BrowserSession]:
+        """Get an existing session (marking it used), or None"""
+        with self._cond:
+            browser = self._sessions.get(session_id)
+        if browser is not None:
+            browser.touch()
+        return browser
+
+    def sessions(self) -> List[BrowserSession]:
+        """Snapshot of the current sessions"""
+        with self._cond:
+            return list(self._sessions.values())
+
+    def get_or_create(self, session_id: str, use_proxy: bool = False) -> BrowserSession:
+        """
+        Get a session's browser, admitting a new one if needed
+
+        Raises:
+            BrowserCapacityError: No capacity before the queue timeout
+        """
+        self.start()
+        deadline = time.time() + self.queue_timeout
+        wait_start = time.perf_counter()
+        total_rss = None  # measured outside _cond on the previous pass
+        queued = False
+
+        try:
+            while True:
+                with self._cond:
+                    # Another request from the same session may be launching its browser
+                    while session_id in self._pending:
+                        if not self._cond.wait(max(deadline - time.time(), 0)):
+                            raise BrowserCapacityError('Browser is still starting', retry_after=2)
+
+                    browser = self._sessions.get(session_id)
+                    if browser is not None:
+                        browser.touch()
+                        return browser
+
+                    has_slot = len(self._sessions) + len(self._pending) < self.max_browsers
+                    if has_slot and (self.max_total_rss is None or not self._sessions
+                                     or (total_rss is not None and total_rss < self.max_total_rss)):
+                        self._pending.add(session_id)
+                        break
+                    snapshot = list(self._sessions.values())
+
+                if has_slot and total_rss is None:
+                    total_rss = sum(browser.measure_rss() for browser in snapshot)
+                    continue
+                total_rss = None
+                if self._evict_one(snapshot):
+                    continue
+
+                with self._cond:
+                    if not queued:
+                        if self._waiting >= self.max_queue:
+                            metrics.incr('browser.admission_rejected')
+                            raise BrowserCapacityError('Too many requests waiting for a browser',
+                                                       retry_after=self._retry_after())
+                        self._waiting += 1
+                        queued = True
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        metrics.incr('browser.admission_rejected')
+                        raise BrowserCapacityError('All browsers are busy',
+                                                   retry_after=self._retry_after())
+                    # Bounded, since a removal between the snapshot and here notified nobody
+                    self._cond.wait(min(remaining, 1))
+        finally:
+            if queued:
+                with self._cond:
+                    self._waiting -= 1
+
+        metrics.observe('browser.admission_wait_seconds', time.perf_counter() - wait_start)
+
+        try:
+            driver = self.acquire_driver(use_proxy)
+        except Exception:
+            with self._cond:
+                self._pending.discard(session_id)
+                self._cond.notify_all()
+            raise
+
+        browser = BrowserSession(session_id, driver, use_proxy)
+        if self.profile_store is not None and self.profile_store.restore(session_id, driver):
+            # Restored cookies may be logins, so never share this browser's renders
+            browser.interacted = True
+        with self._cond:
+            self._pending.discard(session_id)
+            self._sessions[session_id] = browser
+            self._schedule(browser, browser.last_access + self.idle_timeout)
+            self._cond.notify_all()
+        if self.registry is not None:
+            self.registry.claim(session_id)
+        metrics.incr('browser.sessions_created')
+        return browser
+
+    def _schedule(self, browser: BrowserSession, expiry: float) -> None:
+        """Queue an expiry check for a session (caller holds _cond)"""
+        heapq.heappush(self._expiry_heap, (expiry, next(self._seq), browser.session_id, browser))
+
+    def _reap_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                timeout = None
+                if self._expiry_heap:
+                    timeout = self._expiry_heap[0][0] - time.time()
+                if timeout is None or timeout > 0:
+                    # Woken early by new sessions, removals or shutdown
+                    self._cond.wait(timeout)
+                    continue
+                reaped = self._reap_due()
+            for browser in reaped:
+                self._dispose(browser)
+
+    def _reap_due(self) -> List[BrowserSession]:
+        """Take every session whose expiry has passed (caller holds _cond)"""
+        now = time.time()
+        reaped = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, _, session_id, browser = heapq.heappop(self._expiry_heap)
+            if self._sessions.get(session_id) is not browser:
+                continue  # already closed or replaced
+
+            expiry = browser.last_access + self.idle_timeout
+            if expiry > now:
+                # Used since this entry was queued
+                self._schedule(browser, expiry)
+                continue
+
+            if not browser.lock.acquire(blocking=False):
+                # A long-running request holds it; look again shortly
+                self._schedule(browser, now + min(self.idle_timeout, 30))
+                continue
+            try:
+                reaped.append(self._pop(session_id))
+            finally:
+                browser.lock.release()
+            metrics.incr('browser.sessions_reaped')
+        return reaped
+
+    def _evict_one(self, browsers: List[BrowserSession]) -> bool:
+        """Evict the idle session with the highest LRU/RSS score from a snapshot (without _cond)"""
+        now = time.time()
+        candidates = [
+            browser for browser in browsers
+            if now - browser.last_access >= self.min_idle_for_eviction
+        ]
+        if not candidates:
+            return False
+
+        rss_values = [browser.measure_rss() for browser in candidates]
+        mean_rss = (sum(rss_values) / len(rss_values)) or 1
+
+        def score(item):
+            browser, rss = item
+            return (now - browser.last_access) * (1 + rss / mean_rss)
+
+        for browser, _ in sorted(zip(candidates, rss_values), key=score, reverse=True):
+            # Never evict a browser that a request is using right now
+            if not browser.lock.acquire(blocking=False):
+                continue
+            try:
+                with self._cond:
+                    # Closed or replaced since the snapshot
+                    if self._sessions.get(browser.session_id) is not browser:
+                        continue
+                    self._pop(browser.session_id)
+            finally:
+                browser.lock.release()
+            self._dispose(browser)
+            metrics.incr('browser.sessions_evicted')
+            return True
+        return False
+
+    def _retry_after(self) -> int:
+        """Estimate when a slot frees up: the next idle expiry, capped"""
+        if not self._sessions:
+            return 5
+        next_expiry = min(browser.last_access for browser in self._sessions.values()) + self.idle_timeout
+        return int(min(max(next_expiry - time.time(), 1), 30))
+
+    def _pop(self, session_id: str) -> Optional[BrowserSession]:
+        """Drop a session from the set (caller holds _cond, then calls _dispose)"""
+        browser = self._sessions.pop(session_id, None)
+        if browser is not None:
+            self._cond.notify_all()
+        return browser
+
+    def _dispose(self, browser: BrowserSession) -> None:
+        """Unregister a dropped session and quit its driver in the background (without _cond)"""
+        if self.registry is not None:
+            self.registry.release(browser.session_id)
+        try:
+            self._quit_executor.submit(self._retire, browser)
+        except RuntimeError:
+            # Executor already shut down at interpreter exit
+            self._retire(browser)
+
+    def _retire(self, browser: BrowserSession) -> None:
+        """Snapshot a closed session's logins if it may have any, then quit its driver"""
+        if self.profile_store is not None and browser.interacted:
+            # A request stuck on a runaway browser mustn't hold up teardown for long
+            if browser.lock.acquire(timeout=5):
+                try:
+                    self.profile_store.save(browser.session_id, browser.driver)
+                finally:
+                    browser.lock.release()
+        browser.close()
+
+    def close(self, session_id: str) -> None:
+        """Close a session's browser"""
+        self.evict(session_id)
+
+    def evict(self, session_id: str) -> bool:
+        """Close a session even if a request is using it (runaway browsers)"""
+        with self._cond:
+            browser = self._pop(session_id)
+        if browser is None:
+            return False
+        self._dispose(browser)
+        return True
+
+    def restart(self, session_id: str) -> bool:
+        """
+        Replace a session's driver with a fresh one and reload its page
+
+        Returns:
+            False if the session is gone, busy, or no new driver could be started
+        """
+        with self._cond:
+            browser = self._sessions.get(session_id)
+        if browser is None or not browser.lock.acquire(blocking=False):
+            return False
+        try:
+            try:
+                driver = self.acquire_driver(browser.use_proxy)
+            except Exception as e:
+                print(f"Browser restart failed: {e}")
+                return False
+            frame = browser.frames.get()
+            if self.profile_store is not None and browser.interacted:
+                self.profile_store.save(session_id, browser.driver)
+            browser.replace_driver(driver)
+            if self.profile_store is not None:
+                self.profile_store.restore(session_id, driver)
+            if frame is not None and frame.url.startswith(('http://', 'https://')):
+                try:
+                    browser.blocker().apply(frame.url)
+                    driver.get(frame.url)
+                except Exception as e:
+                    print(f"Could not reload page after browser restart: {e}")
+            return True
+        finally:
+            browser.lock.release()
+
+    def shutdown(self) -> None:
+        """Stop the reaper and close every session"""
+        with self._cond:
+            self._stopped = True
+            self.sampler.stop()
+            browsers = list(self._sessions.values())
+            self._sessions.clear()
+            self._expiry_heap.clear()
+            self._cond.notify_all()
+        self._quit_executor.shutdown(wait=True)
+        for browser in browsers:
+            self._retire(browser)
+
+    def stats(self) -> Dict:
+        """Get capacity information"""
+        with self._cond:
+            return {
+                'sessions': len(self._sessions),
+                'starting': len(self._pending),
+                'waiting': self._waiting,
+                'scheduled_expiries': len(self._expiry_heap),
+                'max_sessions': self.max_browsers,
+                'max_total_rss_mb': self.max_total_rss // (1024 * 1024) if self.max_total_rss else None
+            }
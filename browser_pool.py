@@ -0,0 +1,199 @@
+"""
+Browser Pool Module
+Keeps pre-launched headless Chrome drivers ready so a new session doesn't pay
+the browser cold start inside its first request
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from metrics import metrics
+
+# Default number of warm drivers per pool (BROWSER_POOL_SIZE env var)
+DEFAULT_POOL_SIZE = 2
+
+
+class DriverPool:
+    """
+    Pool of warm, pre-configured WebDriver instances
+
+    A background thread tops the pool up to its target size. Checkout hands out
+    a warm driver when one is idle and falls back to launching inline.
+    """
+
+    def __init__(self, factory: Callable[[], object], size: Optional[int] = None,
+                 name: str = 'default', should_fill: Optional[Callable[[], bool]] = None):
+        """
+        Initialize driver pool
+
+        Args:
+            factory: Launches and configures one driver
+            size: Number of warm drivers to keep (BROWSER_POOL_SIZE env var)
+            name: Pool name used in metrics
+            should_fill: Optional check; the pool only refills while it returns True
+        """
+        if size is None:
+            size = int(os.environ.get('BROWSER_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+        self.factory = factory
+        self.size = size
+        self.name = name
+        self.should_fill = should_fill
+
+        self._idle = deque()  # (driver, launched_at)
+        self._launching = 0
+        # Bumped by drain(); drivers launched under an older generation are stale
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.hits = 0
+        self.misses = 0
+
+        atexit.register(self.shutdown)
+
+    def start(self) -> None:
+        """Start the background refill thread (idempotent)"""
+        with self._cond:
+            if self._thread is None and self.size > 0:
+                self._thread = threading.Thread(
+                    target=self._refill_loop, name=f'driver-pool-{self.name}', daemon=True
+                )
+                self._thread.start()
+
+    def _needs_driver(self) -> bool:
+        if len(self._idle) + self._launching >= self.size:
+            return False
+        return self.should_fill is None or self.should_fill()
+
+    def _refill_loop(self) -> None:
+        failures = 0
+        while True:
+            with self._cond:
+                while not self._stopped and not self._needs_driver():
+                    self._cond.wait(timeout=5)
+                if self._stopped:
+                    return
+                self._launching += 1
+                generation = self._generation
+
+            try:
+                driver = self._launch()
+                failures = 0
+            except Exception as e:
+                print(f"Error pre-launching browser for pool '{self.name}': {e}")
+                driver = None
+                failures += 1
+
+            stale = False
+            with self._cond:
+                self._launching -= 1
+                if driver is not None:
+                    # Drained or shut down while it was launching
+                    stale = self._stopped or generation != self._generation
+                    if not stale:
+                        self._idle.append((driver, time.time()))
+                    self._cond.notify_all()
+            if stale:
+                self._quit(driver)
+
+            if driver is None:
+                # Back off so a missing Chrome install doesn't spin
+                time.sleep(min(60, 2 ** failures))
+
+    def _launch(self):
+        start = time.perf_counter()
+        driver = self.factory()
+        elapsed = time.perf_counter() - start
+        metrics.observe('browser.launch_seconds', elapsed)
+        metrics.observe(f'browser.pool.{self.name}.launch_seconds', elapsed)
+        return driver
+
+    @staticmethod
+    def _is_alive(driver) -> bool:
+        try:
+            process = driver.service.process
+            if process is not None and process.poll() is not None:
+                return False
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver) -> None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def checkout(self):
+        """
+        Get a driver, warm if possible
+
+        Returns:
+            WebDriver instance owned by the caller from now on
+        """
+        self.start()
+
+        while True:
+            with self._cond:
+                item = self._idle.popleft() if self._idle else None
+                # Wake the refill thread to replace what we just took
+                self._cond.notify_all()
+            if item is None:
+                break
+
+            driver, _ = item
+            if self._is_alive(driver):
+                self.hits += 1
+                metrics.incr(f'browser.pool.{self.name}.hits')
+                return driver
+            self._quit(driver)
+
+        self.misses += 1
+        metrics.incr(f'browser.pool.{self.name}.misses')
+        return self._launch()
+
+    def drain(self) -> None:
+        """Discard idle drivers, e.g. after their launch configuration changed"""
+        with self._cond:
+            self._generation += 1
+            drivers = [driver for driver, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+
+        if drivers:
+            threading.Thread(
+                target=lambda: [self._quit(driver) for driver in drivers], daemon=True
+            ).start()
+
+    def shutdown(self) -> None:
+        """Stop refilling and quit idle drivers"""
+        with self._cond:
+            self._stopped = True
+            drivers = [driver for driver, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in drivers:
+            self._quit(driver)
+
+    def stats(self) -> Dict:
+        """Get pool size and hit-rate information"""
+        with self._cond:
+            idle = len(self._idle)
+            launching = self._launching
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': self.size,
+            'idle': idle,
+            'launching': launching,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None
+        }
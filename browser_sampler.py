@@ -0,0 +1,185 @@
+"""
+Browser Sampler Module
+Periodically measures every managed browser (RSS, CPU, open tabs, renderer
+processes) and restarts or evicts browsers that stay over per-session ceilings
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from devtools import page_targets
+from metrics import metrics
+from process_stats import driver_pid, process_tree_usage
+
+# Seconds between samples (BROWSER_SAMPLE_INTERVAL env var)
+DEFAULT_INTERVAL = 10
+
+# Consecutive over-limit samples before a browser counts as runaway
+RUNAWAY_STRIKES = 3
+
+# Restarts of one session before it is evicted instead
+MAX_RESTARTS = 2
+
+RUNAWAY_ACTIONS = ('restart', 'evict')
+
+
+def session_label(session_id: str) -> str:
+    """Stable public label for a session; never expose the session id itself"""
+    return hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:12]
+
+
+class BrowserSampler:
+    """
+    Resource accounting for a BrowserManager's sessions
+
+    Sessions hosted as browser contexts share a Chrome with other sessions;
+    they report that Chrome's usage marked as shared, and ceilings apply
+    only to browsers with a Chrome of their own.
+    """
+
+    def __init__(self, manager, interval: Optional[float] = None,
+                 max_rss_mb: Optional[int] = None, max_cpu_percent: Optional[float] = None,
+                 action: Optional[str] = None):
+        """
+        Initialize sampler
+
+        Args:
+            manager: BrowserManager whose sessions are sampled
+            interval: Seconds between samples (BROWSER_SAMPLE_INTERVAL env var, default 10)
+            max_rss_mb: Per-session memory ceiling (BROWSER_SESSION_MAX_RSS_MB, 0 = off)
+            max_cpu_percent: Per-session CPU ceiling (BROWSER_SESSION_MAX_CPU_PERCENT, 0 = off)
+            action: 'restart' or 'evict' runaway browsers (BROWSER_RUNAWAY_ACTION, default restart)
+        """
+        env = os.environ
+        self.manager = manager
+        self.interval = interval or float(env.get('BROWSER_SAMPLE_INTERVAL', DEFAULT_INTERVAL))
+        rss_mb = max_rss_mb if max_rss_mb is not None else int(env.get('BROWSER_SESSION_MAX_RSS_MB', 0))
+        self.max_rss = rss_mb * 1024 * 1024 if rss_mb else None
+        cpu = max_cpu_percent if max_cpu_percent is not None else float(env.get('BROWSER_SESSION_MAX_CPU_PERCENT', 0))
+        self.max_cpu_percent = cpu or None
+        action = action or env.get('BROWSER_RUNAWAY_ACTION', 'restart')
+        self.action = action if action in RUNAWAY_ACTIONS else 'restart'
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start sampling in the background (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='browser-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Browser sampling failed: {e}")
+
+    def sample(self) -> None:
+        """Measure every session once and act on runaway browsers"""
+        for browser in self.manager.sessions():
+            usage = self.measure(browser)
+            browser.usage = usage
+            if not usage['shared']:
+                metrics.observe('browser.session_rss_bytes', usage['rss'])
+                if usage['cpu_percent'] is not None:
+                    metrics.observe('browser.session_cpu_percent', usage['cpu_percent'])
+            self._enforce(browser, usage)
+
+    def measure(self, browser) -> Dict:
+        """Current usage of one session, with CPU percent since its last sample"""
+        driver = browser.driver
+        shared = hasattr(driver, 'host_pid')
+        usage = process_tree_usage(driver.host_pid() if shared else driver_pid(driver))
+        usage['shared'] = shared
+        usage['sampled'] = time.time()
+
+        if shared:
+            usage['tabs'] = 1
+        else:
+            try:
+                usage['tabs'] = len(page_targets(driver))
+            except Exception:
+                usage['tabs'] = None
+
+        previous = browser.usage
+        usage['cpu_percent'] = None
+        if previous and previous['processes'] and usage['processes']:
+            elapsed = usage['sampled'] - previous['sampled']
+            if elapsed > 0:
+                # Renderers that exited take their CPU time with them
+                used = max(usage['cpu_seconds'] - previous['cpu_seconds'], 0)
+                usage['cpu_percent'] = round(100 * used / elapsed, 1)
+        return usage
+
+    def _over_limit(self, usage: Dict) -> Optional[str]:
+        if usage['shared'] or not usage['processes']:
+            return None
+        if self.max_rss is not None and usage['rss'] > self.max_rss:
+            return 'rss'
+        if (self.max_cpu_percent is not None and usage['cpu_percent'] is not None
+                and usage['cpu_percent'] > self.max_cpu_percent):
+            return 'cpu'
+        return None
+
+    def _enforce(self, browser, usage: Dict) -> None:
+        reason = self._over_limit(usage)
+        if reason is None:
+            browser.usage_strikes = 0
+            return
+        browser.usage_strikes += 1
+        if browser.usage_strikes < RUNAWAY_STRIKES:
+            return
+
+        label = session_label(browser.session_id)
+        if self.action == 'restart' and browser.restarts < MAX_RESTARTS:
+            if self.manager.restart(browser.session_id):
+                print(f"Restarted browser {label}: over {reason} ceiling")
+                metrics.incr(f'browser.runaway_restarts.{reason}')
+                return
+            # Restarts need the session lock, which a runaway page's request
+            # usually holds; evict rather than retry forever
+            metrics.incr('browser.runaway_restart_failures')
+        if self.manager.evict(browser.session_id):
+            print(f"Evicted browser {label}: over {reason} ceiling")
+            metrics.incr(f'browser.runaway_evictions.{reason}')
+
+    def snapshot(self, current_session: Optional[str] = None) -> List[Dict]:
+        """Latest usage of every session, for /api/browsers"""
+        now = time.time()
+        rows = []
+        for browser in self.manager.sessions():
+            usage = browser.usage or {}
+            rows.append({
+                'id': session_label(browser.session_id),
+                'current': browser.session_id == current_session,
+                'use_proxy': browser.use_proxy,
+                'age': round(now - browser.created, 1),
+                'idle': round(now - browser.last_access, 1),
+                'interacted': browser.interacted,
+                'restarts': browser.restarts,
+                'rss': usage.get('rss'),
+                'cpu_seconds': usage.get('cpu_seconds'),
+                'cpu_percent': usage.get('cpu_percent'),
+                'tabs': usage.get('tabs'),
+                'processes': usage.get('processes'),
+                'renderers': usage.get('renderers'),
+                'shared_process': usage.get('shared'),
+                'sampled_ago': round(now - usage['sampled'], 1) if usage else None
+            })
+        return rows
+
+    def limits(self) -> Dict:
+        return {
+            'interval': self.interval,
+            'max_rss_mb': self.max_rss // (1024 * 1024) if self.max_rss else None,
+            'max_cpu_percent': self.max_cpu_percent,
+            'action': self.action
+        }
@@ -0,0 +1,707 @@
+"""
+Browser Worker Module
+Runs Chrome drivers on separate machines and serves navigation, script,
+DevTools command, screenshot and input calls over a length-prefixed JSON RPC,
+so the apps can place browser sessions across several nodes
+
+Usage:
+    python browser_worker.py --port 9300 --max-drivers 30 --launcher app_advanced:launch_driver
+
+Each message is an 8-byte header (JSON length, attachment length) followed by
+compact JSON and an optional binary attachment, which carries screenshots
+without base64. A driver belongs to the connection that opened it and is quit
+when that connection closes. Beyond loopback, connections use TLS, optionally
+with client certificates.
+"""
+
+import argparse
+import base64
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import ssl
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from devtools import DevToolsError
+from metrics import metrics
+from process_stats import driver_pid, process_tree_rss
+
+HEADER = struct.Struct('>II')
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+DEFAULT_PORT = 9300
+
+# Chrome drivers one node runs (--max-drivers / BROWSER_WORKER_MAX_DRIVERS)
+DEFAULT_MAX_DRIVERS = 20
+
+CONNECT_TIMEOUT = 5
+
+# Longest single call; page loads wait up to 30 s for the load event
+CALL_TIMEOUT = 90
+
+# Page load limit on the node, so a hanging page fails the call before the
+# client gives up on it
+PAGE_LOAD_TIMEOUT = 60
+
+# Seconds a node that failed is skipped by placement
+NODE_RETRY_AFTER = 30
+
+# Seconds node load reports are reused for placement
+STATS_MAX_AGE = 2
+
+# DevTools commands whose effect outlives the page; replayed after a migration.
+# The first group keeps only the latest call, the second accumulates.
+REPLACED_COMMANDS = ('Network.enable', 'Network.setBlockedURLs', 'Emulation.setDeviceMetricsOverride')
+CUMULATIVE_COMMANDS = ('Page.addScriptToEvaluateOnNewDocument', 'Network.setCookies')
+
+# DevTools commands the apps send; a node runs no others (e.g. Browser.* or
+# Target.* commands that reach beyond the caller's own page)
+ALLOWED_CDP_COMMANDS = frozenset(REPLACED_COMMANDS + CUMULATIVE_COMMANDS + (
+    'Page.captureScreenshot', 'Page.getLayoutMetrics', 'Page.getFrameTree',
+    'Input.dispatchKeyEvent', 'Input.insertText',
+    'Network.getAllCookies', 'DOMStorage.getDOMStorageItems'
+))
+
+
+class BrowserWorkerError(Exception):
+    """A browser worker call failed, or no node could take a session"""
+    pass
+
+
+def is_loopback(host: str) -> bool:
+    """Whether a listen address is reachable from this machine only"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def server_tls_context(certfile: str, keyfile: Optional[str] = None,
+                       client_ca: Optional[str] = None) -> ssl.SSLContext:
+    """
+    TLS context for a node
+
+    Args:
+        certfile: PEM certificate chain (and key, unless keyfile is given)
+        keyfile: PEM private key
+        client_ca: CA bundle that app certificates must chain to; without it
+            clients aren't asked for one
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    if client_ca:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(client_ca)
+    return context
+
+
+def client_tls_context(ca_file: str, certfile: Optional[str] = None,
+                       keyfile: Optional[str] = None) -> ssl.SSLContext:
+    """
+    TLS context for the apps' connections to nodes
+
+    Args:
+        ca_file: CA bundle the nodes' certificates must chain to; node
+            addresses are checked against them
+        certfile: PEM client certificate, for nodes that require one
+        keyfile: PEM private key of the client certificate
+    """
+    context = ssl.create_default_context(cafile=ca_file)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    if certfile:
+        context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def send_message(sock: socket.socket, message: Dict, attachment: bytes = b'') -> None:
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body), len(attachment)) + body + attachment)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict, bytes]:
+    """
+    Read one message
+
+    Raises:
+        ConnectionError: The peer closed the connection or sent an oversized message
+        socket.timeout: No message started within the socket's timeout
+    """
+    body_size, attachment_size = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if body_size + attachment_size > MAX_MESSAGE_BYTES:
+        raise ConnectionError('Message too large')
+    try:
+        message = json.loads(_recv_exactly(sock, body_size))
+        return message, _recv_exactly(sock, attachment_size) if attachment_size else b''
+    except socket.timeout as e:
+        # Part of the message is read, so the connection can't be used further
+        raise ConnectionError('Timed out in the middle of a message') from e
+
+
+class BrowserWorkerServer(socketserver.ThreadingTCPServer):
+    """Serves Chrome drivers to apps, one thread per connection"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], launch_driver: Callable[[], object],
+                 max_drivers: Optional[int] = None, token: Optional[str] = None,
+                 tls: Optional[ssl.SSLContext] = None):
+        """
+        Initialize browser worker server
+
+        Args:
+            address: (host, port) to listen on
+            launch_driver: Starts a configured Chrome driver
+            max_drivers: Driver limit (BROWSER_WORKER_MAX_DRIVERS env var, default 20)
+            token: Shared secret clients must present (BROWSER_WORKER_TOKEN env var)
+            tls: Context from server_tls_context (built from the BROWSER_WORKER_TLS_CERT,
+                BROWSER_WORKER_TLS_KEY and BROWSER_WORKER_TLS_CLIENT_CA env vars)
+
+        Raises:
+            BrowserWorkerError: Listening beyond loopback without a token or TLS
+        """
+        env = os.environ
+        self.launch_driver = launch_driver
+        self.max_drivers = max_drivers or int(env.get('BROWSER_WORKER_MAX_DRIVERS', DEFAULT_MAX_DRIVERS))
+        self.token = token if token is not None else env.get('BROWSER_WORKER_TOKEN', '')
+        if tls is None and env.get('BROWSER_WORKER_TLS_CERT'):
+            tls = server_tls_context(env['BROWSER_WORKER_TLS_CERT'], env.get('BROWSER_WORKER_TLS_KEY') or None,
+                                     env.get('BROWSER_WORKER_TLS_CLIENT_CA') or None)
+        self.tls = tls
+        # Anyone who can connect can drive the node's Chromes, and anyone on
+        # the path could read the token, pages and screenshots
+        if not is_loopback(address[0]):
+            where = address[0] or 'all addresses'
+            if not self.token:
+                raise BrowserWorkerError(f'Set BROWSER_WORKER_TOKEN to listen on {where}')
+            if self.tls is None:
+                raise BrowserWorkerError(f'Set BROWSER_WORKER_TLS_CERT to listen on {where}')
+        self.drivers: Dict[int, object] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        super().__init__(address, WorkerConnection)
+
+    def get_request(self):
+        sock, client_address = super().get_request()
+        if self.tls is not None:
+            # The handshake runs in the connection's thread, not the accept loop
+            sock = self.tls.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, client_address
+
+    def open_driver(self) -> int:
+        with self._lock:
+            if len(self.drivers) >= self.max_drivers:
+                raise BrowserWorkerError('Browser worker is full')
+            self._next_id += 1
+            driver_id = self._next_id
+            self.drivers[driver_id] = None  # reserved while Chrome starts
+        try:
+            driver = self.launch_driver()
+            driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        except Exception:
+            with self._lock:
+                del self.drivers[driver_id]
+            raise
+        with self._lock:
+            self.drivers[driver_id] = driver
+        return driver_id
+
+    def quit_driver(self, driver_id: int) -> None:
+        with self._lock:
+            driver = self.drivers.pop(driver_id, None)
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            drivers = [driver for driver in self.drivers.values() if driver is not None]
+            count = len(self.drivers)
+        return {
+            'drivers': count,
+            'max_drivers': self.max_drivers,
+            'rss': sum(process_tree_rss(driver_pid(driver)) for driver in drivers)
+        }
+
+    def call(self, driver_id: int, method: str, params: Dict) -> Tuple[object, bytes]:
+        """Run one driver operation, returning (JSON result, binary attachment)"""
+        with self._lock:
+            driver = self.drivers.get(driver_id)
+        if driver is None:
+            raise BrowserWorkerError('Unknown driver')
+
+        if method == 'get':
+            driver.get(params['url'])
+        elif method == 'execute_script':
+            return driver.execute_script(params['script'], *params.get('args', [])), b''
+        elif method == 'execute_cdp_cmd':
+            if params['cmd'] not in ALLOWED_CDP_COMMANDS:
+                raise BrowserWorkerError(f"DevTools command not allowed: {params['cmd']}")
+            result = driver.execute_cdp_cmd(params['cmd'], params.get('params', {}))
+            if params['cmd'] == 'Page.captureScreenshot':
+                return {}, base64.b64decode(result['data'])
+            return result, b''
+        elif method in ('current_url', 'page_source', 'title'):
+            return getattr(driver, method), b''
+        elif method == 'screenshot':
+            return None, driver.get_screenshot_as_png()
+        elif method == 'send_keys':
+            driver.switch_to.active_element.send_keys(params['text'])
+        else:
+            raise BrowserWorkerError(f'Unknown method: {method}')
+        return None, b''
+
+
+class WorkerConnection(socketserver.BaseRequestHandler):
+    """One client connection and the drivers it opened"""
+
+    def handle(self) -> None:
+        server: BrowserWorkerServer = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        drivers: List[int] = []
+        try:
+            if server.tls is not None:
+                sock.settimeout(CONNECT_TIMEOUT)
+                sock.do_handshake()
+                sock.settimeout(None)
+            hello, _ = recv_message(sock)
+            if hello.get('method') != 'hello' or not hmac.compare_digest(str(hello.get('token', '')), server.token):
+                send_message(sock, {'error': 'Not authorized'})
+                return
+            send_message(sock, {'result': None})
+
+            while True:
+                message, _ = recv_message(sock)
+                method = message.get('method')
+                attachment = b''
+                try:
+                    if method == 'stats':
+                        result = server.stats()
+                    elif method == 'open':
+                        driver_id = server.open_driver()
+                        drivers.append(driver_id)
+                        result = {'driver': driver_id}
+                    elif method == 'quit':
+                        driver_id = message['driver']
+                        if driver_id in drivers:
+                            drivers.remove(driver_id)
+                            server.quit_driver(driver_id)
+                        result = None
+                    elif message.get('driver') in drivers:
+                        result, attachment = server.call(message['driver'], method, message.get('params', {}))
+                    else:
+                        raise BrowserWorkerError('Unknown driver')
+                except Exception as e:
+                    send_message(sock, {'error': str(e) or type(e).__name__})
+                    continue
+                send_message(sock, {'result': result}, attachment)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            for driver_id in drivers:
+                server.quit_driver(driver_id)
+
+
+def connect(node: str, token: str = '', tls: Optional[ssl.SSLContext] = None) -> socket.socket:
+    """
+    Open an authorized connection to a node
+
+    Args:
+        node: 'host:port'
+        token: The node's shared secret
+        tls: Context from client_tls_context, for nodes that listen beyond loopback
+    """
+    host, _, port = node.rpartition(':')
+    sock = socket.create_connection((host, int(port)), timeout=CONNECT_TIMEOUT)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if tls is not None:
+        try:
+            sock = tls.wrap_socket(sock, server_hostname=host)
+        except OSError:
+            sock.close()
+            raise
+    sock.settimeout(CALL_TIMEOUT)
+    send_message(sock, {'method': 'hello', 'token': token})
+    reply, _ = recv_message(sock)
+    if 'error' in reply:
+        sock.close()
+        raise BrowserWorkerError(f"{node}: {reply['error']}")
+    return sock
+
+
+class RemoteSwitchTo:
+    def __init__(self, driver: 'RemoteDriver'):
+        self.driver = driver
+
+    @property
+    def active_element(self) -> 'RemoteElement':
+        return RemoteElement(self.driver)
+
+
+class RemoteElement:
+    """The focused element of a RemoteDriver, for send_keys"""
+
+    def __init__(self, driver: 'RemoteDriver'):
+        self.driver = driver
+
+    def send_keys(self, text: str) -> None:
+        self.driver._call('send_keys', {'text': text})
+
+
+class RemoteDriver:
+    """
+    A driver on a browser worker node, with the subset of the Selenium
+    WebDriver interface the apps use
+
+    The session stays on its node while the node answers. If the connection
+    fails, the driver moves to another node, replays its viewport, init
+    scripts, cookies it was given and blocked URLs, reloads the last page and
+    retries the call. Cookies the page set itself on the lost node are gone.
+    """
+
+    def __init__(self, pool: 'RemoteBrowserPool', node: str):
+        self.pool = pool
+        self.switch_to = RemoteSwitchTo(self)
+        self.url: Optional[str] = None
+        self.closed = False
+        self._replaced: Dict[str, dict] = {}
+        self._cumulative: List[Tuple[str, dict]] = []
+        # Replies still owed by the node for calls that timed out
+        self._late_replies = 0
+        self._lock = threading.Lock()
+        self._open(node)
+
+    # Not a Selenium driver: Chrome runs on another machine
+    service = None
+    capabilities: Dict = {}
+
+    def _open(self, node: str) -> None:
+        sock = connect(node, self.pool.token, self.pool.tls)
+        try:
+            send_message(sock, {'method': 'open'})
+            reply, _ = recv_message(sock)
+        except (ConnectionError, OSError) as e:
+            sock.close()
+            raise BrowserWorkerError(f'{node}: {e}') from e
+        if 'error' in reply:
+            sock.close()
+            raise BrowserWorkerError(f"{node}: {reply['error']}")
+        self.node = node
+        self._sock = sock
+        self._late_replies = 0
+        self._driver_id = reply['result']['driver']
+        self.pool.opened(node)
+
+    def _request(self, method: str, params: Optional[dict]) -> Tuple[object, bytes]:
+        # Replies to timed out calls arrive first, in order; skip them
+        while self._late_replies:
+            recv_message(self._sock)
+            self._late_replies -= 1
+        send_message(self._sock, {'method': method, 'driver': self._driver_id, 'params': params or {}})
+        try:
+            reply, attachment = recv_message(self._sock)
+        except socket.timeout:
+            self._late_replies += 1
+            raise
+        if 'error' in reply:
+            raise BrowserWorkerError(reply['error'])
+        return reply['result'], attachment
+
+    def _call(self, method: str, params: Optional[dict] = None) -> Tuple[object, bytes]:
+        with self._lock:
+            if self.closed:
+                raise BrowserWorkerError('Driver is closed')
+            try:
+                try:
+                    return self._request(method, params)
+                except socket.timeout:
+                    raise
+                except (ConnectionError, OSError) as e:
+                    print(f"Browser worker {self.node} failed ({e}), moving session")
+                    # A failed navigation is simply retried, no need to load the old page first
+                    self._migrate(reload=method != 'get')
+                    return self._request(method, params)
+            except socket.timeout as e:
+                # A slow page, not a dead node: the node still answers, later
+                metrics.incr('browser.worker_call_timeouts')
+                raise BrowserWorkerError(f'{self.node}: {method} timed out') from e
+
+    def _migrate(self, reload: bool = True) -> None:
+        """Reopen on a live node and restore what the session had (caller holds _lock)"""
+        failed = self.node
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        self.pool.closed(failed)
+        self.pool.mark_down(failed)
+        self._open(self.pool.place())
+        metrics.incr('browser.worker_migrations')
+
+        for cmd, params in list(self._replaced.items()) + self._cumulative:
+            try:
+                self._request('execute_cdp_cmd', {'cmd': cmd, 'params': params})
+            except (BrowserWorkerError, socket.timeout) as e:
+                print(f"Could not replay {cmd} after migration: {e}")
+        if reload and self.url:
+            try:
+                self._request('get', {'url': self.url})
+            except (BrowserWorkerError, socket.timeout) as e:
+                print(f"Could not reload page after migration: {e}")
+
+    def get(self, url: str) -> None:
+        self.url = url
+        self._call('get', {'url': url})
+
+    def execute_script(self, script: str, *args):
+        return self._call('execute_script', {'script': script, 'args': list(args)})[0]
+
+    def execute_cdp_cmd(self, cmd: str, params: Optional[dict] = None) -> dict:
+        params = params or {}
+        if cmd in REPLACED_COMMANDS:
+            self._replaced[cmd] = params
+        elif cmd in CUMULATIVE_COMMANDS:
+            self._cumulative.append((cmd, params))
+        result, attachment = self._call('execute_cdp_cmd', {'cmd': cmd, 'params': params})
+        if cmd == 'Page.captureScreenshot':
+            return {'data': base64.b64encode(attachment).decode('ascii')}
+        return result
+
+    @property
+    def current_url(self) -> str:
+        return self._call('current_url')[0]
+
+    @property
+    def page_source(self) -> str:
+        return self._call('page_source')[0]
+
+    @property
+    def title(self) -> str:
+        return self._call('title')[0]
+
+    def get_screenshot_as_png(self) -> bytes:
+        return self._call('screenshot')[1]
+
+    def devtools_session(self):
+        """DevTools events are not relayed; screencast and settle detection fall back to polling"""
+        raise DevToolsError('DevTools events are not available for remote browsers')
+
+    def host_pid(self) -> Optional[int]:
+        """Chrome runs on the node, so there is no local process to sample"""
+        return None
+
+    def estimated_rss(self) -> int:
+        """This session's share of its node's Chrome memory"""
+        return self.pool.rss_share(self.node)
+
+    def quit(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                send_message(self._sock, {'method': 'quit', 'driver': self._driver_id})
+                recv_message(self._sock)
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                self._sock.close()
+                self.pool.closed(self.node)
+
+
+class RemoteBrowserPool:
+    """
+    Places new sessions on the least loaded of a list of browser worker nodes
+
+    Load is the node's reported drivers over its limit, refreshed every few
+    seconds and adjusted locally for sessions opened or closed in between.
+    Nodes that fail are skipped for a while. Drop-in for DriverPool.checkout
+    as a BrowserManager driver source.
+    """
+
+    def __init__(self, nodes: Optional[List[str]] = None, token: Optional[str] = None,
+                 tls: Optional[ssl.SSLContext] = None):
+        """
+        Initialize remote browser pool
+
+        Args:
+            nodes: 'host:port' addresses (BROWSER_WORKER_NODES env var, comma-separated)
+            token: Shared secret of the nodes (BROWSER_WORKER_TOKEN env var)
+            tls: Context from client_tls_context (built from the BROWSER_WORKER_TLS_CA,
+                BROWSER_WORKER_CLIENT_CERT and BROWSER_WORKER_CLIENT_KEY env vars)
+
+        Raises:
+            BrowserWorkerError: A node beyond loopback and no TLS to reach it with
+        """
+        env = os.environ
+        if nodes is None:
+            nodes = [node.strip() for node in env.get('BROWSER_WORKER_NODES', '').split(',') if node.strip()]
+        self.nodes = nodes
+        self.token = token if token is not None else env.get('BROWSER_WORKER_TOKEN', '')
+        if tls is None and env.get('BROWSER_WORKER_TLS_CA'):
+            tls = client_tls_context(env['BROWSER_WORKER_TLS_CA'], env.get('BROWSER_WORKER_CLIENT_CERT') or None,
+                                     env.get('BROWSER_WORKER_CLIENT_KEY') or None)
+        self.tls = tls
+        # The token would cross the network in the clear
+        remote = [node for node in nodes if not is_loopback(node.rpartition(':')[0])]
+        if remote and self.tls is None:
+            raise BrowserWorkerError(f'Set BROWSER_WORKER_TLS_CA to reach {", ".join(remote)}')
+        self._stats: Dict[str, Tuple[float, Dict]] = {}
+        self._down: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark_down(self, node: str) -> None:
+        with self._lock:
+            self._down[node] = time.time() + NODE_RETRY_AFTER
+            self._stats.pop(node, None)
+        metrics.incr('browser.worker_node_failures')
+
+    def _is_down(self, node: str) -> bool:
+        return self._down.get(node, 0) > time.time()
+
+    def node_stats(self, node: str) -> Optional[Dict]:
+        """A node's load report, or None if it is unreachable"""
+        with self._lock:
+            cached = self._stats.get(node)
+            if cached and time.time() - cached[0] < STATS_MAX_AGE:
+                return cached[1]
+        try:
+            sock = connect(node, self.token, self.tls)
+            try:
+                send_message(sock, {'method': 'stats'})
+                reply, _ = recv_message(sock)
+            finally:
+                sock.close()
+        except (BrowserWorkerError, ConnectionError, OSError) as e:
+            print(f"Browser worker {node} unreachable: {e}")
+            self.mark_down(node)
+            return None
+        stats = reply.get('result')
+        with self._lock:
+            self._stats[node] = (time.time(), stats)
+            self._down.pop(node, None)
+        return stats
+
+    def _adjust(self, node: str, delta: int) -> None:
+        with self._lock:
+            cached = self._stats.get(node)
+            if cached:
+                cached[1]['drivers'] = max(cached[1]['drivers'] + delta, 0)
+
+    def opened(self, node: str) -> None:
+        self._adjust(node, 1)
+
+    def closed(self, node: str) -> None:
+        self._adjust(node, -1)
+
+    def place(self) -> str:
+        """
+        Pick the node with the lowest load that has room
+
+        Raises:
+            BrowserWorkerError: Every node is down or full
+        """
+        best, best_load = None, None
+        for node in self.nodes:
+            if self._is_down(node):
+                continue
+            stats = self.node_stats(node)
+            if not stats or stats['drivers'] >= stats['max_drivers']:
+                continue
+            load = stats['drivers'] / stats['max_drivers']
+            if best_load is None or load < best_load:
+                best, best_load = node, load
+        if best is None:
+            raise BrowserWorkerError('No browser worker has capacity')
+        return best
+
+    def checkout(self) -> RemoteDriver:
+        """Open a driver for a new session on the least loaded node"""
+        for _ in range(len(self.nodes)):
+            node = self.place()
+            try:
+                with metrics.timer('browser.worker_open_seconds'):
+                    return RemoteDriver(self, node)
+            except (BrowserWorkerError, ConnectionError, OSError) as e:
+                print(f"Could not open a browser on {node}: {e}")
+                self.mark_down(node)
+        raise BrowserWorkerError('No browser worker could start a browser')
+
+    def rss_share(self, node: str) -> int:
+        with self._lock:
+            cached = self._stats.get(node)
+        if not cached or not cached[1]['drivers']:
+            return 0
+        return cached[1]['rss'] // cached[1]['drivers']
+
+    def stats(self) -> Dict:
+        nodes = []
+        for node in self.nodes:
+            stats = None if self._is_down(node) else self.node_stats(node)
+            nodes.append(dict(stats or {}, node=node, up=stats is not None))
+        return {'nodes': nodes, 'sessions': sum(node.get('drivers', 0) for node in nodes)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Chrome drivers for the proxy apps')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (0.0.0.0 for other machines)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-drivers', type=int, default=None)
+    parser.add_argument('--launcher', default='app_advanced:launch_driver',
+                        help='module:function that starts a configured Chrome')
+    parser.add_argument('--tls-cert', default=os.environ.get('BROWSER_WORKER_TLS_CERT'),
+                        help='PEM certificate chain; required beyond loopback')
+    parser.add_argument('--tls-key', default=os.environ.get('BROWSER_WORKER_TLS_KEY'),
+                        help='PEM private key, if not in the certificate file')
+    parser.add_argument('--tls-client-ca', default=os.environ.get('BROWSER_WORKER_TLS_CLIENT_CA'),
+                        help='CA bundle; when set, apps must present a certificate it signed')
+    options = parser.parse_args(argv)
+
+    sys.path.insert(0, os.getcwd())
+    from serve import load_app
+    launch_driver = load_app(options.launcher)
+
+    try:
+        tls = (server_tls_context(options.tls_cert, options.tls_key, options.tls_client_ca)
+               if options.tls_cert else None)
+        server = BrowserWorkerServer((options.host, options.port), launch_driver, options.max_drivers, tls=tls)
+    except (BrowserWorkerError, OSError) as e:
+        parser.error(str(e))
+    scheme = 'TLS' if server.tls else 'plain TCP'
+    print(f"Browser worker on {options.host}:{options.port} over {scheme} (up to {server.max_drivers} drivers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for driver_id in list(server.drivers):
+            server.quit_driver(driver_id)
+
+
+if __name__ == '__main__':
+    main()
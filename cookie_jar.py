@@ -0,0 +1,461 @@
+"""
+Server-Side Cookie Jar Module
+Keeps upstream cookies on the proxy instead of the client, so only the cookies
+that RFC 6265 says belong to a request are forwarded to the origin
+"""
+
+import ipaddress
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from shared_store import SharedStore
+
+# Seconds between a worker's writes of a session's last use to the shared
+# store when it only reads the jar, and between purges of expired sessions
+TOUCH_INTERVAL = 60
+PURGE_INTERVAL = 300
+
+
+class StoredCookie:
+    """A single upstream cookie, kept as small as possible"""
+
+    __slots__ = ('name', 'value', 'domain', 'path', 'host_only',
+                 'secure', 'expires', 'created')
+
+    def __init__(self, name: str, value: str, domain: str, path: str,
+                 host_only: bool, secure: bool, expires: Optional[float]):
+        self.name = name
+        self.value = value
+        self.domain = domain
+        self.path = path
+        self.host_only = host_only
+        self.secure = secure
+        self.expires = expires
+        self.created = time.time()
+
+    def is_expired(self, now: float) -> bool:
+        return self.expires is not None and self.expires <= now
+
+    def size(self) -> int:
+        return len(self.name) + len(self.value) + len(self.domain) + len(self.path)
+
+    def to_list(self) -> list:
+        return [self.name, self.value, self.domain, self.path,
+                self.host_only, self.secure, self.expires, self.created]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'StoredCookie':
+        cookie = cls(*values[:7])
+        cookie.created = values[7]
+        return cookie
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+        return True
+    except ValueError:
+        return False
+
+
+def domain_match(host: str, domain: str) -> bool:
+    """RFC 6265 section 5.1.3 domain matching"""
+    if host == domain:
+        return True
+    return host.endswith('.' + domain) and not _is_ip_address(host)
+
+
+def path_match(request_path: str, cookie_path: str) -> bool:
+    """RFC 6265 section 5.1.4 path matching"""
+    if request_path == cookie_path:
+        return True
+    if request_path.startswith(cookie_path):
+        return cookie_path.endswith('/') or request_path[len(cookie_path)] == '/'
+    return False
+
+
+def default_path(request_path: str) -> str:
+    """RFC 6265 section 5.1.4 default-path of a request URI"""
+    if not request_path.startswith('/') or request_path.count('/') == 1:
+        return '/'
+    return request_path[:request_path.rindex('/')]
+
+
+def parse_set_cookie(header: str, request_url: str, now: float = None) -> Optional[StoredCookie]:
+    """
+    Parse a Set-Cookie header following the RFC 6265 section 5.2/5.3 algorithm
+
+    Args:
+        header: Raw Set-Cookie header value
+        request_url: URL of the request that produced the header
+
+    Returns:
+        StoredCookie, or None if the header must be ignored
+    """
+    now = now or time.time()
+    parsed = urlparse(request_url)
+    host = (parsed.hostname or '').lower()
+    request_path = parsed.path or '/'
+
+    pair, _, unparsed_attributes = header.partition(';')
+    if '=' not in pair:
+        return None
+    name, _, value = pair.partition('=')
+    name = name.strip()
+    value = value.strip()
+    if not name:
+        return None
+
+    domain = ''
+    path = None
+    secure = False
+    expires = None
+    max_age = None
+
+    for attribute in unparsed_attributes.split(';'):
+        key, _, attr_value = attribute.partition('=')
+        key = key.strip().lower()
+        attr_value = attr_value.strip()
+
+        if key == 'expires':
+            try:
+                expires = parsedate_to_datetime(attr_value).timestamp()
+            except (TypeError, ValueError, IndexError):
+                pass
+        elif key == 'max-age':
+            try:
+                max_age = int(attr_value)
+            except ValueError:
+                pass
+        elif key == 'domain' and attr_value:
+            domain = attr_value.lstrip('.').lower()
+        elif key == 'path' and attr_value.startswith('/'):
+            path = attr_value
+        elif key == 'secure':
+            secure = True
+
+    # Max-Age wins over Expires
+    if max_age is not None:
+        expires = now + max_age if max_age > 0 else now
+
+    if domain:
+        if not domain_match(host, domain):
+            return None
+        # Refuse cookies scoped to a bare top-level domain
+        if '.' not in domain and domain != host:
+            return None
+        host_only = False
+    else:
+        domain = host
+        host_only = True
+
+    if secure and parsed.scheme != 'https':
+        return None
+
+    return StoredCookie(name, value, domain, path or default_path(request_path),
+                        host_only, secure, expires)
+
+
+class CookieJarStore:
+    """
+    Per-session, per-upstream-domain cookie storage
+
+    Cookies are grouped by the domain they are scoped to, so a lookup only has
+    to walk the request host and its parent domains. Whole sessions are evicted
+    least-recently-used first once the store is full.
+
+    When a shared store is given, every cookie is a row keyed by (session,
+    domain, name, path) that any worker process can read. An update re-reads
+    and rewrites the session's rows in one IMMEDIATE transaction, so parallel
+    responses for the same client in different workers don't overwrite each
+    other. Each session has a version that every update bumps; workers keep
+    their own copy of a jar and only reload it when the version changed.
+    """
+
+    SESSION_COOKIE_NAME = 'proxy_sid'
+
+    def __init__(self, max_sessions: int = 5000, max_cookies_per_session: int = 400,
+                 max_bytes_per_session: int = 256 * 1024, idle_timeout: int = 86400,
+                 shared_store: Optional[SharedStore] = None):
+        """
+        Initialize cookie jar store
+
+        Args:
+            max_sessions: Number of client sessions kept before LRU eviction
+            max_cookies_per_session: Cookie cap per session
+            max_bytes_per_session: Approximate storage cap per session
+            idle_timeout: Seconds before an unused session is dropped
+            shared_store: Optional store shared with other worker processes
+        """
+        self.max_sessions = max_sessions
+        self.max_cookies_per_session = max_cookies_per_session
+        self.max_bytes_per_session = max_bytes_per_session
+        self.idle_timeout = idle_timeout
+        self.shared_store = shared_store
+
+        # session id -> {'domains': {domain: {(name, path): StoredCookie}}, 'last_access': float,
+        #                'version': shared version the copy was loaded at}
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._purged = 0.0
+
+        if shared_store is not None:
+            shared_store.execute(
+                'CREATE TABLE IF NOT EXISTS jar_cookies ('
+                ' session_id TEXT NOT NULL, domain TEXT NOT NULL, name TEXT NOT NULL, path TEXT NOT NULL,'
+                ' value TEXT NOT NULL, host_only INTEGER NOT NULL, secure INTEGER NOT NULL,'
+                ' expires REAL, created REAL NOT NULL, PRIMARY KEY (session_id, domain, name, path))'
+            )
+            shared_store.execute(
+                'CREATE TABLE IF NOT EXISTS jar_sessions ('
+                ' session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, last_access REAL NOT NULL)'
+            )
+
+    @staticmethod
+    def new_session_id() -> str:
+        """Generate a new opaque session id for the client cookie"""
+        return secrets.token_urlsafe(16)
+
+    def _load_shared(self, session_id: str) -> Dict:
+        """Read a session's domains from the shared store"""
+        rows = self.shared_store.execute(
+            'SELECT name, value, domain, path, host_only, secure, expires, created'
+            ' FROM jar_cookies WHERE session_id = ?', (session_id,)
+        ).fetchall()
+        domains = {}
+        for name, value, domain, path, host_only, secure, expires, created in rows:
+            cookie = StoredCookie.from_list([name, value, domain, path, bool(host_only), bool(secure),
+                                             expires, created])
+            domains.setdefault(domain, {})[(name, path)] = cookie
+        return domains
+
+    def _shared_session(self, session_id: str, now: float) -> Optional[tuple]:
+        """(version, last_access) of a session in the shared store, or None if it has none or expired"""
+        row = self.shared_store.execute(
+            'SELECT version, last_access FROM jar_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None or now - row[1] > self.idle_timeout:
+            return None
+        return row
+
+    def _remember(self, session_id: str, domains: Dict, now: float, version: Optional[int] = None) -> Dict:
+        """Keep a session's jar in this process, evicting the least recently used (caller holds _lock)"""
+        jar = {'domains': domains, 'last_access': now, 'version': version, 'touched': now}
+        self._sessions[session_id] = jar
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return jar
+
+    def _get_session(self, session_id: str) -> Optional[Dict]:
+        """This process's copy of a session's jar, reloaded if another worker changed it (caller holds _lock)"""
+        now = time.time()
+        jar = self._sessions.get(session_id)
+
+        if self.shared_store is not None:
+            shared = self._shared_session(session_id, now)
+            if shared is None:
+                # Never stored, cleared or expired, possibly by another worker
+                self._sessions.pop(session_id, None)
+                return None
+            version, last_access = shared
+            if jar is None or jar['version'] != version:
+                jar = self._remember(session_id, self._load_shared(session_id), now, version)
+                jar['touched'] = last_access
+            if now - jar['touched'] > TOUCH_INTERVAL:
+                # Keep a session that is only being read from expiring
+                self.shared_store.execute('UPDATE jar_sessions SET last_access = ? WHERE session_id = ?',
+                                          (now, session_id))
+                jar['touched'] = now
+        elif jar is not None and now - jar['last_access'] > self.idle_timeout:
+            del self._sessions[session_id]
+            return None
+
+        if jar is not None:
+            self._sessions.move_to_end(session_id)
+            jar['last_access'] = now
+        return jar
+
+    def _merge(self, domains: Dict, request_url: str, set_cookie_headers: List[str], now: float) -> None:
+        """Apply Set-Cookie headers to a session's domains and enforce its limits"""
+        for header in set_cookie_headers:
+            cookie = parse_set_cookie(header, request_url, now)
+            if cookie is None:
+                continue
+
+            bucket = domains.setdefault(cookie.domain, {})
+            key = (cookie.name, cookie.path)
+            if cookie.is_expired(now):
+                bucket.pop(key, None)
+                if not bucket:
+                    del domains[cookie.domain]
+                continue
+
+            existing = bucket.get(key)
+            if existing is not None:
+                cookie.created = existing.created
+            bucket[key] = cookie
+
+        self._enforce_limits(domains, now)
+
+    def store_from_headers(self, session_id: str, request_url: str,
+                           set_cookie_headers: List[str]) -> None:
+        """
+        Store cookies from an upstream response
+
+        Args:
+            session_id: Client session id
+            request_url: URL the upstream response belongs to
+            set_cookie_headers: Raw Set-Cookie header values
+        """
+        if not set_cookie_headers:
+            return
+
+        now = time.time()
+        if self.shared_store is not None:
+            self._store_shared(session_id, request_url, set_cookie_headers, now)
+            return
+
+        with self._lock:
+            jar = self._get_session(session_id)
+            if jar is None:
+                jar = self._remember(session_id, {}, now)
+            self._merge(jar['domains'], request_url, set_cookie_headers, now)
+
+    def _store_shared(self, session_id: str, request_url: str, set_cookie_headers: List[str],
+                      now: float) -> None:
+        """Merge cookies into the shared rows as one transaction, then refresh this process's copy"""
+        with self.shared_store.transaction() as conn:
+            # Re-read under the write lock: another worker may have just added cookies
+            shared = self._shared_session(session_id, now)
+            domains = self._load_shared(session_id) if shared is not None else {}
+            self._merge(domains, request_url, set_cookie_headers, now)
+
+            conn.execute('DELETE FROM jar_cookies WHERE session_id = ?', (session_id,))
+            conn.executemany(
+                'INSERT INTO jar_cookies (session_id, domain, name, path, value, host_only, secure,'
+                ' expires, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(session_id, cookie.domain, cookie.name, cookie.path, cookie.value, int(cookie.host_only),
+                  int(cookie.secure), cookie.expires, cookie.created)
+                 for bucket in domains.values() for cookie in bucket.values()]
+            )
+            version = shared[0] + 1 if shared is not None else 1
+            conn.execute('INSERT OR REPLACE INTO jar_sessions (session_id, version, last_access) VALUES (?, ?, ?)',
+                         (session_id, version, now))
+
+            if now - self._purged > PURGE_INTERVAL:
+                self._purged = now
+                expired = now - self.idle_timeout
+                conn.execute('DELETE FROM jar_cookies WHERE session_id IN'
+                             ' (SELECT session_id FROM jar_sessions WHERE last_access < ?)', (expired,))
+                conn.execute('DELETE FROM jar_sessions WHERE last_access < ?', (expired,))
+
+        with self._lock:
+            self._remember(session_id, domains, now, version)
+
+    def _enforce_limits(self, domains: Dict, now: float) -> None:
+        """Drop expired cookies, then the oldest ones until the session fits"""
+        cookies = []
+        for domain, bucket in list(domains.items()):
+            for key, cookie in list(bucket.items()):
+                if cookie.is_expired(now):
+                    del bucket[key]
+                else:
+                    cookies.append(cookie)
+            if not bucket:
+                del domains[domain]
+
+        total_bytes = sum(cookie.size() for cookie in cookies)
+        if len(cookies) <= self.max_cookies_per_session and total_bytes <= self.max_bytes_per_session:
+            return
+
+        cookies.sort(key=lambda c: c.created)
+        while cookies and (len(cookies) > self.max_cookies_per_session
+                           or total_bytes > self.max_bytes_per_session):
+            oldest = cookies.pop(0)
+            total_bytes -= oldest.size()
+            bucket = domains[oldest.domain]
+            del bucket[(oldest.name, oldest.path)]
+            if not bucket:
+                del domains[oldest.domain]
+
+    def cookie_header(self, session_id: str, request_url: str) -> Optional[str]:
+        """
+        Build the Cookie header for an upstream request
+
+        Args:
+            session_id: Client session id
+            request_url: URL about to be requested
+
+        Returns:
+            Cookie header value, or None if no cookie applies
+        """
+        if not session_id:
+            return None
+
+        parsed = urlparse(request_url)
+        host = (parsed.hostname or '').lower()
+        request_path = parsed.path or '/'
+        is_secure = parsed.scheme == 'https'
+        now = time.time()
+
+        with self._lock:
+            jar = self._get_session(session_id)
+            if jar is None:
+                return None
+            domains = jar['domains']
+
+            # Candidate domains are the host itself and each parent domain
+            candidates = [host]
+            if not _is_ip_address(host):
+                labels = host.split('.')
+                candidates.extend('.'.join(labels[i:]) for i in range(1, len(labels)))
+
+            matches = []
+            for domain in candidates:
+                bucket = domains.get(domain)
+                if not bucket:
+                    continue
+                for cookie in bucket.values():
+                    if cookie.host_only and cookie.domain != host:
+                        continue
+                    if cookie.secure and not is_secure:
+                        continue
+                    if cookie.is_expired(now):
+                        continue
+                    if not path_match(request_path, cookie.path):
+                        continue
+                    matches.append(cookie)
+
+        if not matches:
+            return None
+
+        # Longer paths first, then earlier creation time
+        matches.sort(key=lambda c: (-len(c.path), c.created))
+        return '; '.join(f'{cookie.name}={cookie.value}' for cookie in matches)
+
+    def clear_session(self, session_id: str) -> None:
+        """Forget every cookie stored for a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.shared_store is not None:
+                self.shared_store.execute('DELETE FROM jar_cookies WHERE session_id = ?', (session_id,))
+                self.shared_store.execute('DELETE FROM jar_sessions WHERE session_id = ?', (session_id,))
+
+    def stats(self) -> Dict:
+        """Get store size information"""
+        with self._lock:
+            cookie_count = sum(
+                len(bucket)
+                for jar in self._sessions.values()
+                for bucket in jar['domains'].values()
+            )
+            return {
+                'sessions': len(self._sessions),
+                'cookies': cookie_count
+            }
@@ -69,6 +69,30 @@ class CryptoManager:
         decrypted = self.cipher.decrypt(encrypted_data)
         return json.loads(decrypted.decode())
 
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        """
+        Encrypt raw bytes
+
+        Args:
+            data: Bytes to encrypt
+
+        Returns:
+            Encrypted bytes
+        """
+        return self.cipher.encrypt(data)
+
+    def decrypt_bytes(self, encrypted_data: bytes) -> bytes:
+        """
+        Decrypt raw bytes
+
+        Args:
+            encrypted_data: Encrypted bytes
+
+        Returns:
+            Decrypted bytes
+        """
+        return self.cipher.decrypt(encrypted_data)
+
     def save_credentials(self, credentials: Dict) -> None:
         """
         Save credentials to encrypted file
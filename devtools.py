@@ -0,0 +1,261 @@
+"""
+DevTools Module
+Minimal Chrome DevTools Protocol client that attaches to a Selenium driver's
+page target over WebSocket, for event-driven features (screencast, network and
+DOM events) that chromedriver's request/response execute_cdp_cmd can't deliver
+"""
+
+import itertools
+import json
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+try:
+    import websocket  # websocket-client
+    DEVTOOLS_AVAILABLE = True
+except ImportError:
+    websocket = None
+    DEVTOOLS_AVAILABLE = False
+
+
+class DevToolsError(Exception):
+    """Raised when a DevTools connection or command fails"""
+
+
+def debugger_address(driver) -> Optional[str]:
+    """Get the host:port of a Chrome driver's remote debugging endpoint"""
+    try:
+        return driver.capabilities['goog:chromeOptions']['debuggerAddress']
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def page_targets(driver) -> List[dict]:
+    """List a Chrome driver's open tabs from /json, without going through chromedriver"""
+    address = debugger_address(driver)
+    if not address:
+        raise DevToolsError('Driver does not expose a debugger address')
+    targets = requests.get(f'http://{address}/json', timeout=5).json()
+    return [target for target in targets if target.get('type') == 'page']
+
+
+def page_websocket_url(driver) -> str:
+    """
+    Find the DevTools WebSocket URL of the driver's current tab
+
+    chromedriver window handles are DevTools target ids, so the current handle
+    identifies the page target in /json.
+    """
+    handle = driver.current_window_handle.upper()
+    pages = page_targets(driver)
+    for target in pages:
+        if target.get('id', '').upper() == handle:
+            return target['webSocketDebuggerUrl']
+    if pages:
+        return pages[0]['webSocketDebuggerUrl']
+    raise DevToolsError('No page target found')
+
+
+def browser_websocket_url(driver) -> str:
+    """Find the browser-level DevTools WebSocket URL of a Chrome driver"""
+    address = debugger_address(driver)
+    if not address:
+        raise DevToolsError('Driver does not expose a debugger address')
+    return requests.get(f'http://{address}/json/version', timeout=5).json()['webSocketDebuggerUrl']
+
+
+class DevToolsSession:
+    """
+    One WebSocket connection to a page or browser target
+
+    Commands may be sent from any thread. Event handlers run on the reader
+    thread and must not wait on command results; use send_nowait there.
+
+    On a browser-level connection, targets attached with flatten=True share
+    the socket: pass their session_id to commands and handlers, or use
+    target_session().
+    """
+
+    def __init__(self, ws_url: str, timeout: float = 10):
+        if not DEVTOOLS_AVAILABLE:
+            raise DevToolsError('websocket-client is not installed')
+
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._handlers: Dict[tuple, List[Callable[[dict], None]]] = {}
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.closed = False
+
+        try:
+            # Chrome rejects WebSocket clients that send an Origin header
+            # unless started with --remote-allow-origins
+            self._ws = websocket.create_connection(ws_url, timeout=timeout, suppress_origin=True)
+        except Exception as e:
+            raise DevToolsError(f'Could not connect to DevTools: {e}') from e
+        self._ws.settimeout(None)
+
+        self._reader = threading.Thread(target=self._read_loop, name='devtools-reader', daemon=True)
+        self._reader.start()
+
+    @classmethod
+    def for_driver(cls, driver, timeout: float = 10) -> 'DevToolsSession':
+        """Attach to a Selenium Chrome driver's current tab"""
+        return cls(page_websocket_url(driver), timeout)
+
+    @classmethod
+    def for_browser(cls, driver, timeout: float = 10) -> 'DevToolsSession':
+        """Attach to a Selenium Chrome driver's browser target"""
+        return cls(browser_websocket_url(driver), timeout)
+
+    def on(self, event: str, handler: Callable[[dict], None], session_id: Optional[str] = None) -> None:
+        """Register a handler for a DevTools event (e.g. Network.requestWillBeSent)"""
+        with self._lock:
+            self._handlers.setdefault((session_id, event), []).append(handler)
+
+    def off(self, event: str, handler: Callable[[dict], None], session_id: Optional[str] = None) -> None:
+        with self._lock:
+            handlers = self._handlers.get((session_id, event), [])
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def remove_session_handlers(self, session_id: str) -> None:
+        """Drop every handler registered for a target session"""
+        with self._lock:
+            for key in [key for key in self._handlers if key[0] == session_id]:
+                del self._handlers[key]
+
+    def target_session(self, session_id: str) -> 'TargetSession':
+        """View of one flattened target session with this class's interface"""
+        return TargetSession(self, session_id)
+
+    def _write(self, method: str, params: Optional[dict], session_id: Optional[str] = None) -> Future:
+        if self.closed:
+            raise DevToolsError('DevTools session is closed')
+
+        message_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[message_id] = future
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        message = json.dumps(message)
+        try:
+            with self._send_lock:
+                self._ws.send(message)
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(message_id, None)
+            self.close()
+            raise DevToolsError(f'DevTools send failed: {e}') from e
+        return future
+
+    def send(self, method: str, params: Optional[dict] = None, timeout: Optional[float] = None,
+             session_id: Optional[str] = None) -> dict:
+        """
+        Run a DevTools command and wait for its result
+
+        Raises:
+            DevToolsError: On protocol errors, timeouts or a closed connection
+        """
+        future = self._write(method, params, session_id)
+        try:
+            return future.result(timeout or self.timeout)
+        except DevToolsError:
+            raise
+        except Exception as e:
+            raise DevToolsError(f'{method} failed: {e}') from e
+
+    def send_nowait(self, method: str, params: Optional[dict] = None,
+                    session_id: Optional[str] = None) -> None:
+        """Send a command without waiting for the result (safe in event handlers)"""
+        self._write(method, params, session_id)
+
+    def _read_loop(self) -> None:
+        while not self.closed:
+            try:
+                raw = self._ws.recv()
+            except Exception:
+                break
+            if not raw:
+                continue
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+
+            if 'id' in message:
+                with self._lock:
+                    future = self._pending.pop(message['id'], None)
+                if future is not None:
+                    if 'error' in message:
+                        future.set_exception(DevToolsError(message['error'].get('message', 'DevTools error')))
+                    else:
+                        future.set_result(message.get('result', {}))
+                continue
+
+            key = (message.get('sessionId'), message.get('method'))
+            with self._lock:
+                handlers = list(self._handlers.get(key, ()))
+            for handler in handlers:
+                try:
+                    handler(message.get('params', {}))
+                except Exception as e:
+                    print(f"DevTools handler for {message.get('method')} failed: {e}")
+
+            # A closed page's handlers would otherwise keep its session alive
+            if message.get('method') == 'Target.detachedFromTarget':
+                detached = message.get('params', {}).get('sessionId')
+                if detached:
+                    self.remove_session_handlers(detached)
+
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(DevToolsError('DevTools session closed'))
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+
+
+class TargetSession:
+    """One flattened target session on a shared browser connection"""
+
+    def __init__(self, connection: DevToolsSession, session_id: str):
+        self.connection = connection
+        self.session_id = session_id
+        self.detached = False
+
+    @property
+    def closed(self) -> bool:
+        return self.detached or self.connection.closed
+
+    def on(self, event: str, handler: Callable[[dict], None]) -> None:
+        self.connection.on(event, handler, self.session_id)
+
+    def off(self, event: str, handler: Callable[[dict], None]) -> None:
+        self.connection.off(event, handler, self.session_id)
+
+    def send(self, method: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        return self.connection.send(method, params, timeout, self.session_id)
+
+    def send_nowait(self, method: str, params: Optional[dict] = None) -> None:
+        self.connection.send_nowait(method, params, self.session_id)
+
+    def close(self) -> None:
+        """Forget the session and its handlers; the shared connection stays open"""
+        self.detached = True
+        self.connection.remove_session_handlers(self.session_id)
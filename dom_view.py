@@ -0,0 +1,210 @@
+"""
+DOM View Module
+Serves a browser-rendered page as its post-JavaScript DOM instead of a
+screenshot: scripts and event handlers are stripped, links go back through
+/proxy and subresources are passed through /resource
+"""
+
+import html
+import os
+import re
+from typing import Dict, Optional
+from urllib.parse import quote, urlparse
+
+import requests
+from flask import Response, stream_with_context
+
+from link_rewriter import make_absolute_url, rewrite_links
+from metrics import metrics
+
+PROXY_VIEWS = ('screenshot', 'dom')
+
+# Scripts are stripped, and this also stops any the stripping misses
+DOM_VIEW_CSP = "script-src 'none'; object-src 'none'; frame-src 'none'; base-uri 'none'"
+
+RESOURCE_TIMEOUT = 30
+RESOURCE_CHUNK = 64 * 1024
+
+# Origin response headers worth passing through /resource
+RESOURCE_HEADERS = ('Content-Type', 'Cache-Control', 'Expires', 'ETag', 'Last-Modified',
+                    'Content-Range', 'Accept-Ranges')
+
+# Request headers passed to the origin for /resource
+FORWARD_HEADERS = ('Range', 'If-None-Match', 'If-Modified-Since', 'Accept')
+
+# /resource serves on the app's origin, so only subresource types that can't
+# run script pass: no HTML, SVG, XML or JavaScript
+RESOURCE_TYPE_PREFIXES = ('image/', 'font/', 'audio/', 'video/')
+RESOURCE_TYPES = ('text/css', 'application/font-woff', 'application/font-sfnt',
+                  'application/vnd.ms-fontobject', 'application/x-font-ttf', 'application/x-font-otf')
+SCRIPTABLE_TYPES = ('image/svg+xml',)
+
+# Types a page shows inline; anything else is marked as a download in case
+# it is opened directly
+INLINE_TYPE_PREFIXES = ('image/', 'font/', 'application/font-', 'application/x-font-',
+                        'application/vnd.ms-fontobject')
+
+# Sent with every /resource response, so even a response opened as a page can't
+# run script or be sniffed into HTML
+RESOURCE_SECURITY_HEADERS = {
+    'Content-Security-Policy': "default-src 'none'; sandbox",
+    'X-Content-Type-Options': 'nosniff'
+}
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+SCRIPT_RE = re.compile(r'<script\b[^>]*>.*?</script\s*>|<script\b[^>]*/>', re.IGNORECASE | re.DOTALL)
+EMBED_RE = re.compile(r'<(iframe|frame|object|embed)\b[^>]*>(?:.*?</\1\s*>)?', re.IGNORECASE | re.DOTALL)
+DROPPED_TAG_RE = re.compile(
+    r'<base\b[^>]*>'
+    r'|<link\b[^>]*\brel=["\']?(?:modulepreload|preload|prefetch|dns-prefetch|preconnect|manifest)\b[^>]*>'
+    r'|<meta\b[^>]*http-equiv=["\']?content-security-policy[^>]*>',
+    re.IGNORECASE
+)
+TAG_RE = re.compile(r'<[a-zA-Z][^>]*>')
+HANDLER_ATTR_RE = re.compile(r'\s(?:on[a-z]+|srcset|imagesrcset)\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s>]+)', re.IGNORECASE)
+JS_URL_RE = re.compile(r'\s(?:href|action|formaction)\s*=\s*(["\'])\s*javascript:[^"\']*\1', re.IGNORECASE)
+
+# rewrite_links points everything at /proxy; these are subresources, not pages
+PROXIED_SRC_RE = re.compile(r'\bsrc="/proxy\?url=([^"]*)"')
+PROXIED_LINK_HREF_RE = re.compile(r'(<link\b[^>]*\bhref=)"/proxy\?url=([^"]*)"', re.IGNORECASE)
+PROXIED_CSS_URL_RE = re.compile(r'url\(/proxy\?url=([^)]*)\)')
+CSS_URL_RE = re.compile(r'url\(\s*["\']?([^"\')\s]+)["\']?\s*\)')
+
+
+def default_view() -> str:
+    """View for /proxy when the session hasn't chosen one (BROWSER_PROXY_VIEW env var)"""
+    view = os.environ.get('BROWSER_PROXY_VIEW', 'screenshot')
+    return view if view in PROXY_VIEWS else 'screenshot'
+
+
+def resource_url(url: str) -> str:
+    """URL that fetches a subresource through /resource"""
+    return '/resource?url=' + quote(html.unescape(url), safe='')
+
+
+def _clean_tag(match) -> str:
+    return JS_URL_RE.sub('', HANDLER_ATTR_RE.sub('', match.group(0)))
+
+
+def sanitize_dom(page_source: str) -> str:
+    """Remove scripts, embedded frames, inline handlers and javascript: URLs"""
+    page_source = SCRIPT_RE.sub('', page_source)
+    page_source = EMBED_RE.sub('', page_source)
+    page_source = DROPPED_TAG_RE.sub('', page_source)
+    return TAG_RE.sub(_clean_tag, page_source)
+
+
+def _resource_links(page_source: str) -> str:
+    page_source = PROXIED_SRC_RE.sub(lambda m: f'src="{resource_url(m.group(1))}"', page_source)
+    page_source = PROXIED_LINK_HREF_RE.sub(lambda m: f'{m.group(1)}"{resource_url(m.group(2))}"', page_source)
+    return PROXIED_CSS_URL_RE.sub(lambda m: f'url({resource_url(m.group(1))})', page_source)
+
+
+def dom_view_html(page_source: str, base_url: str) -> str:
+    """Sanitized, proxy-rewritten DOM with a banner for switching views"""
+    page_source = _resource_links(rewrite_links(sanitize_dom(page_source), base_url))
+
+    quoted = quote(base_url, safe='')
+    banner = (
+        '<div style="position:sticky;top:0;z-index:2147483647;background:#1a73e8;color:#fff;'
+        'font:14px Arial,sans-serif;padding:8px 16px;display:flex;gap:12px;align-items:center">'
+        f'<span style="flex:1;overflow:hidden;text-overflow:ellipsis;white-space:nowrap">'
+        f'Text view: {html.escape(base_url)}</span>'
+        f'<a style="color:#fff" href="/proxy?view=screenshot&url={quoted}">Screenshot view</a>'
+        f'<a style="color:#fff" href="/interact?url={quoted}">Interact</a>'
+        '<a style="color:#fff" href="/">New URL</a></div>'
+    )
+    body = re.search(r'<body[^>]*>', page_source, re.IGNORECASE)
+    if body:
+        return page_source[:body.end()] + banner + page_source[body.end():]
+    return banner + page_source
+
+
+def dom_view_response(page_source: str, base_url: str) -> Response:
+    """Serve a DOM view with scripts blocked by CSP"""
+    content = dom_view_html(page_source, base_url)
+    metrics.incr('browser.dom_views')
+    metrics.observe('browser.dom_view_bytes', len(content))
+    return Response(content, headers={
+        'Content-Type': 'text/html; charset=utf-8',
+        'Content-Security-Policy': DOM_VIEW_CSP
+    })
+
+
+def rewrite_css(css: str, base_url: str) -> str:
+    """Send a stylesheet's url() references (fonts, images) through /resource"""
+    return CSS_URL_RE.sub(
+        lambda m: m.group(0) if m.group(1).startswith('data:')
+        else f'url({resource_url(make_absolute_url(m.group(1), base_url))})',
+        css
+    )
+
+
+def resource_type_allowed(content_type: str) -> bool:
+    """Whether /resource may serve a Content-Type (images, stylesheets, fonts, media)"""
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    if media_type in SCRIPTABLE_TYPES:
+        return False
+    return media_type in RESOURCE_TYPES or media_type.startswith(RESOURCE_TYPE_PREFIXES)
+
+
+def resource_response(url: str, request_headers, proxies: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Pass a subresource (image, stylesheet, font, media) through from the origin
+
+    Any other type, including an origin's HTML error page, gets a 415.
+
+    Args:
+        url: Absolute http(s) URL
+        request_headers: Incoming request headers (Range and validators are forwarded)
+        proxies: Optional requests proxies for the upstream proxy
+    """
+    if urlparse(url).scheme not in ('http', 'https'):
+        return Response('Only http(s) resources can be fetched', status=400, mimetype='text/plain',
+                        headers=RESOURCE_SECURITY_HEADERS)
+
+    headers = {'User-Agent': USER_AGENT}
+    for name in FORWARD_HEADERS:
+        if name in request_headers:
+            headers[name] = request_headers[name]
+
+    try:
+        upstream = requests.get(url, headers=headers, proxies=proxies, stream=True,
+                                timeout=RESOURCE_TIMEOUT)
+    except requests.RequestException as e:
+        metrics.incr('browser.resource_errors')
+        return Response(f'Could not fetch resource: {e}', status=502, mimetype='text/plain',
+                        headers=RESOURCE_SECURITY_HEADERS)
+
+    content_type = upstream.headers.get('Content-Type', '')
+    # A 304 carries no body, and often no type either
+    if upstream.status_code != 304 and not resource_type_allowed(content_type):
+        upstream.close()
+        metrics.incr('browser.resource_refused')
+        return Response('Only images, stylesheets, fonts and media can be fetched', status=415,
+                        mimetype='text/plain', headers=RESOURCE_SECURITY_HEADERS)
+
+    response_headers = {name: upstream.headers[name] for name in RESOURCE_HEADERS if name in upstream.headers}
+    response_headers.update(RESOURCE_SECURITY_HEADERS)
+    if not content_type.strip().lower().startswith(INLINE_TYPE_PREFIXES):
+        response_headers['Content-Disposition'] = 'attachment'
+    metrics.incr('browser.resources')
+
+    if 'text/css' in content_type:
+        css = rewrite_css(upstream.text, upstream.url)
+        return Response(css, status=upstream.status_code, headers=response_headers)
+
+    # requests decodes Content-Encoding, so the origin length only holds for identity
+    if 'Content-Length' in upstream.headers and not upstream.headers.get('Content-Encoding'):
+        response_headers['Content-Length'] = upstream.headers['Content-Length']
+
+    def generate():
+        try:
+            for chunk in upstream.iter_content(RESOURCE_CHUNK):
+                yield chunk
+        finally:
+            upstream.close()
+
+    return Response(stream_with_context(generate()), status=upstream.status_code, headers=response_headers)
@@ -0,0 +1,243 @@
+"""
+Frame Diff Module
+Sends only the tiles of a frame that changed since the client's last frame,
+packed into one atlas image, using vectorized NumPy comparison when numpy and
+Pillow are installed
+"""
+
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from flask import Response, request
+
+from frames import Frame, frame_response
+from metrics import metrics
+
+try:
+    import numpy as np
+    from PIL import Image
+    TILE_DIFF_AVAILABLE = True
+except ImportError:
+    np = None
+    Image = None
+    TILE_DIFF_AVAILABLE = False
+
+# Tile edge in pixels (BROWSER_TILE_SIZE env var)
+DEFAULT_TILE_SIZE = 64
+
+# Per-channel difference treated as unchanged (absorbs JPEG re-encoding noise)
+DIFF_THRESHOLD = 12
+
+# Above this share of changed tiles a full frame is cheaper than a delta
+MAX_CHANGED_RATIO = 0.5
+
+# Deltas in a row before a full frame is sent again. Atlases are lossy and
+# changes under DIFF_THRESHOLD are never sent, so the client's picture drifts
+# from the server's with each delta; a full frame resets it.
+KEYFRAME_INTERVAL = 8
+
+# Memory for decoded frames (full-size RGB arrays), per process
+DEFAULT_PIXEL_CACHE_MB = 64
+
+PIL_FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+
+class TileDelta:
+    """Changed tiles of one frame relative to an earlier one"""
+
+    __slots__ = ('frame_id', 'since', 'atlas', 'format', 'tile_size', 'grid_columns',
+                 'atlas_columns', 'tiles', 'etag')
+
+    def __init__(self, frame: Frame, since: Frame, atlas: bytes, tile_size: int,
+                 grid_columns: int, atlas_columns: int, tiles: List[int]):
+        self.frame_id = frame.frame_id
+        self.since = since.frame_id
+        self.atlas = atlas
+        self.format = frame.format
+        self.tile_size = tile_size
+        self.grid_columns = grid_columns
+        self.atlas_columns = atlas_columns
+        # Grid index (row * grid_columns + column) of each changed tile, in
+        # atlas order; the n-th tile sits at atlas cell n
+        self.tiles = tiles
+        self.etag = f'{since.etag}-{frame.etag}'
+
+
+class FrameDiffer:
+    """Computes and caches tile deltas between frames"""
+
+    def __init__(self, tile_size: Optional[int] = None, cache_size: int = 16,
+                 pixel_cache_mb: float = DEFAULT_PIXEL_CACHE_MB, keyframe_interval: int = KEYFRAME_INTERVAL):
+        """
+        Initialize frame differ
+
+        Args:
+            tile_size: Tile edge in pixels (BROWSER_TILE_SIZE env var)
+            cache_size: Deltas kept in memory
+            pixel_cache_mb: Memory for decoded frames
+            keyframe_interval: Deltas in a row before a full frame is sent
+        """
+        if tile_size is None:
+            tile_size = int(os.environ.get('BROWSER_TILE_SIZE', DEFAULT_TILE_SIZE))
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self.max_pixel_bytes = int(pixel_cache_mb * 1024 * 1024)
+        self.keyframe_interval = keyframe_interval
+        self._pixels = OrderedDict()
+        self._pixel_bytes = 0
+        self._deltas = OrderedDict()
+        # Frame id -> deltas since the last full frame the client was sent
+        self._chain = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, cache: OrderedDict, key, compute):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def _decode(self, frame: Frame):
+        with self._lock:
+            pixels = self._pixels.get(frame.frame_id)
+            if pixels is not None:
+                self._pixels.move_to_end(frame.frame_id)
+                return pixels
+
+        pixels = np.asarray(Image.open(io.BytesIO(frame.data)).convert('RGB'))
+        with self._lock:
+            if frame.frame_id not in self._pixels:
+                self._pixels[frame.frame_id] = pixels
+                self._pixel_bytes += pixels.nbytes
+            while self._pixel_bytes > self.max_pixel_bytes and len(self._pixels) > 1:
+                _, old = self._pixels.popitem(last=False)
+                self._pixel_bytes -= old.nbytes
+        return pixels
+
+    def chain_length(self, frame_id: int) -> int:
+        """Deltas sent in a row up to this frame (0 for a full frame or an unknown one)"""
+        with self._lock:
+            return self._chain.get(frame_id, 0)
+
+    def record_sent(self, frame: Frame, since: Optional[Frame]) -> None:
+        """Note that the client got `frame` as a delta from `since`, or in full when since is None"""
+        length = self.chain_length(since.frame_id) + 1 if since is not None else 0
+        with self._lock:
+            self._chain[frame.frame_id] = length
+            self._chain.move_to_end(frame.frame_id)
+            while len(self._chain) > self.cache_size * 16:
+                self._chain.popitem(last=False)
+
+    def changed_tiles(self, old, new):
+        """
+        Find changed tiles between two equally sized RGB arrays
+
+        Returns:
+            Tuple of (row indices, column indices, grid columns, total tile count)
+        """
+        tile = self.tile_size
+        height, width = new.shape[:2]
+        rows, cols = math.ceil(height / tile), math.ceil(width / tile)
+
+        changed = (np.abs(old.astype(np.int16) - new.astype(np.int16)).max(axis=2) > DIFF_THRESHOLD)
+        # Pad to whole tiles so the grid can be reduced with one reshape
+        changed = np.pad(changed, ((0, rows * tile - height), (0, cols * tile - width)))
+        tiles = changed.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+        tile_rows, tile_cols = np.nonzero(tiles)
+        return tile_rows, tile_cols, cols, rows * cols
+
+    def delta(self, frame: Frame, since: Frame) -> Optional[TileDelta]:
+        """
+        Build the delta from `since` to `frame`
+
+        Returns:
+            TileDelta, or None when a full frame should be sent instead
+        """
+        if not TILE_DIFF_AVAILABLE or frame.format not in PIL_FORMATS:
+            return None
+        if self.chain_length(since.frame_id) >= self.keyframe_interval:
+            metrics.incr('browser.frame_keyframes')
+            return None
+        return self._cached(self._deltas, (since.frame_id, frame.frame_id),
+                            lambda: self._build(frame, since))
+
+    def _build(self, frame: Frame, since: Frame) -> Optional[TileDelta]:
+        with metrics.timer('browser.frame_diff_seconds'):
+            new = self._decode(frame)
+            old = self._decode(since)
+            if old.shape != new.shape:
+                return None
+
+            tile_rows, tile_cols, grid_columns, total = self.changed_tiles(old, new)
+            count = len(tile_rows)
+            metrics.observe('browser.frame_changed_tile_ratio', count / total)
+            if count / total > MAX_CHANGED_RATIO:
+                return None
+
+            tile = self.tile_size
+            height, width = new.shape[:2]
+            atlas_cols = max(1, math.ceil(math.sqrt(count)))
+            atlas_rows = max(1, math.ceil(count / atlas_cols))
+            atlas = np.zeros((atlas_rows * tile, atlas_cols * tile, 3), dtype=np.uint8)
+
+            tiles = []
+            for index, (row, col) in enumerate(zip(tile_rows.tolist(), tile_cols.tolist())):
+                x, y = col * tile, row * tile
+                w, h = min(tile, width - x), min(tile, height - y)
+                ax, ay = (index % atlas_cols) * tile, (index // atlas_cols) * tile
+                atlas[ay:ay + h, ax:ax + w] = new[y:y + h, x:x + w]
+                tiles.append(row * grid_columns + col)
+
+            buffer = io.BytesIO()
+            options = {} if frame.format == 'png' else {'quality': 90}
+            Image.fromarray(atlas).save(buffer, PIL_FORMATS[frame.format], **options)
+            return TileDelta(frame, since, buffer.getvalue(), tile, grid_columns, atlas_cols, tiles)
+
+
+def delta_response(differ: FrameDiffer, frame: Frame, since: Optional[Frame]) -> Response:
+    """
+    Serve the tiles that changed since the client's frame
+
+    The atlas image describes its layout in X-Tile-* headers. When no useful
+    delta exists the full frame is served with X-Frame-Full: 1.
+    """
+    delta = None
+    if since is not None and since.frame_id != frame.frame_id:
+        try:
+            delta = differ.delta(frame, since)
+        except Exception as e:
+            print(f"Frame diff failed: {e}")
+    differ.record_sent(frame, since if delta is not None else None)
+
+    if delta is None:
+        metrics.incr('browser.frame_full_sends')
+        response = frame_response(frame)
+        response.headers['X-Frame-Full'] = '1'
+        return response
+
+    metrics.incr('browser.frame_delta_sends')
+    if delta.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(delta.atlas, mimetype=frame.mime_type)
+        metrics.observe('browser.frame_served_bytes', len(delta.atlas))
+        metrics.observe('browser.frame_delta_saved_bytes', max(len(frame.data) - len(delta.atlas), 0))
+
+    response.set_etag(delta.etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600, immutable'
+    response.headers['X-Frame-Id'] = str(frame.frame_id)
+    response.headers['X-Tile-Size'] = str(delta.tile_size)
+    response.headers['X-Tile-Grid-Columns'] = str(delta.grid_columns)
+    response.headers['X-Tile-Atlas-Columns'] = str(delta.atlas_columns)
+    response.headers['X-Tiles'] = ','.join(map(str, delta.tiles))
+    return response
@@ -0,0 +1,219 @@
+"""
+Frames Module
+Captures browser screenshots as compressed binary frames (PNG/JPEG/WebP) that
+are served by URL with ETags, instead of base64 PNG inlined into pages and JSON
+"""
+
+import base64
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Response, request
+
+from metrics import metrics
+
+FRAME_FORMATS = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+# Defaults for new captures (BROWSER_FRAME_FORMAT / BROWSER_FRAME_QUALITY env vars)
+DEFAULT_FRAME_FORMAT = 'jpeg'
+DEFAULT_FRAME_QUALITY = 80
+
+# Frames kept per session so in-flight <img> requests still resolve
+DEFAULT_FRAMES_KEPT = 8
+
+# Frame ids must not collide between the launcher's workers: a frame id from
+# one worker can reach another. Each process counts up from pid * 2**30,
+# which keeps ids below JavaScript's 2**53 safe integer limit
+FRAME_IDS_PER_PROCESS = 2 ** 30
+
+_frame_ids = None
+_frame_ids_pid = None
+_frame_ids_lock = threading.Lock()
+
+
+def next_frame_id() -> int:
+    """Next frame id, unique across this host's processes (restarts after fork)"""
+    global _frame_ids, _frame_ids_pid
+    with _frame_ids_lock:
+        pid = os.getpid()
+        if _frame_ids_pid != pid:
+            _frame_ids = itertools.count(pid * FRAME_IDS_PER_PROCESS + 1)
+            _frame_ids_pid = pid
+        return next(_frame_ids)
+
+
+def frame_settings(fmt: Optional[str] = None, quality: Optional[int] = None):
+    """
+    Resolve capture format and quality, falling back to the configured defaults
+
+    Returns:
+        Tuple of (format, quality)
+    """
+    fmt = (fmt or os.environ.get('BROWSER_FRAME_FORMAT', DEFAULT_FRAME_FORMAT)).lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in FRAME_FORMATS:
+        fmt = DEFAULT_FRAME_FORMAT
+
+    if quality is None:
+        quality = int(os.environ.get('BROWSER_FRAME_QUALITY', DEFAULT_FRAME_QUALITY))
+    return fmt, max(1, min(int(quality), 100))
+
+
+def capture_image(driver, fmt: str = 'png', quality: int = DEFAULT_FRAME_QUALITY, **params):
+    """
+    Capture the viewport in the requested format
+
+    Chrome encodes JPEG/WebP itself via DevTools Page.captureScreenshot;
+    drivers without DevTools access fall back to Selenium's PNG.
+
+    Args:
+        driver: Selenium WebDriver
+        fmt: png, jpeg or webp
+        quality: Compression quality for jpeg/webp (1-100)
+        **params: Extra Page.captureScreenshot parameters (e.g. clip)
+
+    Returns:
+        Tuple of (image bytes, actual format)
+    """
+    command = dict(params, format=fmt)
+    if fmt != 'png':
+        command['quality'] = quality
+
+    execute_cdp_cmd = getattr(driver, 'execute_cdp_cmd', None)
+    if execute_cdp_cmd is not None:
+        try:
+            result = execute_cdp_cmd('Page.captureScreenshot', command)
+            return base64.b64decode(result['data']), fmt
+        except Exception as e:
+            print(f"DevTools capture failed, falling back to PNG: {e}")
+
+    return driver.get_screenshot_as_png(), 'png'
+
+
+class Frame:
+    """One captured, encoded screenshot"""
+
+    __slots__ = ('frame_id', 'data', 'format', 'etag', 'url', 'created')
+
+    def __init__(self, frame_id: int, data: bytes, fmt: str, url: str = ''):
+        self.frame_id = frame_id
+        self.data = data
+        self.format = fmt
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+        self.url = url
+        self.created = time.time()
+
+    @property
+    def mime_type(self) -> str:
+        return FRAME_FORMATS[self.format]
+
+
+class FrameRing:
+    """The last few frames captured for one browser session"""
+
+    def __init__(self, keep: int = DEFAULT_FRAMES_KEPT):
+        self.keep = keep
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def capture(self, driver, fmt: Optional[str] = None, quality: Optional[int] = None) -> Frame:
+        """
+        Capture and store a new frame (caller holds the session's driver lock)
+
+        Args:
+            driver: Selenium WebDriver
+            fmt: Optional format override
+            quality: Optional quality override
+
+        Returns:
+            Frame
+        """
+        fmt, quality = frame_settings(fmt, quality)
+
+        start = time.perf_counter()
+        data, fmt = capture_image(driver, fmt, quality)
+        metrics.observe(f'browser.capture_seconds.{fmt}', time.perf_counter() - start)
+        metrics.observe(f'browser.frame_bytes.{fmt}', len(data))
+
+        try:
+            url = driver.current_url
+        except Exception:
+            url = ''
+
+        return self.add_encoded(data, fmt, url)
+
+    def add_encoded(self, data: bytes, fmt: str, url: str = '') -> Frame:
+        """Store an already encoded image (e.g. a screencast frame) as a new frame"""
+        frame = Frame(next_frame_id(), data, fmt, url)
+        self.add(frame)
+        return frame
+
+    def add(self, frame: Frame) -> None:
+        with self._lock:
+            self._frames[frame.frame_id] = frame
+            while len(self._frames) > self.keep:
+                self._frames.popitem(last=False)
+
+    def get(self, frame_id: Optional[int] = None) -> Optional[Frame]:
+        """Get a frame by id, or the latest frame when frame_id is None"""
+        with self._lock:
+            if frame_id is None:
+                return next(reversed(self._frames.values()), None)
+            return self._frames.get(frame_id)
+
+    def latest_id(self) -> Optional[int]:
+        frame = self.get()
+        return frame.frame_id if frame else None
+
+
+def frame_url(frame: Frame) -> str:
+    """URL the frame is served from"""
+    return f'/api/frame/{frame.frame_id}'
+
+
+def frame_payload(frame: Frame, since: Optional[int] = None) -> dict:
+    """
+    JSON description of a new frame for API responses
+
+    Args:
+        frame: The new frame
+        since: Frame id the client currently shows, to offer a tile delta
+    """
+    payload = {'frame_url': frame_url(frame), 'frame_id': frame.frame_id, 'url': frame.url}
+    if since and since != frame.frame_id:
+        payload['since'] = since
+        payload['delta_url'] = f'{frame_url(frame)}/delta/{since}'
+    return payload
+
+
+def frame_response(frame: Frame, immutable: bool = True) -> Response:
+    """
+    Serve a frame as raw image bytes, answering revalidation with 304
+
+    Args:
+        frame: Frame to serve
+        immutable: Frames addressed by id never change and can be cached
+    """
+    if frame.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(frame.data, mimetype=frame.mime_type)
+        metrics.observe('browser.frame_served_bytes', len(frame.data))
+
+    response.set_etag(frame.etag)
+    if immutable:
+        response.headers['Cache-Control'] = 'private, max-age=3600, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Frame-Id'] = str(frame.frame_id)
+    return response
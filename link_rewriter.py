@@ -0,0 +1,143 @@
+"""
+Link Rewriter Module
+Rewrites URLs in proxied HTML so navigation and subresources go through the proxy
+"""
+
+from urllib.parse import urljoin, urlparse
+import html
+import re
+
+
+def make_absolute_url(url, base_url):
+    """Convert relative URLs to absolute URLs"""
+    if url.startswith('//'):
+        return 'https:' + url
+    elif url.startswith('/'):
+        parsed = urlparse(base_url)
+        return f"{parsed.scheme}://{parsed.netloc}{url}"
+    elif not url.startswith(('http://', 'https://')):
+        return urljoin(base_url, url)
+    return url
+
+
+def proxy_url(url):
+    """Convert external URL to proxied URL through our server"""
+    if url.startswith(('http://', 'https://', '//')):
+        return f"/proxy?url={url}"
+    return url
+
+
+def rewrite_links(html_content, base_url):
+    """Rewrite all links in HTML to go through proxy"""
+    # Rewrite href attributes
+    html_content = re.sub(
+        r'href=["\']([^"\']+)["\']',
+        lambda m: f'href="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
+        html_content
+    )
+
+    # Rewrite src attributes (images, scripts, etc)
+    html_content = re.sub(
+        r'src=["\']([^"\']+)["\']',
+        lambda m: f'src="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
+        html_content
+    )
+
+    # Rewrite action attributes in forms
+    html_content = re.sub(
+        r'action=["\']([^"\']+)["\']',
+        lambda m: f'action="{proxy_url(make_absolute_url(m.group(1), base_url))}"',
+        html_content
+    )
+
+    # Rewrite CSS url() references
+    html_content = re.sub(
+        r'url\(["\']?([^"\')\s]+)["\']?\)',
+        lambda m: f'url({proxy_url(make_absolute_url(m.group(1), base_url))})',
+        html_content
+    )
+
+    # Rewrite JavaScript location redirects
+    parsed = urlparse(base_url)
+    base_domain = f"{parsed.scheme}://{parsed.netloc}"
+
+    # Rewrite window.location and location.href
+    html_content = re.sub(
+        r'(window\.location|location\.href)\s*=\s*["\']([^"\']+)["\']',
+        lambda m: f'{m.group(1)}="/proxy?url={make_absolute_url(m.group(2), base_url)}"',
+        html_content
+    )
+
+    return html_content
+
+
+# Registers static/proxy-sw.js and flags the session once it controls the page
+SERVICE_WORKER_REGISTER_SCRIPT = '''
+<script>
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register(location.origin + '/proxy-sw.js', {scope: '/'})
+        .then(function () { return navigator.serviceWorker.ready; })
+        .then(function () {
+            document.cookie = 'proxy_sw=1; path=/; max-age=86400; samesite=lax';
+        })
+        .catch(function () {});
+}
+</script>
+'''
+
+# Navigations can't be caught by the service worker once they leave the proxy
+# origin, so links and forms are sent back through /proxy here instead
+SERVICE_WORKER_PAGE_SCRIPT = '''
+<script>
+(function () {
+    if (!navigator.serviceWorker || !navigator.serviceWorker.controller) {
+        // Worker went away: drop the flag and get a server-rewritten page
+        document.cookie = 'proxy_sw=; path=/; max-age=0';
+        location.reload();
+        return;
+    }
+    function viaProxy(url) {
+        return location.origin + '/proxy?url=' + encodeURIComponent(url);
+    }
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest && event.target.closest('a[href]');
+        if (!link || link.origin === location.origin || !/^https?:/.test(link.protocol)) return;
+        event.preventDefault();
+        if (link.target === '_blank') {
+            window.open(viaProxy(link.href));
+        } else {
+            location.href = viaProxy(link.href);
+        }
+    }, true);
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        var action = new URL(form.getAttribute('action') || '', document.baseURI);
+        if (action.origin === location.origin) return;
+        if ((form.method || 'get').toLowerCase() === 'get') {
+            event.preventDefault();
+            action.search = new URLSearchParams(new FormData(form)).toString();
+            location.href = viaProxy(action.href);
+        } else {
+            form.action = viaProxy(action.href);
+        }
+    }, true);
+})();
+</script>
+'''
+
+
+def prepare_for_service_worker(html_content, base_url):
+    """
+    Prepare a page for a session whose service worker rewrites URLs
+
+    Instead of rewriting every URL, point relative URLs at the original site
+    with a <base> tag; the service worker proxies the resulting requests.
+    """
+    snippet = SERVICE_WORKER_PAGE_SCRIPT
+    if not re.search(r'<base\s', html_content, re.IGNORECASE):
+        snippet = f'<base href="{html.escape(base_url, quote=True)}">' + snippet
+
+    head = re.search(r'<head[^>]*>', html_content, re.IGNORECASE)
+    if head:
+        return html_content[:head.end()] + snippet + html_content[head.end():]
+    return snippet + html_content
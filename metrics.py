@@ -0,0 +1,154 @@
+"""
+Metrics Module
+Process-wide counters and timings, aggregated across workers when the
+production server provides a shared store
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from shared_store import SharedStore
+
+# Seconds between writes of buffered metrics to the shared store
+FLUSH_INTERVAL = 1.0
+
+
+def _merge(counters: Dict[str, int], observations: Dict[str, Dict],
+           more_counters: Dict[str, int], more_observations: Dict[str, Dict]) -> None:
+    """Add one batch of counters and observations into another"""
+    for name, amount in more_counters.items():
+        counters[name] = counters.get(name, 0) + amount
+    for name, more in more_observations.items():
+        stats = observations.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += more['count']
+        stats['total'] += more['total']
+        stats['max'] = max(stats['max'], more['max'])
+
+
+class Metrics:
+    """
+    Collects counters (event counts) and observations (timings, sizes)
+
+    With a shared store, metrics are buffered in memory and written by a
+    background thread once per FLUSH_INTERVAL in one transaction, so
+    recording a metric never waits on (or fails with) a busy database.
+    """
+
+    def __init__(self, shared_store: Optional[SharedStore] = None, flush_interval: float = FLUSH_INTERVAL):
+        """
+        Initialize metrics
+
+        Args:
+            shared_store: Optional store that aggregates across worker processes
+            flush_interval: Seconds between writes to the shared store
+        """
+        self.shared_store = shared_store
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Totals without a shared store; the not yet written batch with one
+        self._counters: Dict[str, int] = {}
+        self._observations: Dict[str, Dict] = {}
+        self._flusher_pid: Optional[int] = None
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Add to a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+        self._start_flusher()
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample of a timing (seconds) or size (bytes)"""
+        with self._lock:
+            stats = self._observations.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += value
+            stats['max'] = max(stats['max'], value)
+        self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        """Start the flush thread in this process on first use (workers are forked)"""
+        if self.shared_store is None or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered metrics to the shared store, keeping them for the next try on failure"""
+        if self.shared_store is None:
+            return
+        with self._lock:
+            counters, observations = self._counters, self._observations
+            self._counters, self._observations = {}, {}
+        if not counters and not observations:
+            return
+        try:
+            self.shared_store.add_counters(counters, observations)
+        except sqlite3.Error as e:
+            print(f"Could not write metrics to the shared store: {e}")
+            with self._lock:
+                _merge(self._counters, self._observations, counters, observations)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time a block and record it as an observation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict:
+        """
+        Get every metric
+
+        Returns:
+            Dict with 'counters' {name: count} and 'observations'
+            {name: {'count', 'avg', 'max', 'total'}}
+        """
+        error = None
+        if self.shared_store:
+            self.flush()
+            try:
+                rows = self.shared_store.counters()
+            except sqlite3.Error as e:
+                error, rows = str(e), {}
+            counters = {name: row['count'] for name, row in rows.items() if row['kind'] == 'counter'}
+            observations = {
+                name: {'count': row['count'], 'total': row['total'], 'max': row['max']}
+                for name, row in rows.items() if row['kind'] == 'observation'
+            }
+            # Include whatever could not be written yet
+            with self._lock:
+                _merge(counters, observations, self._counters, self._observations)
+        else:
+            with self._lock:
+                counters = dict(self._counters)
+                observations = {name: dict(stats) for name, stats in self._observations.items()}
+
+        for stats in observations.values():
+            stats['avg'] = stats['total'] / stats['count'] if stats['count'] else 0.0
+
+        snapshot = {
+            'counters': counters,
+            'observations': observations,
+            'shared': self.shared_store is not None
+        }
+        if error:
+            snapshot['error'] = error
+        return snapshot
+
+
+# Single registry per process, shared with other workers when configured
+metrics = Metrics(SharedStore.from_env())
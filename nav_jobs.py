@@ -0,0 +1,197 @@
+"""
+Navigation Jobs Module
+Runs browser navigations on a dedicated executor so page loads don't hold a
+web worker; clients follow each job's progress (started, DOM ready, load
+complete, frame ready) over server-sent events
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from devtools import DevToolsError
+from metrics import metrics
+
+# Concurrent navigations (BROWSER_NAV_WORKERS env var); each one holds a session's browser
+DEFAULT_WORKERS = 8
+
+# Seconds a job and its result stay available after it was submitted
+JOB_TTL = 120
+
+FINAL_STAGES = ('done', 'error')
+
+
+def async_navigation_enabled() -> bool:
+    """Whether /proxy hands navigations to jobs (BROWSER_ASYNC_NAVIGATION, default on)"""
+    return os.environ.get('BROWSER_ASYNC_NAVIGATION', '1') != '0'
+
+
+class NavigationJob:
+    """One navigation and the progress events it has produced"""
+
+    def __init__(self, session_id: str, url: str):
+        self.job_id = secrets.token_urlsafe(12)
+        self.session_id = session_id
+        self.url = url
+        self.created = time.time()
+        self.events: List[Dict] = []
+        self.result = None  # (final URL, frame, page source) once done
+        self._stages = set()
+        self._cond = threading.Condition()
+        self.emit('queued')
+
+    def emit(self, stage: str, **data) -> None:
+        """Record a stage once; later reports of the same stage are ignored"""
+        with self._cond:
+            if stage in self._stages or self.finished:
+                return
+            self._stages.add(stage)
+            event = {'stage': stage, 'ms': round((time.time() - self.created) * 1000)}
+            event.update(data)
+            self.events.append(event)
+            self._cond.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.events) and self.events[-1]['stage'] in FINAL_STAGES
+
+    def events_after(self, index: int, timeout: float) -> List[Dict]:
+        """Events from position index on, waiting up to timeout for one to arrive"""
+        with self._cond:
+            if len(self.events) <= index and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[index:]
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the job finishes; False on timeout"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self.finished:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def status(self) -> Dict:
+        with self._cond:
+            return {'job_id': self.job_id, 'url': self.url, 'events': list(self.events),
+                    'finished': self.finished}
+
+
+def watch_navigation(browser, job: NavigationJob) -> Callable[[], None]:
+    """
+    Report DOM ready and load complete from DevTools page events as they happen
+
+    Returns:
+        Function that stops watching (a no-op without DevTools)
+    """
+    try:
+        devtools = browser.devtools()
+        devtools.send('Page.enable')
+    except Exception:
+        return lambda: None
+
+    def dom_ready(params):
+        job.emit('dom_ready')
+
+    def load_complete(params):
+        job.emit('load_complete')
+
+    devtools.on('Page.domContentEventFired', dom_ready)
+    devtools.on('Page.loadEventFired', load_complete)
+
+    def detach():
+        try:
+            devtools.off('Page.domContentEventFired', dom_ready)
+            devtools.off('Page.loadEventFired', load_complete)
+        except DevToolsError:
+            pass
+
+    return detach
+
+
+class NavigationExecutor:
+    """Runs navigation jobs on a thread pool and keeps them for a short while"""
+
+    def __init__(self, max_workers: Optional[int] = None, ttl: float = JOB_TTL):
+        """
+        Initialize navigation executor
+
+        Args:
+            max_workers: Concurrent navigations (BROWSER_NAV_WORKERS env var, default 8)
+            ttl: Seconds finished jobs are kept for their clients
+        """
+        max_workers = max_workers or int(os.environ.get('BROWSER_NAV_WORKERS', DEFAULT_WORKERS))
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='navigate')
+        self._jobs: Dict[str, NavigationJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, browser, url: str, render: Callable) -> NavigationJob:
+        """
+        Start a navigation
+
+        Args:
+            browser: BrowserSession to navigate
+            url: Target URL
+            render: Called with a progress callback; returns (final URL, frame, page source)
+        """
+        job = NavigationJob(browser.session_id, url)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, browser, render)
+        metrics.incr('browser.navigation_jobs')
+        return job
+
+    def _run(self, job: NavigationJob, browser, render: Callable) -> None:
+        detach = watch_navigation(browser, job)
+        try:
+            job.result = render(job.emit)
+            job.emit('done', url=job.result[0])
+        except Exception as e:
+            metrics.incr('browser.navigation_job_errors')
+            job.emit('error', error=str(e))
+        finally:
+            detach()
+        metrics.observe('browser.navigation_job_seconds', time.time() - job.created)
+
+    def get(self, job_id: str, session_id: str) -> Optional[NavigationJob]:
+        """A job, only for the session that submitted it"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.session_id != session_id:
+            return None
+        return job
+
+    def _prune(self) -> None:
+        """Forget jobs past their TTL (caller holds _lock)"""
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.created < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {'jobs': len(jobs), 'running': sum(1 for job in jobs if not job.finished)}
+
+
+def job_events(job: NavigationJob, heartbeat: float = 15):
+    """Server-sent event stream of a job's progress, ending after done or error"""
+    yield 'retry: 2000\n\n'
+    index = 0
+    while True:
+        events = job.events_after(index, heartbeat)
+        if not events:
+            yield ': ping\n\n'
+            continue
+        for event in events:
+            yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+        index += len(events)
+        if events[-1]['stage'] in FINAL_STAGES:
+            return
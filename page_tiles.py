@@ -0,0 +1,240 @@
+"""
+Page Tiles Module
+Serves the whole page, not just the viewport, as a pyramid of image tiles
+rendered on demand with clipped DevTools captures and cached per page state,
+so clients scroll long pages locally and fetch only the tiles they show
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import Response, request
+
+from frames import FRAME_FORMATS, capture_image, frame_settings
+from metrics import metrics
+
+# Tile edge in CSS pixels at full size (BROWSER_PAGE_TILE_SIZE env var); each
+# level up halves the scale, so a tile covers twice the page in each direction
+DEFAULT_TILE_SIZE = 512
+MAX_LEVELS = 4
+
+# Pages are tiled down to this height in CSS pixels
+MAX_PAGE_HEIGHT = 30000
+
+# Tile bytes kept per session (BROWSER_PAGE_TILE_CACHE_MB env var)
+DEFAULT_CACHE_MB = 16
+
+# Seconds tiles of the page state just replaced are still served, so tiles
+# requested from a manifest that went stale in flight don't fail
+PREVIOUS_STATE_GRACE = 10
+
+# What changes the page's looks besides URL and size, coarsely: an epoch that
+# moves once DOM changes and resource loads (images repaint without mutating
+# the DOM) have been quiet for a second, or every ten seconds on a page that
+# never stops (tickers, animations), instead of on every single change.
+PAGE_STATE_SCRIPT = '''
+if (window.__proxyDomEpoch === undefined) {
+    window.__proxyDomEpoch = 0;
+    var quiet = null, first = 0;
+    var bump = function () {
+        var now = Date.now();
+        if (quiet === null) first = now;
+        clearTimeout(quiet);
+        quiet = setTimeout(function () { quiet = null; window.__proxyDomEpoch++; },
+                           now - first >= 10000 ? 0 : 1000);
+    };
+    new MutationObserver(bump).observe(
+        document, {subtree: true, childList: true, attributes: true, characterData: true});
+    document.addEventListener('load', bump, true);
+}
+return [location.href, window.__proxyDomEpoch];
+'''
+
+# Scrolls a page point into the viewport and returns its viewport coordinates
+SCROLL_TO_POINT_SCRIPT = '''
+var x = arguments[0], y = arguments[1];
+if (y < scrollY || y >= scrollY + innerHeight || x < scrollX || x >= scrollX + innerWidth) {
+    window.scrollTo(Math.max(x - innerWidth / 2, 0), Math.max(y - innerHeight / 2, 0));
+}
+return [x - scrollX, y - scrollY];
+'''
+
+
+def tile_size() -> int:
+    return int(os.environ.get('BROWSER_PAGE_TILE_SIZE', DEFAULT_TILE_SIZE))
+
+
+def scroll_to_point(driver, x: float, y: float) -> Tuple[int, int]:
+    """Bring a page point into view for a click; returns viewport coordinates"""
+    vx, vy = driver.execute_script(SCROLL_TO_POINT_SCRIPT, x, y)
+    return round(vx), round(vy)
+
+
+class PageTiles:
+    """
+    One session's tile pyramid
+
+    Tiles are keyed by page state (URL, content size, DOM epoch and
+    viewport), so a URL for a tile never changes content. When the page
+    changes, tiles of the state it replaced stay servable from the cache for
+    PREVIOUS_STATE_GRACE seconds and older states are dropped.
+    """
+
+    def __init__(self, browser, cache_mb: Optional[float] = None):
+        """
+        Initialize page tiles
+
+        Args:
+            browser: BrowserSession whose page is tiled
+            cache_mb: Tile cache budget (BROWSER_PAGE_TILE_CACHE_MB env var, default 16)
+        """
+        if cache_mb is None:
+            cache_mb = float(os.environ.get('BROWSER_PAGE_TILE_CACHE_MB', DEFAULT_CACHE_MB))
+        self.browser = browser
+        self.max_bytes = int(cache_mb * 1024 * 1024)
+        self.tile_size = tile_size()
+        self.state: Optional[str] = None
+        self.layout: Dict = {}
+        self.previous_state: Optional[str] = None
+        self._replaced_at = 0.0
+        self._tiles = OrderedDict()  # (state, level, column, row) -> (data, format)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _current(self) -> Tuple[str, Dict]:
+        """Page state key and content size right now (caller holds the session lock)"""
+        driver = self.browser.driver
+        metrics_result = driver.execute_cdp_cmd('Page.getLayoutMetrics', {})
+        size = metrics_result.get('cssContentSize') or metrics_result['contentSize']
+        width = math.ceil(size['width'])
+        height = min(math.ceil(size['height']), MAX_PAGE_HEIGHT)
+
+        href, dom_epoch = driver.execute_script(PAGE_STATE_SCRIPT)
+        fingerprint = json.dumps([href, width, height, dom_epoch, self.browser.viewport.key])
+        state = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+        return state, {'url': href, 'width': width, 'height': height}
+
+    def _set_state(self, state: str, layout: Dict) -> None:
+        with self._lock:
+            if state != self.state:
+                self.previous_state, self._replaced_at = self.state, time.time()
+                self._drop_tiles(keep=(state, self.previous_state))
+                self.state = state
+            elif self.previous_state and time.time() - self._replaced_at >= PREVIOUS_STATE_GRACE:
+                self.previous_state = None
+                self._drop_tiles(keep=(state,))
+            self.layout = layout
+
+    def _drop_tiles(self, keep) -> None:
+        """Forget tiles of every state not in keep (caller holds _lock)"""
+        for key in [key for key in self._tiles if key[0] not in keep]:
+            data, _ = self._tiles.pop(key)
+            self._bytes -= len(data)
+
+    def manifest(self) -> Dict:
+        """
+        Describe the current pyramid (caller holds the session lock)
+
+        Level 0 is full size; level n is scaled by 1/2^n, up to the level at
+        which the page's width fits in one tile.
+        """
+        state, layout = self._current()
+        self._set_state(state, layout)
+
+        width, height = layout['width'], layout['height']
+        levels = []
+        for level in range(MAX_LEVELS):
+            span = self.tile_size * 2 ** level
+            levels.append({
+                'level': level,
+                'scale': 1 / 2 ** level,
+                'columns': math.ceil(width / span),
+                'rows': math.ceil(height / span)
+            })
+            if width <= span:
+                break
+
+        return {
+            'state': state,
+            'url': layout['url'],
+            'width': width,
+            'height': height,
+            'tile_size': self.tile_size,
+            'dpr': self.browser.viewport.dpr,
+            'levels': levels,
+            'tile_url': f'/api/tiles/{state}/{{level}}/{{x}}/{{y}}'
+        }
+
+    def tile(self, state: str, level: int, column: int, row: int) -> Optional[Tuple[bytes, str]]:
+        """
+        Get one tile, rendering it on a cache miss (caller holds the session lock)
+
+        The page state is checked on every call, which is two cheap round
+        trips; the capture is what the cache saves.
+
+        Returns:
+            (image bytes, format), or None if the page has changed since
+            state and the tile isn't cached from within the grace period
+        """
+        current, layout = self._current()
+        self._set_state(current, layout)
+        if not 0 <= level < MAX_LEVELS:
+            return None
+
+        key = (state, level, column, row)
+        with self._lock:
+            # Only the current state, or the previous one in its grace period,
+            # is still in the cache
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+                metrics.incr('browser.page_tile_hits')
+                if state != current:
+                    metrics.incr('browser.page_tile_previous_hits')
+                return cached
+        if current != state:
+            return None
+
+        span = self.tile_size * 2 ** level
+        x, y = column * span, row * span
+        if x >= layout['width'] or y >= layout['height']:
+            return None
+
+        fmt, quality = frame_settings()
+        with metrics.timer('browser.page_tile_seconds'):
+            data, fmt = capture_image(self.browser.driver, fmt, quality, captureBeyondViewport=True, clip={
+                'x': x,
+                'y': y,
+                'width': min(span, layout['width'] - x),
+                'height': min(span, layout['height'] - y),
+                'scale': 1 / 2 ** level
+            })
+        metrics.incr('browser.page_tile_misses')
+        metrics.observe('browser.page_tile_bytes', len(data))
+
+        with self._lock:
+            if self.state == state:
+                self._tiles[key] = (data, fmt)
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                    _, (old, _) = self._tiles.popitem(last=False)
+                    self._bytes -= len(old)
+        return data, fmt
+
+
+def tile_response(data: bytes, fmt: str) -> Response:
+    """Serve a tile; its URL names the page state, so it can be cached for good"""
+    etag = hashlib.sha1(data).hexdigest()[:20]
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(data, mimetype=FRAME_FORMATS[fmt])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600, immutable'
+    return response
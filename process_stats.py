@@ -0,0 +1,143 @@
+"""
+Process Statistics Module
+Measures memory and CPU time of a process and its descendants (chromedriver ->
+Chrome -> renderers), using psutil when installed and /proc otherwise
+"""
+
+import os
+from typing import Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def driver_pid(driver) -> Optional[int]:
+    """Get the chromedriver process id of a Selenium driver"""
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+
+def _proc_parent_map() -> Dict[int, int]:
+    """Map pid -> parent pid from /proc"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after the closing paren
+        fields = stat[stat.rindex(')') + 2:].split()
+        parents[int(entry)] = int(fields[1])
+    return parents
+
+
+def process_tree(pid: int) -> List[int]:
+    """
+    Get a process and all of its descendants
+
+    Args:
+        pid: Root process id
+
+    Returns:
+        List of pids, root first; empty if the process is gone
+    """
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            return [pid] + [child.pid for child in root.children(recursive=True)]
+        except psutil.Error:
+            return []
+
+    if not os.path.exists(f'/proc/{pid}'):
+        return []
+
+    children = {}
+    for child, parent in _proc_parent_map().items():
+        children.setdefault(parent, []).append(child)
+
+    tree = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def process_rss(pid: int) -> int:
+    """Resident memory of one process in bytes (0 if unavailable)"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree_rss(pid: Optional[int]) -> int:
+    """Total resident memory of a process tree in bytes"""
+    if pid is None:
+        return 0
+    return sum(process_rss(member) for member in process_tree(pid))
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of one process in seconds (0 if unavailable)"""
+    if psutil is not None:
+        try:
+            times = psutil.Process(pid).cpu_times()
+            return times.user + times.system
+        except psutil.Error:
+            return 0.0
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+        fields = stat[stat.rindex(')') + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def process_cmdline(pid: int) -> List[str]:
+    """Command line of one process (empty if unavailable)"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).cmdline()
+        except psutil.Error:
+            return []
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return [arg.decode('utf-8', 'replace') for arg in f.read().split(b'\0') if arg]
+    except OSError:
+        return []
+
+
+def process_tree_usage(pid: Optional[int]) -> Dict:
+    """
+    Resource usage of a process tree
+
+    Returns:
+        Dict with process and renderer counts, total RSS in bytes and total
+        CPU seconds (all zero if the process is gone)
+    """
+    members = process_tree(pid) if pid is not None else []
+    return {
+        'processes': len(members),
+        'renderers': sum(1 for member in members if '--type=renderer' in process_cmdline(member)),
+        'rss': sum(process_rss(member) for member in members),
+        'cpu_seconds': sum(process_cpu_seconds(member) for member in members)
+    }
@@ -0,0 +1,242 @@
+"""
+Profile Store Module
+Snapshots a browser session's state (cookies and localStorage) to compressed,
+encrypted files when its browser is closed, and restores it onto a fresh
+driver when the session comes back, so evicted users keep their logins
+"""
+
+import hashlib
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+# Hours a snapshot is kept for a session that doesn't return (BROWSER_PROFILE_TTL_HOURS, 0 = off)
+DEFAULT_TTL_HOURS = 24
+
+# Larger snapshots are not written
+MAX_SNAPSHOT_BYTES = 5 * 1024 * 1024
+
+# Fields Network.setCookies accepts from what Network.getAllCookies returns
+COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite',
+                 'expires', 'priority', 'sourceScheme', 'sourcePort')
+
+LOCAL_STORAGE_SCRIPT = '''
+var items = [];
+try {
+    for (var i = 0; i < localStorage.length; i++) {
+        var key = localStorage.key(i);
+        items.push([key, localStorage.getItem(key)]);
+    }
+} catch (e) {}
+return [location.origin, items];
+'''
+
+# Seeds localStorage the first time each origin loads in the restored tab
+RESTORE_STORAGE_SCRIPT = '''
+(function (storage) {
+    try {
+        if (sessionStorage.getItem('__proxyProfileRestored')) return;
+        sessionStorage.setItem('__proxyProfileRestored', '1');
+        var items = storage[location.origin] || [];
+        for (var i = 0; i < items.length; i++) {
+            if (localStorage.getItem(items[i][0]) === null) localStorage.setItem(items[i][0], items[i][1]);
+        }
+    } catch (e) {}
+})(%s);
+'''
+
+
+def _frame_origins(tree: dict) -> List[str]:
+    """Origins of a page's frames from Page.getFrameTree"""
+    origins = []
+    stack = [tree.get('frameTree', {})]
+    while stack:
+        node = stack.pop()
+        origin = node.get('frame', {}).get('securityOrigin')
+        if origin and origin.startswith('http') and origin not in origins:
+            origins.append(origin)
+        stack.extend(node.get('childFrames', []))
+    return origins
+
+
+class ProfileStore:
+    """
+    Encrypted per-session profile snapshots on disk
+
+    IndexedDB is not included: DevTools can read it but has no way to write
+    it back. A snapshot is deleted once restored, so it only exists while the
+    session has no browser.
+    """
+
+    def __init__(self, crypto_manager, directory: Optional[str] = None, ttl_hours: Optional[float] = None):
+        """
+        Initialize profile store
+
+        Args:
+            crypto_manager: CryptoManager that encrypts snapshots
+            directory: Snapshot directory (default: profiles/ in the crypto config dir)
+            ttl_hours: Snapshot lifetime (BROWSER_PROFILE_TTL_HOURS env var, 0 = disabled)
+        """
+        if ttl_hours is None:
+            ttl_hours = float(os.environ.get('BROWSER_PROFILE_TTL_HOURS', DEFAULT_TTL_HOURS))
+        self.crypto = crypto_manager
+        self.ttl = ttl_hours * 3600
+        self.directory = Path(directory) if directory else Path(crypto_manager.config_dir) / 'profiles'
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            os.chmod(self.directory, 0o700)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def has(self, session_id: str) -> bool:
+        """Whether a snapshot is waiting for this session's next browser"""
+        return self.enabled and self._path(session_id).exists()
+
+    def _path(self, session_id: str) -> Path:
+        # File names must not reveal session ids
+        return self.directory / (hashlib.sha256(session_id.encode('utf-8')).hexdigest() + '.profile')
+
+    def capture(self, driver) -> Dict:
+        """Read cookies and localStorage from a live driver"""
+        cookies = driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+        storage = {}
+
+        origin, items = driver.execute_script(LOCAL_STORAGE_SCRIPT)
+        if origin.startswith('http') and items:
+            storage[origin] = items
+
+        # Frames from other origins (embedded sign-in widgets and the like)
+        try:
+            origins = _frame_origins(driver.execute_cdp_cmd('Page.getFrameTree', {}))
+            for other in origins:
+                if other in storage:
+                    continue
+                entries = driver.execute_cdp_cmd('DOMStorage.getDOMStorageItems', {
+                    'storageId': {'securityOrigin': other, 'isLocalStorage': True}
+                }).get('entries', [])
+                if entries:
+                    storage[other] = entries
+        except Exception:
+            pass
+
+        return {
+            'cookies': [
+                {key: cookie[key] for key in COOKIE_FIELDS
+                 if key in cookie and not (key == 'expires' and cookie.get('session'))}
+                for cookie in cookies
+            ],
+            'local_storage': storage,
+            'saved': time.time()
+        }
+
+    def save(self, session_id: str, driver) -> bool:
+        """
+        Snapshot a session's browser before it is closed
+
+        Returns:
+            Whether a snapshot was written
+        """
+        if not self.enabled:
+            return False
+        try:
+            with metrics.timer('browser.profile_snapshot_seconds'):
+                profile = self.capture(driver)
+                if not profile['cookies'] and not profile['local_storage']:
+                    return False
+                data = self.crypto.encrypt_bytes(zlib.compress(json.dumps(profile).encode('utf-8'), 6))
+        except Exception as e:
+            print(f"Could not snapshot browser profile: {e}")
+            return False
+        if len(data) > MAX_SNAPSHOT_BYTES:
+            metrics.incr('browser.profile_snapshots_too_large')
+            return False
+
+        path = self._path(session_id)
+        temp = path.with_suffix('.tmp')
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.chmod(temp, 0o600)
+        os.replace(temp, path)
+
+        metrics.incr('browser.profile_snapshots')
+        metrics.observe('browser.profile_snapshot_bytes', len(data))
+        self.prune()
+        return True
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """Read a session's snapshot, or None if there is no fresh one"""
+        if not self.enabled:
+            return None
+        path = self._path(session_id)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink()
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            return json.loads(zlib.decompress(self.crypto.decrypt_bytes(data)))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable browser profile: {e}")
+            self.discard(session_id)
+            return None
+
+    def restore(self, session_id: str, driver) -> bool:
+        """
+        Put a session's snapshot onto a fresh driver, before its first navigation
+
+        Returns:
+            Whether a snapshot was restored
+        """
+        profile = self.load(session_id)
+        if profile is None:
+            return False
+        try:
+            with metrics.timer('browser.profile_restore_seconds'):
+                if profile['cookies']:
+                    driver.execute_cdp_cmd('Network.setCookies', {'cookies': profile['cookies']})
+                if profile['local_storage']:
+                    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+                        'source': RESTORE_STORAGE_SCRIPT % json.dumps(profile['local_storage'])
+                    })
+        except Exception as e:
+            print(f"Could not restore browser profile: {e}")
+            return False
+        self.discard(session_id)
+        metrics.incr('browser.profile_restores')
+        return True
+
+    def discard(self, session_id: str) -> None:
+        try:
+            self._path(session_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def prune(self) -> None:
+        """Delete snapshots older than the TTL"""
+        cutoff = time.time() - self.ttl
+        for path in self.directory.glob('*.profile'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {'enabled': False}
+        paths = list(self.directory.glob('*.profile'))
+        return {
+            'enabled': True,
+            'snapshots': len(paths),
+            'bytes': sum(path.stat().st_size for path in paths if path.exists()),
+            'ttl_hours': self.ttl / 3600
+        }
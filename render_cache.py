@@ -0,0 +1,165 @@
+"""
+Render Cache Module
+Shares finished browser renders (final URL, encoded screenshot, page source)
+between anonymous users who open the same page, within a TTL and an LRU byte
+budget
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from cookie_jar import domain_match
+from frames import Frame
+from metrics import metrics
+
+
+def render_key(url: str, viewport: str, profile: str, variant: str = '') -> str:
+    """Cache key: everything that changes what a render looks like"""
+    return '\n'.join((url, viewport, profile, variant))
+
+
+def may_share_render(browser, url: str) -> bool:
+    """
+    Whether a render of a URL about to load in a session's browser may be shared
+
+    A plain GET can sign a browser in (a magic link, an OAuth callback), so
+    interaction isn't the only way it comes to hold a login: a browser that
+    already has cookies for the site is marked as interacted and its renders
+    are kept to itself from then on. Call with the browser's lock held, right
+    before the navigation.
+    """
+    if browser.interacted:
+        return False
+
+    host = (urlparse(url).hostname or '').lower()
+    try:
+        cookies = browser.driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+    except Exception:
+        cookies = None
+
+    if cookies is None or any(
+        domain_match(host, domain) or domain_match(domain, host)
+        for domain in (cookie.get('domain', '').lstrip('.').lower() for cookie in cookies)
+    ):
+        browser.interacted = True
+        metrics.incr('browser.render_cache.tainted')
+        return False
+    return True
+
+
+class RenderEntry:
+    """One cached render"""
+
+    __slots__ = ('key', 'final_url', 'frame', 'page_source', 'size', 'expires')
+
+    def __init__(self, key: str, final_url: str, frame: Frame, page_source: str, expires: float):
+        self.key = key
+        self.final_url = final_url
+        self.frame = frame
+        self.page_source = page_source
+        self.size = len(frame.data) + len(page_source.encode('utf-8')) + len(key) + len(final_url)
+        self.expires = expires
+
+
+class RenderCache:
+    """
+    LRU cache of renders bounded by total bytes
+
+    Disabled unless BROWSER_RENDER_CACHE_MB is set. Only renders made for
+    anonymous sessions that haven't interacted with their browser may be
+    stored or served; callers decide that.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Initialize render cache
+
+        Args:
+            max_bytes: Byte budget (BROWSER_RENDER_CACHE_MB env var, 0 = disabled)
+            ttl: Seconds a render stays fresh (BROWSER_RENDER_CACHE_TTL env var, default 60)
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('BROWSER_RENDER_CACHE_MB', 0)) * 1024 * 1024)
+        if ttl is None:
+            ttl = float(os.environ.get('BROWSER_RENDER_CACHE_TTL', 60))
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, RenderEntry]' = OrderedDict()
+        self._by_frame: Dict[int, RenderEntry] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[RenderEntry]:
+        """Get a fresh render, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.time():
+                self._drop(entry)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.incr('browser.render_cache.hits' if entry else 'browser.render_cache.misses')
+        return entry
+
+    def put(self, key: str, final_url: str, frame: Frame, page_source: str) -> None:
+        """Store a render, evicting least recently used ones to fit the budget"""
+        entry = RenderEntry(key, final_url, frame, page_source, time.time() + self.ttl)
+        if not self.enabled or entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._drop(old)
+            self._entries[key] = entry
+            self._by_frame[frame.frame_id] = entry
+            self._bytes += entry.size
+
+            while self._bytes > self.max_bytes:
+                _, oldest = next(iter(self._entries.items()))
+                self._drop(oldest)
+                metrics.incr('browser.render_cache.evictions')
+
+    def frame(self, frame_id: int) -> Optional[Frame]:
+        """Get a cached render's frame by id, so it can be served to any client"""
+        with self._lock:
+            entry = self._by_frame.get(frame_id)
+            if entry is not None and entry.expires <= time.time():
+                self._drop(entry)
+                entry = None
+        return entry.frame if entry else None
+
+    def _drop(self, entry: RenderEntry) -> None:
+        """Remove an entry (caller holds _lock)"""
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        self._by_frame.pop(entry.frame.frame_id, None)
+        self._bytes -= entry.size
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None
+            }
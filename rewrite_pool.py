@@ -0,0 +1,155 @@
+"""
+Rewrite Pool Module
+Runs link rewriting for large documents in a process pool so a single big page
+doesn't hold the GIL for every other request thread in the worker
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+from link_rewriter import rewrite_links
+from metrics import metrics
+from server_env import WORKERS_ENV
+
+# Documents at least this large (UTF-8 bytes) are rewritten out of process
+DEFAULT_OFFLOAD_BYTES = 512 * 1024
+
+
+def default_pool_size() -> int:
+    """This web worker's share of the CPUs, so serve.py's workers don't each start a pool per core"""
+    web_workers = int(os.environ.get(WORKERS_ENV, 1))
+    return max(1, (os.cpu_count() or 2) // max(web_workers, 1))
+
+
+def _write_shared(data: bytes) -> str:
+    """Copy bytes into a new shared memory block and return its name"""
+    shm = SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    name = shm.name
+    shm.close()
+    return name
+
+
+def _read_shared(name: str, size: int, unlink: bool = False) -> bytes:
+    """Copy bytes out of a shared memory block"""
+    shm = SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+
+def _rewrite_shared(name: str, size: int, base_url: str,
+                    submitted_at: float) -> Tuple[str, int, float, float]:
+    """
+    Pool worker: rewrite a document held in shared memory
+
+    Returns:
+        Tuple of (result block name, result size, queue wait, rewrite seconds)
+    """
+    started_at = time.time()
+    html = _read_shared(name, size).decode('utf-8')
+
+    start = time.perf_counter()
+    result = rewrite_links(html, base_url).encode('utf-8')
+    rewrite_seconds = time.perf_counter() - start
+
+    return _write_shared(result), len(result), started_at - submitted_at, rewrite_seconds
+
+
+class RewritePool:
+    """Rewrites small documents inline and large ones in worker processes"""
+
+    def __init__(self, offload_bytes: Optional[int] = None, max_workers: Optional[int] = None):
+        """
+        Initialize rewrite pool
+
+        Args:
+            offload_bytes: Size threshold for offloading (PROXY_REWRITE_OFFLOAD_BYTES env var)
+            max_workers: Pool size (PROXY_REWRITE_WORKERS env var, default CPU
+                count divided by serve.py's worker processes)
+        """
+        if offload_bytes is None:
+            offload_bytes = int(os.environ.get('PROXY_REWRITE_OFFLOAD_BYTES', DEFAULT_OFFLOAD_BYTES))
+        if max_workers is None:
+            max_workers = int(os.environ.get('PROXY_REWRITE_WORKERS', default_pool_size()))
+
+        self.offload_bytes = offload_bytes
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the parent is a threaded web server
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def rewrite(self, html: str, base_url: str) -> str:
+        """
+        Rewrite links in a document
+
+        Args:
+            html: Document text
+            base_url: URL the document was loaded from
+
+        Returns:
+            Rewritten document
+        """
+        if self.offload_bytes <= 0 or len(html) < self.offload_bytes // 4:
+            # Even at 4 bytes per character this is under the threshold
+            return self._rewrite_inline(html, base_url)
+
+        data = html.encode('utf-8')
+        if len(data) < self.offload_bytes:
+            return self._rewrite_inline(html, base_url)
+
+        try:
+            return self._rewrite_offloaded(data, base_url)
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            metrics.incr('rewrite.pool_failures')
+            return self._rewrite_inline(html, base_url)
+
+    def _rewrite_inline(self, html: str, base_url: str) -> str:
+        with metrics.timer('rewrite.inline_seconds'):
+            return rewrite_links(html, base_url)
+
+    def _rewrite_offloaded(self, data: bytes, base_url: str) -> str:
+        start = time.perf_counter()
+        shm = SharedMemory(create=True, size=len(data))
+        try:
+            shm.buf[:len(data)] = data
+            future = self._pool().submit(_rewrite_shared, shm.name, len(data), base_url, time.time())
+            result_name, result_size, queue_wait, rewrite_seconds = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        html = _read_shared(result_name, result_size, unlink=True).decode('utf-8')
+
+        metrics.incr('rewrite.offloaded')
+        metrics.observe('rewrite.offload_bytes', len(data))
+        metrics.observe('rewrite.queue_wait_seconds', max(queue_wait, 0.0))
+        metrics.observe('rewrite.offloaded_seconds', rewrite_seconds)
+        metrics.observe('rewrite.offload_total_seconds', time.perf_counter() - start)
+        return html
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,290 @@
+"""
+Screencast Module
+Pushes frames to interactive clients as Chrome repaints, using DevTools
+Page.startScreencast, instead of clients polling for full screenshots
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+from devtools import DevToolsError
+from frames import frame_payload, frame_settings
+from metrics import metrics
+from server_env import THREADS_ENV
+
+# Frames waiting per client; older ones are dropped for slow clients
+MAX_QUEUED_FRAMES = 2
+
+# Quality and frame-skip steps used to adapt to how quickly clients keep up
+QUALITY_STEPS = (80, 65, 50, 35)
+EVERY_NTH_STEPS = (1, 2, 4, 8)
+
+# Seconds between adaptation decisions
+ADAPT_INTERVAL = 2.0
+
+# Live streams per process without serve.py (BROWSER_MAX_STREAMS env var). A
+# stream holds a request thread for as long as its client watches, so under
+# serve.py the default is half of --threads, leaving the rest for requests.
+DEFAULT_MAX_STREAMS = 16
+
+
+def max_streams() -> int:
+    configured = os.environ.get('BROWSER_MAX_STREAMS')
+    if configured:
+        return int(configured)
+    threads = os.environ.get(THREADS_ENV)
+    return max(1, int(threads) // 2) if threads else DEFAULT_MAX_STREAMS
+
+
+class StreamSlots:
+    """Counts live event streams in this process against a limit"""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit if limit is not None else max_streams()
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a slot; False when every slot is in use"""
+        with self._lock:
+            if self.active >= self.limit:
+                metrics.incr('browser.screencast_rejected')
+                return False
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.active = max(self.active - 1, 0)
+
+
+# Shared by every session's screencast in this process
+stream_slots = StreamSlots()
+
+
+class ScreencastSubscriber:
+    """One connected client's bounded queue of frame notifications"""
+
+    def __init__(self, max_queued: int = MAX_QUEUED_FRAMES):
+        self._queue = deque(maxlen=max_queued)
+        self._cond = threading.Condition()
+        self.last_sent = None
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, frame) -> None:
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+                metrics.incr('browser.screencast_dropped_frames')
+            self._queue.append(frame)
+            self._cond.notify()
+
+    def next(self, timeout: float):
+        """Wait for the next frame; None on timeout or close"""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class Screencast:
+    """
+    Screencast of one browser session, shared by all of its clients
+
+    Chrome only emits frames when the page repaints. Frames are stored in the
+    session's frame ring and announced to subscribers, who fetch them by URL
+    (or as tile deltas). A client fetching a frame counts as its
+    acknowledgement: when clients fall behind, quality is lowered and then
+    frames are skipped; when they catch up, both are restored.
+    """
+
+    def __init__(self, browser, fmt: Optional[str] = None):
+        fmt, quality = frame_settings(fmt)
+        self.browser = browser
+        # startScreencast supports jpeg and png only
+        self.format = fmt if fmt in ('jpeg', 'png') else 'jpeg'
+        self.max_quality = quality
+        self.level = 0
+
+        latest = browser.frames.get()
+        self.url = latest.url if latest else ''
+
+        self._subscribers: List[ScreencastSubscriber] = []
+        # _lock guards subscribers and counters and is taken on the DevTools
+        # reader thread; _control_lock serializes start/stop, which wait on
+        # that thread for command results, so never hold _lock around them
+        self._lock = threading.Lock()
+        self._control_lock = threading.Lock()
+        self._devtools = None
+        self._running = False
+        self._recent = deque(maxlen=32)  # ids of recently announced frames
+        self._last_acked = 0
+        self._last_adapt = time.time()
+
+    def _params(self) -> dict:
+        params = {'format': self.format, 'everyNthFrame': EVERY_NTH_STEPS[max(self.level - len(QUALITY_STEPS) + 1, 0)]}
+        if self.format == 'jpeg':
+            params['quality'] = min(self.max_quality, QUALITY_STEPS[min(self.level, len(QUALITY_STEPS) - 1)])
+        return params
+
+    def _start(self) -> None:
+        """Start (or restart with new parameters) the DevTools screencast (caller holds _control_lock)"""
+        devtools = self.browser.devtools()
+        if devtools is not self._devtools:
+            devtools.on('Page.screencastFrame', self._on_frame)
+            devtools.on('Page.frameNavigated', self._on_navigated)
+            devtools.send('Page.enable')
+            self._devtools = devtools
+            self._running = False
+        if self._running:
+            devtools.send('Page.stopScreencast')
+        devtools.send('Page.startScreencast', self._params())
+        self._running = True
+
+    def _restart(self) -> None:
+        """
+        Apply new parameters to the running screencast (caller holds _control_lock)
+
+        Uses the connection the screencast already runs on rather than
+        browser.devtools(), which waits for the driver lock, so frame fetches
+        never queue behind a navigation.
+        """
+        devtools = self._devtools
+        if devtools is None or devtools.closed:
+            return
+        devtools.send('Page.stopScreencast')
+        devtools.send('Page.startScreencast', self._params())
+
+    def _stop(self) -> None:
+        if self._running and self._devtools is not None:
+            try:
+                self._devtools.send('Page.stopScreencast')
+            except DevToolsError:
+                pass
+        self._running = False
+
+    def _on_frame(self, params: dict) -> None:
+        # Runs on the DevTools reader thread: ack without waiting
+        try:
+            self._devtools.send_nowait('Page.screencastFrameAck', {'sessionId': params['sessionId']})
+        except DevToolsError:
+            return
+
+        frame = self.browser.frames.add_encoded(base64.b64decode(params['data']), self.format, self.url)
+        metrics.incr('browser.screencast_frames')
+        metrics.observe(f'browser.frame_bytes.{self.format}', len(frame.data))
+
+        with self._lock:
+            self._recent.append(frame.frame_id)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(frame)
+
+    def _on_navigated(self, params: dict) -> None:
+        frame = params.get('frame', {})
+        if not frame.get('parentId'):
+            self.url = frame.get('url', self.url)
+
+    def subscribe(self) -> ScreencastSubscriber:
+        """
+        Add a client, starting the screencast for the first one
+
+        Raises:
+            DevToolsError: DevTools is unavailable for this driver
+        """
+        subscriber = ScreencastSubscriber()
+        with self._lock:
+            self._subscribers.append(subscriber)
+        with self._control_lock:
+            if not self._running:
+                try:
+                    self._start()
+                except Exception:
+                    with self._lock:
+                        self._subscribers.remove(subscriber)
+                    raise
+        return subscriber
+
+    def unsubscribe(self, subscriber: ScreencastSubscriber) -> None:
+        """Remove a client, stopping the screencast after the last one"""
+        subscriber.close()
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        with self._control_lock:
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                self._stop()
+
+    def acknowledge(self, frame_id: int) -> None:
+        """Record that a client fetched a frame and adapt to its lag"""
+        with self._lock:
+            self._last_acked = max(self._last_acked, frame_id)
+            now = time.time()
+            if not self._running or now - self._last_adapt < ADAPT_INTERVAL:
+                return
+            self._last_adapt = now
+
+            # Frames announced after the last one a client fetched (ids are
+            # global across sessions, so count rather than subtract)
+            lag = sum(1 for recent in self._recent if recent > self._last_acked)
+            max_level = len(QUALITY_STEPS) + len(EVERY_NTH_STEPS) - 2
+            if lag > MAX_QUEUED_FRAMES and self.level < max_level:
+                self.level += 1
+            elif lag <= 1 and self.level > 0:
+                self.level -= 1
+            else:
+                return
+
+        metrics.incr('browser.screencast_adaptations')
+        with self._control_lock:
+            if not self._running:
+                return
+            try:
+                self._restart()
+            except DevToolsError as e:
+                print(f"Could not adapt screencast: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        with self._control_lock:
+            self._stop()
+        for subscriber in subscribers:
+            subscriber.close()
+
+
+def screencast_events(screencast: Screencast, subscriber: ScreencastSubscriber, heartbeat: float = 15):
+    """
+    Server-sent event stream of frame notifications for one client
+
+    Args:
+        screencast: Screencast of the client's browser session
+        subscriber: The client's subscription
+        heartbeat: Seconds between keep-alive comments
+    """
+    try:
+        yield 'retry: 2000\n\n'
+        while not subscriber.closed:
+            frame = subscriber.next(heartbeat)
+            if frame is None:
+                yield ': ping\n\n'
+                continue
+            payload = frame_payload(frame, subscriber.last_sent)
+            subscriber.last_sent = frame.frame_id
+            yield f'event: frame\ndata: {json.dumps(payload)}\n\n'
+    finally:
+        screencast.unsubscribe(subscriber)
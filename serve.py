@@ -0,0 +1,364 @@
+"""
+Production Server
+Preforking launcher for app.py, app_advanced.py and app_google.py
+
+Usage:
+    python serve.py app_google --workers 4 --threads 16 --port 5000
+
+Each worker process imports the app, runs its warmup hooks and serves requests
+from a fixed-size thread pool. Workers bind with SO_REUSEPORT where available,
+so the kernel spreads connections across them. Send SIGHUP to the master for a
+graceful reload (new workers start before old ones drain), SIGTERM or Ctrl+C
+to stop.
+"""
+
+import argparse
+import importlib
+import os
+import secrets
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from werkzeug.serving import BaseWSGIServer
+
+from metrics import metrics
+from server_env import THREADS_ENV, WORKERS_ENV
+from shared_store import SHARED_STORE_ENV
+
+# Seconds a worker gets to finish in-flight requests after SIGTERM
+GRACEFUL_TIMEOUT = 30
+
+# Seconds the master waits for new workers to report ready during a reload
+READY_TIMEOUT = 120
+
+# A worker that exits within this many seconds of starting failed quickly;
+# replacements of quick failures back off exponentially up to
+# MAX_RESPAWN_DELAY, and the master gives up after MAX_QUICK_FAILURES in a row
+QUICK_EXIT_SECONDS = 10
+MAX_RESPAWN_DELAY = 30
+MAX_QUICK_FAILURES = 8
+
+
+def add_warmup_hook(app, hook: Callable[[], None]) -> None:
+    """
+    Register a function to run in each worker before it accepts requests
+
+    Args:
+        app: Flask application
+        hook: Callable taking no arguments
+    """
+    app.extensions.setdefault('warmup_hooks', []).append(hook)
+
+
+def run_warmup_hooks(app) -> None:
+    """Run registered warmup hooks, reporting but not failing on errors"""
+    for hook in app.extensions.get('warmup_hooks', []):
+        start = time.time()
+        try:
+            hook()
+            print(f"[worker {os.getpid()}] warmup {hook.__name__} took {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"[worker {os.getpid()}] warmup {hook.__name__} failed: {e}")
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """
+    WSGI server that handles requests on a bounded pool of threads
+
+    At most `threads` connections are handled and `queue` more wait for a
+    thread. Beyond that the server stops accepting, so further connections
+    wait in the kernel's listen backlog (and, with SO_REUSEPORT, new ones keep
+    going to the other workers' sockets) instead of piling up in memory.
+    """
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int = 8, fd: int = None,
+                 queue: Optional[int] = None):
+        super().__init__(host, port, app, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+        self._slots = threading.BoundedSemaphore(threads + (threads if queue is None else queue))
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self.executor.submit(self._handle, request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self) -> None:
+        """Stop accepting, close the listener and wait for in-flight requests"""
+        self.shutdown()
+        # With SO_REUSEPORT the kernel keeps queueing connections to an open
+        # listener, and they would be reset when this process exits
+        self.socket.close()
+        self.executor.shutdown(wait=True, cancel_futures=False)
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def create_listener(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """Create a listening socket, optionally with SO_REUSEPORT"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_app(target: str):
+    """
+    Import the Flask app from a module name or file path
+
+    Args:
+        target: 'app_google', 'app_google.py' or 'app_google:app'
+    """
+    module_name, _, attribute = target.partition(':')
+    if module_name.endswith('.py'):
+        module_name = module_name[:-3]
+    module_name = module_name.replace(os.sep, '.')
+
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or 'app')
+
+
+def worker_main(options, inherited_fd, ready_fd: int) -> None:
+    """Entry point of a forked worker process"""
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if inherited_fd is None:
+        listener = create_listener(options.host, options.port, reuse_port=True)
+        fd = listener.fileno()
+    else:
+        fd = inherited_fd
+
+    app = load_app(options.app)
+    run_warmup_hooks(app)
+
+    server = ThreadPoolWSGIServer(options.host, options.port, app, threads=options.threads, fd=fd,
+                                  queue=options.queue)
+    if inherited_fd is None:
+        # The server listens on a duplicate; this copy would keep the port open after drain()
+        listener.close()
+
+    def handle_term(signum, frame):
+        threading.Thread(target=server.drain, daemon=True).start()
+        # Hard stop if draining takes too long
+        signal.alarm(GRACEFUL_TIMEOUT)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    server.serve_forever()
+    server.executor.shutdown(wait=True)
+    metrics.flush()
+    os._exit(0)
+
+
+class Master:
+    """Forks, supervises and reloads worker processes"""
+
+    def __init__(self, options):
+        self.options = options
+        self.workers: Dict[int, int] = {}  # pid -> generation
+        self.started: Dict[int, float] = {}  # pid -> spawn time
+        self.generation = 0
+        self.stopping = False
+        self.failed = False
+        self.reload_requested = False
+        # Crashed workers not yet replaced, and when the next may start
+        self.pending_respawns = 0
+        self.respawn_at = 0.0
+        self.quick_failures = 0
+
+        self.reuse_port = reuse_port_supported() and not options.no_reuse_port
+        # Without SO_REUSEPORT every worker shares one socket bound here
+        self.listener = None if self.reuse_port else create_listener(options.host, options.port, False)
+
+    def spawn(self) -> int:
+        """Fork one worker of the current generation, returning a readiness pipe"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            try:
+                worker_main(self.options,
+                            self.listener.fileno() if self.listener else None,
+                            ready_write)
+            except Exception as e:
+                print(f"[worker {os.getpid()}] crashed: {e}")
+            os._exit(1)
+
+        os.close(ready_write)
+        self.workers[pid] = self.generation
+        self.started[pid] = time.time()
+        return ready_read
+
+    def spawn_generation(self) -> None:
+        """Start a full set of workers and wait until they are warm"""
+        self.generation += 1
+        pipes = [self.spawn() for _ in range(self.options.workers)]
+
+        deadline = time.time() + READY_TIMEOUT
+        for ready_read in pipes:
+            os.set_blocking(ready_read, False)
+            while time.time() < deadline:
+                try:
+                    if os.read(ready_read, 1):
+                        break
+                except BlockingIOError:
+                    pass
+                time.sleep(0.05)
+            os.close(ready_read)
+
+    def stop_generation(self, generation: int) -> None:
+        for pid, worker_generation in list(self.workers.items()):
+            if worker_generation == generation:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def reap(self) -> List[int]:
+        """Collect exited workers, returning the pids of unexpected exits"""
+        crashed = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            generation = self.workers.pop(pid, None)
+            started = self.started.pop(pid, None)
+            if generation == self.generation and not self.stopping:
+                crashed.append(pid)
+                if started is not None and time.time() - started < QUICK_EXIT_SECONDS:
+                    self.quick_failures += 1
+                else:
+                    self.quick_failures = 0
+        return crashed
+
+    def respawn_crashed(self) -> None:
+        """Replace crashed workers, backing off while they keep failing on start"""
+        crashed = self.reap()
+        if crashed:
+            print(f"{len(crashed)} worker(s) exited unexpectedly")
+            self.pending_respawns += len(crashed)
+            if self.quick_failures >= MAX_QUICK_FAILURES:
+                print(f"Workers failed {self.quick_failures} times in a row right after starting, giving up")
+                self.failed = self.stopping = True
+                return
+            if self.quick_failures:
+                delay = min(MAX_RESPAWN_DELAY, 0.5 * 2 ** self.quick_failures)
+                self.respawn_at = time.time() + delay
+                print(f"Starting replacements in {delay:.1f}s")
+
+        if self.pending_respawns and time.time() >= self.respawn_at:
+            for _ in range(self.pending_respawns):
+                # Replacements aren't waited for, so their readiness pipe isn't needed
+                os.close(self.spawn())
+            self.pending_respawns = 0
+
+    def run(self) -> None:
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'stopping', True))
+
+        print(f"Serving {self.options.app} on http://{self.options.host}:{self.options.port} "
+              f"with {self.options.workers} workers x {self.options.threads} threads "
+              f"({'SO_REUSEPORT' if self.reuse_port else 'shared socket'})")
+        self.spawn_generation()
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                old_generation = self.generation
+                print("Reloading workers...")
+                # The new generation starts at full strength
+                self.pending_respawns = 0
+                self.spawn_generation()
+                self.stop_generation(old_generation)
+
+            self.respawn_crashed()
+
+            time.sleep(0.5)
+
+        print("Shutting down...")
+        for generation in set(self.workers.values()):
+            self.stop_generation(generation)
+        deadline = time.time() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.2)
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a proxy app with preforked workers')
+    parser.add_argument('app', help='app module or file: app, app_advanced or app_google')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=8, help='request threads per worker')
+    parser.add_argument('--queue', type=int, default=None,
+                        help='accepted connections waiting for a thread before a worker stops '
+                             'accepting (default: one per thread)')
+    parser.add_argument('--no-reuse-port', action='store_true',
+                        help='share one listening socket instead of SO_REUSEPORT')
+    parser.add_argument('--shared-store', default=None,
+                        help='SQLite file for caches and metrics shared by workers')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+
+    # Workers inherit the environment, so they all open the same store
+    if not os.environ.get(SHARED_STORE_ENV):
+        store_path = options.shared_store or os.path.join(
+            tempfile.mkdtemp(prefix='proxy-shared-'), 'shared.sqlite3'
+        )
+        os.environ[SHARED_STORE_ENV] = store_path
+
+    os.environ[WORKERS_ENV] = str(options.workers)
+    os.environ[THREADS_ENV] = str(options.threads)
+
+    # Session cookies must verify in whichever worker a request lands on
+    os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+
+    master = Master(options)
+    master.run()
+    if master.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""
+Server Environment Module
+Names of the environment variables serve.py sets for its workers, so modules
+can size themselves to the deployment without importing the launcher
+"""
+
+# Number of worker processes, so per-process pools and limits can size
+# themselves to a share of the host
+WORKERS_ENV = 'PROXY_SERVER_WORKERS'
+
+# Request threads per worker, e.g. to cap long-lived streams
+THREADS_ENV = 'PROXY_SERVER_THREADS'
@@ -0,0 +1,264 @@
+"""
+Session Registry Module
+Records which worker process owns each browser session in the shared store,
+and forwards a session's requests to that worker over a loopback listener, so
+the browser apps can run with several workers per host
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from flask import Response, request, session
+
+from metrics import metrics
+from serve import ThreadPoolWSGIServer, add_warmup_hook
+from shared_store import SharedStore
+
+# Set on forwarded requests; a request carrying it is never forwarded again
+FORWARDED_HEADER = 'X-Proxy-Forwarded-By'
+
+# Seconds between a worker's liveness updates; three missed ones mark it dead
+HEARTBEAT_INTERVAL = 5
+WORKER_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+# Request threads on each worker's loopback listener (BROWSER_FORWARD_THREADS env var)
+DEFAULT_FORWARD_THREADS = 16
+
+# Seconds a forwarded request may go without a byte; navigation results wait
+# up to 30 s and event streams ping every 15 s
+FORWARD_READ_TIMEOUT = 60
+
+# Seconds a worker keeps a session it claimed without a browser (after serving
+# it a cached render) routed to itself
+UNHELD_CLAIM_SECONDS = 300
+
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding',
+                      'upgrade', 'te', 'trailer', 'host', 'content-length'}
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SessionRegistry:
+    """Session id to owning worker map in the shared SQLite store"""
+
+    def __init__(self, store: SharedStore):
+        """
+        Initialize session registry
+
+        Args:
+            store: SharedStore every worker on the host opens
+        """
+        self.store = store
+        self.worker: Optional[str] = None  # this process's loopback address once listening
+
+        store.execute(
+            'CREATE TABLE IF NOT EXISTS browser_workers ('
+            ' worker TEXT PRIMARY KEY, pid INTEGER NOT NULL, heartbeat REAL NOT NULL,'
+            ' sessions INTEGER NOT NULL DEFAULT 0)'
+        )
+        store.execute(
+            'CREATE TABLE IF NOT EXISTS browser_owners ('
+            ' session_id TEXT PRIMARY KEY, worker TEXT NOT NULL, claimed REAL NOT NULL)'
+        )
+
+    @classmethod
+    def from_env(cls) -> Optional['SessionRegistry']:
+        """Registry on the launcher's shared store, or None for a single process"""
+        store = SharedStore.from_env()
+        return cls(store) if store else None
+
+    def register(self, worker: str) -> None:
+        """Announce this process as the worker reachable at a loopback address"""
+        self.worker = worker
+        self.store.execute(
+            'INSERT OR REPLACE INTO browser_workers (worker, pid, heartbeat) VALUES (?, ?, ?)',
+            (worker, os.getpid(), time.time())
+        )
+
+    def heartbeat(self, sessions: int) -> None:
+        """Mark this worker alive and drop workers that have stopped"""
+        if self.worker is None:
+            return
+        self.store.execute('UPDATE browser_workers SET heartbeat = ?, sessions = ? WHERE worker = ?',
+                           (time.time(), sessions, self.worker))
+        rows = self.store.execute('SELECT worker, pid, heartbeat FROM browser_workers').fetchall()
+        for worker, pid, heartbeat in rows:
+            if worker != self.worker and not self._alive(pid, heartbeat):
+                self.unregister(worker)
+
+    def unregister(self, worker: Optional[str] = None) -> None:
+        """Forget a worker (default this one) and every session it owned"""
+        worker = worker or self.worker
+        if worker is None:
+            return
+        self.store.execute('DELETE FROM browser_owners WHERE worker = ?', (worker,))
+        self.store.execute('DELETE FROM browser_workers WHERE worker = ?', (worker,))
+
+    def _alive(self, pid: int, heartbeat: float) -> bool:
+        return time.time() - heartbeat < WORKER_TIMEOUT and _process_alive(pid)
+
+    def claim(self, session_id: str) -> None:
+        """Record that this worker now holds a session's browser"""
+        if self.worker is None:
+            return
+        self.store.execute(
+            'INSERT OR REPLACE INTO browser_owners (session_id, worker, claimed) VALUES (?, ?, ?)',
+            (session_id, self.worker, time.time())
+        )
+
+    def release(self, session_id: str) -> None:
+        """Drop a session's entry if this worker still owns it"""
+        if self.worker is None:
+            return
+        self.store.execute('DELETE FROM browser_owners WHERE session_id = ? AND worker = ?',
+                           (session_id, self.worker))
+
+    def release_unheld(self, held, older_than: float = UNHELD_CLAIM_SECONDS) -> None:
+        """Drop this worker's older claims on sessions it holds no browser for"""
+        if self.worker is None:
+            return
+        rows = self.store.execute('SELECT session_id FROM browser_owners WHERE worker = ? AND claimed < ?',
+                                  (self.worker, time.time() - older_than)).fetchall()
+        for (session_id,) in rows:
+            if session_id not in held:
+                self.release(session_id)
+
+    def forget(self, session_id: str, worker: str) -> None:
+        """Drop a session's entry for an owner that could not be reached"""
+        self.store.execute('DELETE FROM browser_owners WHERE session_id = ? AND worker = ?',
+                           (session_id, worker))
+
+    def owner(self, session_id: str) -> Optional[str]:
+        """
+        Address of the live worker that holds a session's browser
+
+        Returns:
+            None if nobody holds it, or this worker does
+        """
+        row = self.store.execute(
+            'SELECT o.worker, w.pid, w.heartbeat FROM browser_owners o'
+            ' LEFT JOIN browser_workers w ON w.worker = o.worker WHERE o.session_id = ?',
+            (session_id,)
+        ).fetchone()
+        if row is None or row[0] == self.worker:
+            return None
+        worker, pid, heartbeat = row
+        if pid is None or not self._alive(pid, heartbeat):
+            self.forget(session_id, worker)
+            return None
+        return worker
+
+    def stats(self) -> Dict:
+        rows = self.store.execute('SELECT worker, pid, heartbeat, sessions FROM browser_workers').fetchall()
+        owned = dict(self.store.execute('SELECT worker, COUNT(*) FROM browser_owners GROUP BY worker').fetchall())
+        now = time.time()
+        return {
+            'worker': self.worker,
+            'workers': [
+                {'worker': worker, 'pid': pid, 'sessions': sessions, 'registered_sessions': owned.get(worker, 0),
+                 'heartbeat_age': round(now - heartbeat, 1)}
+                for worker, pid, heartbeat, sessions in rows
+            ]
+        }
+
+
+class SessionRouter:
+    """
+    Sends each request to the worker that holds the session's browser
+
+    Every worker serves the app a second time on a loopback port. A request
+    for a session whose browser lives in another worker is replayed there,
+    and the response, including event streams, is relayed back unchanged.
+    """
+
+    def __init__(self, app, registry: Optional[SessionRegistry], browser_manager,
+                 threads: Optional[int] = None):
+        """
+        Initialize session router
+
+        Args:
+            app: Flask application to route and serve on the loopback listener
+            registry: SessionRegistry, or None to route nothing (single process)
+            browser_manager: BrowserManager whose sessions this worker owns
+            threads: Loopback listener threads (BROWSER_FORWARD_THREADS, default 16)
+        """
+        self.app = app
+        self.registry = registry
+        self.browser_manager = browser_manager
+        self.threads = threads or int(os.environ.get('BROWSER_FORWARD_THREADS', DEFAULT_FORWARD_THREADS))
+        self._http = requests.Session()
+        self._server = None
+        if registry is not None:
+            app.before_request(self.forward)
+            add_warmup_hook(app, self.start)
+
+    def start(self) -> None:
+        """Open the loopback listener and register this worker (idempotent)"""
+        if self._server is not None:
+            return
+        self._server = ThreadPoolWSGIServer('127.0.0.1', 0, self.app, threads=self.threads)
+        self.registry.register(f'127.0.0.1:{self._server.server_port}')
+        threading.Thread(target=self._server.serve_forever, name='session-router', daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name='session-heartbeat', daemon=True).start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            try:
+                browsers = self.browser_manager.sessions()
+                self.registry.heartbeat(len(browsers))
+                self.registry.release_unheld({browser.session_id for browser in browsers})
+            except sqlite3.Error as e:
+                print(f"Session registry heartbeat failed: {e}")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def forward(self):
+        """before_request hook: relay the request if another worker owns the session"""
+        if self.registry.worker is None or FORWARDED_HEADER in request.headers:
+            return None
+        if request.endpoint == 'static' or 'session_id' not in session:
+            return None
+
+        session_id = session['session_id']
+        owner = self.registry.owner(session_id)
+        if owner is None:
+            return None
+
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() not in HOP_BY_HOP_HEADERS}
+        headers[FORWARDED_HEADER] = self.registry.worker
+        try:
+            upstream = self._http.request(
+                request.method, f'http://{owner}{request.full_path}',
+                headers=headers, data=request.get_data(), stream=True,
+                allow_redirects=False, timeout=(2, FORWARD_READ_TIMEOUT)
+            )
+        except requests.RequestException as e:
+            # The owner is gone; serve here with a new browser (its saved profile, if any, is restored)
+            print(f"Could not forward to worker {owner}: {e}")
+            metrics.incr('browser.forward_failures')
+            self.registry.forget(session_id, owner)
+            return None
+
+        metrics.incr('browser.requests_forwarded')
+        response_headers = [(key, value) for key, value in upstream.raw.headers.items()
+                            if key.lower() not in HOP_BY_HOP_HEADERS]
+
+        def relay():
+            try:
+                yield from upstream.raw.stream(64 * 1024, decode_content=False)
+            finally:
+                upstream.close()
+
+        return Response(relay(), status=upstream.status_code, headers=response_headers)
@@ -0,0 +1,202 @@
+"""
+Settle Module
+Detects when a page has settled after a click or key press, from DevTools
+network and DOM-mutation events, instead of sleeping for a fixed time
+"""
+
+import os
+import threading
+import time
+from typing import Tuple
+
+from devtools import DevToolsError
+from metrics import metrics
+
+# Quiet period that counts as settled, and the longest we wait for it
+DEFAULT_QUIET_MS = 300
+DEFAULT_TIMEOUT_MS = 5000
+
+# Requests pending longer than this (long polling, streaming) don't hold up settling
+LONG_REQUEST_SECONDS = 3.0
+
+BINDING_NAME = '__proxySettleMutation'
+
+# Reports DOM mutations at most once per animation frame through the binding
+MUTATION_OBSERVER_SCRIPT = '''
+(function () {
+    if (window.__proxySettleObserver || typeof %(binding)s !== 'function') return;
+    let scheduled = false;
+    const report = () => {
+        if (scheduled) return;
+        scheduled = true;
+        requestAnimationFrame(() => { scheduled = false; %(binding)s(''); });
+    };
+    window.__proxySettleObserver = new MutationObserver(report);
+    const start = () => window.__proxySettleObserver.observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true
+    });
+    if (document.documentElement) start(); else document.addEventListener('DOMContentLoaded', start);
+})();
+''' % {'binding': BINDING_NAME}
+
+# Polling fallback: page state that changes while the page is still busy
+POLL_STATE_SCRIPT = '''
+if (!window.__proxySettleCount) {
+    window.__proxySettleCount = 1;
+    new MutationObserver(() => window.__proxySettleCount++).observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true
+    });
+}
+return [document.readyState, window.__proxySettleCount,
+        performance.getEntriesByType('resource').length];
+'''
+
+
+class SettleDetector:
+    """
+    Waits for one browser session's page to go quiet
+
+    With DevTools available, in-flight requests are tracked from Network
+    events and DOM changes are reported by a MutationObserver through a
+    Runtime binding; the page is settled once nothing is in flight and nothing
+    has changed for the quiet period. Without DevTools, page state is polled.
+    """
+
+    def __init__(self, browser, quiet_ms: int = None, timeout_ms: int = None):
+        """
+        Initialize settle detector
+
+        Args:
+            browser: BrowserSession to watch
+            quiet_ms: Quiet period (BROWSER_SETTLE_QUIET_MS env var)
+            timeout_ms: Deadline (BROWSER_SETTLE_TIMEOUT_MS env var)
+        """
+        env = os.environ
+        self.browser = browser
+        self.quiet = (quiet_ms or int(env.get('BROWSER_SETTLE_QUIET_MS', DEFAULT_QUIET_MS))) / 1000
+        self.timeout = (timeout_ms or int(env.get('BROWSER_SETTLE_TIMEOUT_MS', DEFAULT_TIMEOUT_MS))) / 1000
+
+        self._in_flight = {}  # requestId -> start time
+        self._last_activity = time.time()
+        self._cond = threading.Condition()
+        self._devtools = None
+        self._polling = False
+
+    def _attach(self) -> bool:
+        """Subscribe to DevTools events; False means fall back to polling"""
+        if self._polling:
+            return False
+        try:
+            devtools = self.browser.devtools()
+        except Exception as e:
+            print(f"Settle detection falling back to polling: {e}")
+            self._polling = True
+            return False
+        if devtools is self._devtools:
+            return True
+
+        devtools.on('Network.requestWillBeSent', self._on_request)
+        devtools.on('Network.loadingFinished', self._on_request_done)
+        devtools.on('Network.loadingFailed', self._on_request_done)
+        devtools.on('Runtime.bindingCalled', self._on_binding)
+        try:
+            devtools.send('Network.enable')
+            devtools.send('Runtime.addBinding', {'name': BINDING_NAME})
+            devtools.send('Page.addScriptToEvaluateOnNewDocument', {'source': MUTATION_OBSERVER_SCRIPT})
+            devtools.send('Runtime.evaluate', {'expression': MUTATION_OBSERVER_SCRIPT})
+        except DevToolsError as e:
+            print(f"Settle detection falling back to polling: {e}")
+            self._polling = True
+            return False
+
+        with self._cond:
+            self._in_flight.clear()
+        self._devtools = devtools
+        return True
+
+    def _activity(self) -> None:
+        with self._cond:
+            self._last_activity = time.time()
+            self._cond.notify_all()
+
+    def _on_request(self, params: dict) -> None:
+        now = time.time()
+        with self._cond:
+            self._in_flight[params.get('requestId')] = now
+            if len(self._in_flight) > 500:
+                # Forget requests whose completion we never saw
+                self._in_flight = {
+                    request_id: started for request_id, started in self._in_flight.items()
+                    if now - started < 60
+                }
+        self._activity()
+
+    def _on_request_done(self, params: dict) -> None:
+        with self._cond:
+            self._in_flight.pop(params.get('requestId'), None)
+        self._activity()
+
+    def _on_binding(self, params: dict) -> None:
+        if params.get('name') == BINDING_NAME:
+            self._activity()
+
+    def mark(self) -> None:
+        """Call just before the action; it starts the quiet window"""
+        self._attach()
+        self._activity()
+
+    def wait(self) -> Tuple[float, bool]:
+        """
+        Wait until the page settles or the deadline passes
+
+        Returns:
+            Tuple of (seconds waited, whether the page settled)
+        """
+        start = time.time()
+        if self._devtools is not None and not self._devtools.closed:
+            settled = self._wait_events(start + self.timeout)
+        else:
+            settled = self._wait_polling(start + self.timeout)
+
+        elapsed = time.time() - start
+        metrics.observe('browser.settle_seconds', elapsed)
+        if not settled:
+            metrics.incr('browser.settle_timeouts')
+        return elapsed, settled
+
+    def _wait_events(self, deadline: float) -> bool:
+        with self._cond:
+            while True:
+                now = time.time()
+                busy = [
+                    started for started in self._in_flight.values()
+                    if now - started < LONG_REQUEST_SECONDS
+                ]
+                quiet_until = self._last_activity + self.quiet
+                if not busy and now >= quiet_until:
+                    return True
+                if now >= deadline:
+                    return False
+                # Wake at the end of the quiet window, or when a long request stops counting
+                wake = quiet_until if not busy else min(busy) + LONG_REQUEST_SECONDS
+                self._cond.wait(max(min(wake, deadline) - now, 0.01))
+
+    def _wait_polling(self, deadline: float) -> bool:
+        """Poll page state through Selenium (caller holds the session lock)"""
+        driver = self.browser.driver
+        last_state = None
+        last_change = time.time()
+        while True:
+            try:
+                state = driver.execute_script(POLL_STATE_SCRIPT)
+            except Exception:
+                state = None
+            now = time.time()
+            if state != last_state:
+                last_state = state
+                last_change = now
+            elif state and state[0] == 'complete' and now - last_change >= self.quiet:
+                return True
+            if now >= deadline:
+                return False
+            time.sleep(min(0.1, max(deadline - now, 0)))
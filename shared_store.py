@@ -0,0 +1,178 @@
+"""
+Shared Store Module
+Small SQLite-backed key/value and counter store that every worker process on a
+host can read and write, used for caches and metrics under the production server
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# The production launcher points every worker at the same database file
+SHARED_STORE_ENV = 'PROXY_SHARED_STORE'
+
+INCR_SQL = (
+    "INSERT INTO counters (name, kind, count) VALUES (?, 'counter', ?) "
+    'ON CONFLICT(name) DO UPDATE SET count = count + excluded.count'
+)
+OBSERVE_SQL = (
+    "INSERT INTO counters (name, kind, count, total, max) VALUES (?, 'observation', ?, ?, ?) "
+    'ON CONFLICT(name) DO UPDATE SET count = count + excluded.count, total = total + excluded.total,'
+    ' max = MAX(max, excluded.max)'
+)
+
+
+class SharedStore:
+    """Process-shared key/value store with TTLs and aggregate counters"""
+
+    def __init__(self, path: str):
+        """
+        Initialize shared store
+
+        Args:
+            path: SQLite database file shared by all workers
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS counters ('
+            ' name TEXT PRIMARY KEY, kind TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,'
+            ' total REAL NOT NULL DEFAULT 0, max REAL NOT NULL DEFAULT 0)'
+        )
+        conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional['SharedStore']:
+        """Open the store configured by the launcher, if any"""
+        path = os.environ.get(SHARED_STORE_ENV)
+        return cls(path) if path else None
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; SQLite connections aren't shareable"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """Run a statement on this thread's connection, for modules with their own tables"""
+        return self._connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run statements as one write transaction, taking the database's write
+        lock up front so a read-modify-write can't interleave with another
+        worker's
+
+        Yields:
+            This thread's connection
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get a value
+
+        Args:
+            key: Key to look up
+
+        Returns:
+            Stored bytes, or None if missing or expired
+        """
+        row = self._connection().execute(
+            'SELECT value, expires FROM kv WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """
+        Store a value
+
+        Args:
+            key: Key to store under
+            value: Bytes to store
+            ttl: Optional lifetime in seconds
+        """
+        expires = time.time() + ttl if ttl else None
+        self._connection().execute(
+            'INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)',
+            (key, value, expires)
+        )
+
+    def delete(self, key: str) -> None:
+        """Delete a value"""
+        self._connection().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def get_json(self, key: str) -> Optional[Dict]:
+        """Get a JSON value"""
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None) -> None:
+        """Store a JSON value"""
+        self.set(key, json.dumps(value, separators=(',', ':')).encode(), ttl)
+
+    def purge_expired(self) -> int:
+        """Drop expired values, returning how many were removed"""
+        cursor = self._connection().execute(
+            'DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?', (time.time(),)
+        )
+        return cursor.rowcount
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Add to a counter"""
+        self._connection().execute(INCR_SQL, (name, amount))
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample of a timing or size"""
+        self._connection().execute(OBSERVE_SQL, (name, 1, value, value))
+
+    def add_counters(self, counters: Dict[str, int], observations: Dict[str, Dict]) -> None:
+        """
+        Apply a batch of counter increments and observation summaries in one transaction
+
+        Args:
+            counters: {name: amount}
+            observations: {name: {'count', 'total', 'max'}}
+        """
+        with self.transaction() as conn:
+            conn.executemany(INCR_SQL, counters.items())
+            conn.executemany(OBSERVE_SQL, [
+                (name, stats['count'], stats['total'], stats['max'])
+                for name, stats in observations.items()
+            ])
+
+    def counters(self) -> Dict[str, Dict]:
+        """Get every counter as {'kind', 'count', 'total', 'max'}"""
+        rows = self._connection().execute('SELECT name, kind, count, total, max FROM counters').fetchall()
+        return {
+            name: {'kind': kind, 'count': count, 'total': total, 'max': max_value}
+            for name, kind, count, total, max_value in rows
+        }
@@ -0,0 +1,55 @@
+/*
+ * Web Proxy VPN - client-side URL rewriting
+ *
+ * Installed on the first proxied page when PROXY_SERVICE_WORKER=1. Pages served
+ * to sessions that have it get a <base> pointing at the original site instead of
+ * server-side rewriting, so every subresource (including URLs built in
+ * JavaScript) resolves to the real origin and is redirected through /proxy here.
+ */
+
+self.addEventListener('install', function () {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener('fetch', function (event) {
+    var url = new URL(event.request.url);
+
+    // Requests to the proxy itself (and data:, blob:, ...) go through untouched
+    if (url.origin === self.location.origin || !url.protocol.startsWith('http')) {
+        return;
+    }
+
+    // /proxy only relays GET and POST (HEAD is answered as GET); any other
+    // method would get a 405 there, so it goes to the origin as the page sent it
+    if (['GET', 'HEAD', 'POST'].indexOf(event.request.method) === -1) {
+        return;
+    }
+
+    event.respondWith(proxied(event.request, url));
+});
+
+async function proxied(request, url) {
+    // Keep what the page sent (Range, Accept, Accept-Language, validators,
+    // ...); /proxy forwards it to the origin. Cookies come from the server's
+    // jar, and the browser sets Host for the proxy itself.
+    var headers = new Headers(request.headers);
+    headers.delete('Cookie');
+    headers.delete('Host');
+    headers.set('X-Proxy-SW', '1');
+
+    var init = {
+        method: request.method,
+        headers: headers,
+        credentials: 'same-origin',
+        redirect: 'follow'
+    };
+    if (request.method !== 'GET' && request.method !== 'HEAD') {
+        init.body = await request.arrayBuffer();
+    }
+
+    return fetch(self.location.origin + '/proxy?url=' + encodeURIComponent(url.href), init);
+}
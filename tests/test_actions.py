@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import actions
+from actions import MAX_ACTIONS, ActionError, run_actions, validate_actions
+
+
+def invalid_index(batch):
+    with pytest.raises(ActionError) as raised:
+        validate_actions(batch)
+    return raised.value.index
+
+
+def test_valid_batch_passes():
+    batch = [
+        {'type': 'click', 'selector': '#go'},
+        {'type': 'click', 'x': 10, 'y': 20.5},
+        {'type': 'type', 'text': 'hello'},
+        {'type': 'key', 'key': 'Enter', 'settle': False},
+        {'type': 'scroll', 'dy': 400},
+        {'type': 'wait_for_selector', 'selector': '#inbox', 'timeout': 2000},
+        {'type': 'navigate', 'url': 'https://example.com/'}
+    ]
+    assert validate_actions(batch) is batch
+
+
+@pytest.mark.parametrize('batch', [None, [], {'type': 'click'}, [{'type': 'click'}] * (MAX_ACTIONS + 1)])
+def test_batch_shape_is_checked(batch):
+    with pytest.raises(ActionError):
+        validate_actions(batch)
+
+
+@pytest.mark.parametrize('action', [
+    {'type': 'hover'},
+    {'type': 'click'},
+    {'type': 'click', 'x': '10', 'y': 5},
+    {'type': 'type'},
+    {'type': 'key', 'key': 'F13'},
+    {'type': 'scroll', 'dx': 'far'},
+    {'type': 'scroll', 'dy': True},
+    {'type': 'wait_for_selector', 'selector': '#a', 'timeout': '5000'},
+    {'type': 'wait_for_selector', 'selector': '#a', 'timeout': -1},
+    {'type': 'wait_for_selector'},
+    {'type': 'navigate', 'url': 'file:///etc/passwd'},
+    {'type': 'click', 'selector': '#a', 'settle': 'no'}
+])
+def test_malformed_actions_are_rejected_before_running(action):
+    assert invalid_index([{'type': 'scroll', 'dy': 1}, action]) == 1
+
+
+class FakeSettle:
+    def mark(self):
+        pass
+
+    def wait(self):
+        return 0.0, True
+
+
+class FakeDriver:
+    def execute_script(self, script, *args):
+        return False
+
+
+class FakeBrowser:
+    driver = FakeDriver()
+
+    def settle_detector(self):
+        return FakeSettle()
+
+
+def test_batch_time_limit_stops_remaining_actions(monkeypatch):
+    monkeypatch.setattr(actions.time, 'sleep', lambda seconds: None)
+    batch = validate_actions([
+        {'type': 'wait_for_selector', 'selector': '#never', 'timeout': 30000},
+        {'type': 'wait_for_selector', 'selector': '#never', 'timeout': 30000}
+    ])
+
+    start = time.time()
+    with pytest.raises(ActionError) as raised:
+        run_actions(FakeBrowser(), batch, max_seconds=0.2)
+    assert time.time() - start < 5
+    # The first wait is cut short by the batch deadline
+    assert raised.value.index == 0
+    assert 'Timed out' in raised.value.results[0]['error']
+
+
+def test_batch_deadline_skips_actions_after_it(monkeypatch):
+    batch = validate_actions([{'type': 'scroll', 'dy': 1, 'selector': '#a'}] * 2)
+    with pytest.raises(ActionError) as raised:
+        run_actions(FakeBrowser(), batch, max_seconds=0)
+    assert raised.value.index == 0
+    assert 'time limit' in str(raised.value)
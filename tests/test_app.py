@@ -0,0 +1,62 @@
+import pytest
+from requests.structures import CaseInsensitiveDict
+
+pytest.importorskip('flask')
+
+import app as proxy_app  # noqa: E402
+from metrics import metrics  # noqa: E402
+from upstream_client import UpstreamResponse  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(proxy_app, 'SERVICE_WORKER_ENABLED', True)
+
+    def fake_request(method, url, headers=None, data=None):
+        return UpstreamResponse(200, CaseInsensitiveDict({'Content-Type': 'text/css'}), b'body {}',
+                                lambda: 'body {}', 'HTTP/1.1', [])
+
+    monkeypatch.setattr(proxy_app.upstream, 'request', fake_request)
+    client = proxy_app.app.test_client()
+    client.set_cookie(proxy_app.SERVICE_WORKER_COOKIE_NAME, '1')
+    return client
+
+
+def counter(name):
+    return metrics.snapshot()['counters'].get(name, 0)
+
+
+def test_navigations_are_not_counted_in_the_service_worker_hit_rate(client):
+    before = {name: counter(name) for name in ('sw.navigations', 'sw.server_requests', 'sw.client_rewrites')}
+
+    client.get('/proxy?url=https://example.com/a.css', headers={'Sec-Fetch-Mode': 'navigate'})
+    client.get('/proxy?url=https://example.com/a.css', headers={'X-Proxy-SW': '1'})
+    client.get('/proxy?url=https://example.com/a.css')
+
+    assert counter('sw.navigations') == before['sw.navigations'] + 1
+    assert counter('sw.client_rewrites') == before['sw.client_rewrites'] + 1
+    assert counter('sw.server_requests') == before['sw.server_requests'] + 1
+
+
+def test_range_and_conditional_requests_reach_the_origin(monkeypatch, client):
+    seen = []
+
+    def fake_request(method, url, headers=None, data=None):
+        seen.append(headers)
+        if headers.get('If-None-Match') == '"v1"':
+            return UpstreamResponse(304, CaseInsensitiveDict({'ETag': '"v1"'}), b'', lambda: '', 'HTTP/1.1', [])
+        return UpstreamResponse(206, CaseInsensitiveDict({'Content-Type': 'video/mp4',
+                                                          'Content-Range': 'bytes 0-1/10'}),
+                                b'ab', lambda: 'ab', 'HTTP/1.1', [])
+
+    monkeypatch.setattr(proxy_app.upstream, 'request', fake_request)
+
+    partial = client.get('/proxy?url=https://example.com/v.mp4',
+                         headers={'X-Proxy-SW': '1', 'Range': 'bytes=0-1', 'Accept-Language': 'de'})
+    assert partial.status_code == 206
+    assert partial.headers['Content-Range'] == 'bytes 0-1/10'
+    assert seen[-1]['Range'] == 'bytes=0-1' and seen[-1]['Accept-Language'] == 'de'
+    assert 'X-Proxy-SW' not in seen[-1]
+
+    cached = client.get('/proxy?url=https://example.com/v.mp4', headers={'If-None-Match': '"v1"'})
+    assert cached.status_code == 304 and cached.data == b''
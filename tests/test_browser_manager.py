@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+from browser_manager import BrowserCapacityError, BrowserManager, BrowserSession
+
+
+class FakeDriver:
+    current_url = 'about:blank'
+
+    def quit(self):
+        pass
+
+
+def run_while_locked(browser, fn):
+    """Call fn on another thread while this one holds the browser lock"""
+    result = []
+    with browser.lock:
+        thread = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+        thread.start()
+        thread.join(2)
+    return result
+
+
+def test_lazy_helpers_do_not_wait_for_the_driver_lock():
+    browser = BrowserSession('s', FakeDriver())
+    blocker = run_while_locked(browser, browser.blocker)
+    assert blocker and blocker[0] is browser.blocker()
+    assert blocker[0].profile_for('https://example.com/') == 'none'
+    assert run_while_locked(browser, browser.page_tiles)
+
+
+class SizedDriver(FakeDriver):
+    """Driver whose memory use the test sets"""
+
+    def __init__(self, rss=0):
+        self.rss = rss
+        self.quit_called = threading.Event()
+
+    def estimated_rss(self):
+        return self.rss
+
+    def quit(self):
+        self.quit_called.set()
+
+
+def manager(**kwargs):
+    kwargs.setdefault('max_browsers', 2)
+    kwargs.setdefault('queue_timeout', 0.2)
+    kwargs.setdefault('min_idle_for_eviction', 0)
+    return BrowserManager(lambda use_proxy: SizedDriver(), **kwargs)
+
+
+def test_full_manager_rejects_after_the_queue_timeout():
+    browsers = manager(min_idle_for_eviction=60)
+    try:
+        first = browsers.get_or_create('a')
+        assert browsers.get_or_create('a') is first
+        browsers.get_or_create('b')
+        start = time.time()
+        with pytest.raises(BrowserCapacityError, match='busy'):
+            browsers.get_or_create('c')
+        assert time.time() - start >= 0.2
+        assert browsers.stats()['waiting'] == 0
+    finally:
+        browsers.shutdown()
+
+
+def test_queue_limit_rejects_at_once():
+    browsers = manager(min_idle_for_eviction=60, max_queue=0, queue_timeout=5)
+    try:
+        browsers.get_or_create('a')
+        browsers.get_or_create('b')
+        start = time.time()
+        with pytest.raises(BrowserCapacityError, match='waiting'):
+            browsers.get_or_create('c')
+        assert time.time() - start < 1
+    finally:
+        browsers.shutdown()
+
+
+def test_eviction_weighs_idle_time_by_memory_and_skips_busy_browsers():
+    browsers = manager()
+    try:
+        small, large = browsers.get_or_create('small'), browsers.get_or_create('large')
+        now = time.time()
+        small.last_access, large.last_access = now - 12, now - 10
+        small.driver.rss, large.driver.rss = 10, 1000
+
+        browsers.get_or_create('c')
+        assert {browser.session_id for browser in browsers.sessions()} == {'small', 'c'}
+        assert large.driver.quit_called.wait(2)
+
+        # The idlest browser is in use by a request, so the other one goes
+        small.last_access = time.time() - 100
+        holding, done = threading.Event(), threading.Event()
+
+        def busy_request():
+            with small.lock:
+                holding.set()
+                done.wait(5)
+
+        threading.Thread(target=busy_request, daemon=True).start()
+        assert holding.wait(2)
+        try:
+            browsers.get_or_create('d')
+        finally:
+            done.set()
+        assert {browser.session_id for browser in browsers.sessions()} == {'small', 'd'}
+    finally:
+        browsers.shutdown()
+
+
+def test_memory_budget_evicts_before_admitting():
+    browsers = manager(max_browsers=5, max_total_rss_mb=1)
+    try:
+        heavy = browsers.get_or_create('heavy')
+        heavy.driver.rss = 2 * 1024 * 1024
+        heavy.rss_measured = 0
+        browsers.get_or_create('light')
+        assert [browser.session_id for browser in browsers.sessions()] == ['light']
+    finally:
+        browsers.shutdown()
+
+
+def test_reaper_closes_idle_sessions_and_reschedules_used_ones():
+    browsers = manager(idle_timeout=0.3)
+    try:
+        idle, used = browsers.get_or_create('idle'), browsers.get_or_create('used')
+        deadline = time.time() + 0.6
+        while time.time() < deadline:
+            used.touch()
+            time.sleep(0.05)
+        assert idle.driver.quit_called.wait(2)
+        assert browsers.get('idle') is None
+        assert browsers.get('used') is used
+        assert browsers.stats()['scheduled_expiries'] >= 1
+    finally:
+        browsers.shutdown()
+
+
+def test_registry_writes_do_not_block_other_requests():
+    release_started, finish_release = threading.Event(), threading.Event()
+
+    class SlowRegistry:
+        def claim(self, session_id):
+            pass
+
+        def release(self, session_id):
+            release_started.set()
+            finish_release.wait(5)
+
+    browsers = manager(registry=SlowRegistry())
+    try:
+        browsers.get_or_create('a')
+        browsers.get_or_create('b')
+        closing = threading.Thread(target=browsers.close, args=('a',), daemon=True)
+        closing.start()
+        assert release_started.wait(2)
+
+        looked_up = []
+        lookup = threading.Thread(target=lambda: looked_up.append(browsers.get('b')), daemon=True)
+        lookup.start()
+        lookup.join(1)
+        assert looked_up and looked_up[0].session_id == 'b'
+    finally:
+        finish_release.set()
+        closing.join(5)
+        browsers.shutdown()
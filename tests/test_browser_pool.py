@@ -0,0 +1,59 @@
+import threading
+import time
+
+from browser_pool import DriverPool
+
+
+class FakeDriver:
+    service = None
+    current_url = 'about:blank'
+
+    def __init__(self, config):
+        self.config = config
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_drain_discards_a_driver_launched_with_the_old_configuration():
+    config = {'value': 'old'}
+    release = threading.Event()
+    launched = []
+
+    def factory():
+        driver = FakeDriver(config['value'])
+        launched.append(driver)
+        if driver.config == 'old':
+            release.wait(5)
+        return driver
+
+    pool = DriverPool(factory, size=1, name='test')
+    pool.start()
+    try:
+        wait_for(lambda: pool.stats()['launching'] == 1)
+
+        # The configuration changes while the old driver is still launching
+        config['value'] = 'new'
+        pool.drain()
+        release.set()
+
+        wait_for(lambda: pool.stats()['idle'] == 1)
+        assert launched[0].quit_called
+        driver = pool.checkout()
+        assert driver.config == 'new'
+    finally:
+        pool.shutdown()
+
+
+def test_checkout_launches_inline_when_empty():
+    pool = DriverPool(lambda: FakeDriver('inline'), size=0, name='empty')
+    assert pool.checkout().config == 'inline'
+    assert pool.stats()['misses'] == 1
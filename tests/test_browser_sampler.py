@@ -0,0 +1,43 @@
+from browser_sampler import RUNAWAY_STRIKES, BrowserSampler
+
+
+class FakeManager:
+    def __init__(self, restart_ok):
+        self.restart_ok = restart_ok
+        self.restarted = []
+        self.evicted = []
+
+    def restart(self, session_id):
+        self.restarted.append(session_id)
+        return self.restart_ok
+
+    def evict(self, session_id):
+        self.evicted.append(session_id)
+        return True
+
+
+class FakeBrowser:
+    session_id = 's' * 32
+    usage_strikes = 0
+    restarts = 0
+
+
+OVER_RSS = {'shared': False, 'processes': 3, 'rss': 900 * 1024 * 1024, 'cpu_percent': 5.0}
+
+
+def run_strikes(manager):
+    sampler = BrowserSampler(manager, interval=60, max_rss_mb=500, max_cpu_percent=0, action='restart')
+    browser = FakeBrowser()
+    for _ in range(RUNAWAY_STRIKES):
+        sampler._enforce(browser, OVER_RSS)
+    return manager
+
+
+def test_runaway_browser_is_restarted():
+    manager = run_strikes(FakeManager(restart_ok=True))
+    assert manager.restarted and not manager.evicted
+
+
+def test_failed_restart_escalates_to_eviction():
+    manager = run_strikes(FakeManager(restart_ok=False))
+    assert manager.restarted and manager.evicted == [FakeBrowser.session_id]
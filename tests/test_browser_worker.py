@@ -0,0 +1,210 @@
+import datetime
+import ipaddress
+import socket
+import ssl
+import struct
+import threading
+import time
+
+import pytest
+
+import browser_worker
+from browser_worker import (HEADER, MAX_MESSAGE_BYTES, BrowserWorkerError, BrowserWorkerServer,
+                            RemoteBrowserPool, client_tls_context, connect, recv_message, send_message,
+                            server_tls_context)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.commands = []
+        self.current_url = 'about:blank'
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def execute_script(self, script, *args):
+        time.sleep(args[0] if args else 0)
+        return script
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.commands.append(cmd)
+        return {'ok': True}
+
+    def quit(self):
+        pass
+
+
+def start_node(tls=None):
+    drivers = []
+
+    def launch():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    server = BrowserWorkerServer(('127.0.0.1', 0), launch, max_drivers=2, token='secret', tls=tls)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'127.0.0.1:{server.server_address[1]}', drivers
+
+
+@pytest.fixture
+def node():
+    server, address, drivers = start_node()
+    yield address, drivers
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def certificates(tmp_path):
+    """Files for a CA, a node certificate for 127.0.0.1 and an app certificate"""
+    x509 = pytest.importorskip('cryptography.x509')
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def issue(name, issuer=None, issuer_key=None, **extensions):
+        key = ec.generate_private_key(ec.SECP256R1())
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+        builder = (x509.CertificateBuilder().subject_name(subject).issuer_name(issuer or subject)
+                   .public_key(key.public_key()).serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=1)))
+        if issuer is None:
+            builder = builder.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        if 'ip' in extensions:
+            builder = builder.add_extension(
+                x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(extensions['ip']))]),
+                critical=False)
+        cert = builder.sign(issuer_key or key, hashes.SHA256())
+        path = tmp_path / f'{name}.pem'
+        path.write_bytes(cert.public_bytes(serialization.Encoding.PEM) + key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        return subject, key, str(path)
+
+    ca_name, ca_key, ca = issue('test-ca')
+    _, _, node_cert = issue('node', ca_name, ca_key, ip='127.0.0.1')
+    _, _, app_cert = issue('app', ca_name, ca_key)
+    _, _, other_ca = issue('other-ca')
+    return {'ca': ca, 'node': node_cert, 'app': app_cert, 'other_ca': other_ca}
+
+
+def test_messages_round_trip_with_attachment():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {'method': 'x', 'params': {'n': 1}}, b'\x89PNG' * 1000)
+        send_message(left, {'result': None})
+        assert recv_message(right) == ({'method': 'x', 'params': {'n': 1}}, b'\x89PNG' * 1000)
+        assert recv_message(right) == ({'result': None}, b'')
+
+
+def test_oversized_and_truncated_messages_are_connection_errors():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(HEADER.pack(MAX_MESSAGE_BYTES, 1))
+        with pytest.raises(ConnectionError):
+            recv_message(right)
+
+    left, right = socket.socketpair()
+    with right:
+        left.sendall(HEADER.pack(10, 0) + b'{"a"')
+        left.close()
+        with pytest.raises(ConnectionError):
+            recv_message(right)
+
+
+def test_header_is_two_big_endian_lengths():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {}, b'abc')
+        assert struct.unpack('>II', right.recv(8)) == (2, 3)
+
+
+def test_refuses_public_address_without_token():
+    with pytest.raises(BrowserWorkerError):
+        BrowserWorkerServer(('0.0.0.0', 0), FakeDriver, token='')
+    BrowserWorkerServer(('127.0.0.1', 0), FakeDriver, token='').server_close()
+
+
+def test_refuses_public_address_and_remote_nodes_without_tls(certificates, monkeypatch):
+    monkeypatch.delenv('BROWSER_WORKER_TLS_CERT', raising=False)
+    monkeypatch.delenv('BROWSER_WORKER_TLS_CA', raising=False)
+    with pytest.raises(BrowserWorkerError, match='TLS'):
+        BrowserWorkerServer(('0.0.0.0', 0), FakeDriver, token='secret')
+    BrowserWorkerServer(('0.0.0.0', 0), FakeDriver, token='secret',
+                        tls=server_tls_context(certificates['node'])).server_close()
+
+    with pytest.raises(BrowserWorkerError, match='TLS'):
+        RemoteBrowserPool(['127.0.0.1:9300', '10.0.0.5:9300'], token='secret')
+    RemoteBrowserPool(['10.0.0.5:9300'], token='secret', tls=client_tls_context(certificates['ca']))
+
+
+def test_tls_node_serves_only_clients_that_trust_it(certificates):
+    server, address, drivers = start_node(server_tls_context(certificates['node']))
+    try:
+        driver = RemoteBrowserPool([address], token='secret', tls=client_tls_context(certificates['ca'])).checkout()
+        try:
+            assert driver.execute_cdp_cmd('Page.getLayoutMetrics') == {'ok': True}
+        finally:
+            driver.quit()
+
+        with pytest.raises((ConnectionError, OSError)):
+            connect(address, 'secret')
+        with pytest.raises(ssl.SSLError):
+            connect(address, 'secret', client_tls_context(certificates['other_ca']))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_tls_node_with_client_ca_requires_an_app_certificate(certificates):
+    tls = server_tls_context(certificates['node'], client_ca=certificates['ca'])
+    server, address, _ = start_node(tls)
+    try:
+        connect(address, 'secret', client_tls_context(certificates['ca'], certificates['app'])).close()
+        with pytest.raises((ConnectionError, OSError)):
+            sock = connect(address, 'secret', client_tls_context(certificates['ca']))
+            sock.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_wrong_token_is_rejected(node):
+    address, _ = node
+    with pytest.raises(BrowserWorkerError):
+        connect(address, 'wrong')
+    with pytest.raises(BrowserWorkerError):
+        connect(address, '')
+
+
+def test_only_allowed_devtools_commands_run(node):
+    address, drivers = node
+    driver = RemoteBrowserPool([address], token='secret').checkout()
+    try:
+        assert driver.execute_cdp_cmd('Page.getLayoutMetrics') == {'ok': True}
+        with pytest.raises(BrowserWorkerError, match='not allowed'):
+            driver.execute_cdp_cmd('Browser.close')
+        assert drivers[0].commands == ['Page.getLayoutMetrics']
+    finally:
+        driver.quit()
+
+
+def test_slow_call_fails_without_moving_the_session(node, monkeypatch):
+    address, drivers = node
+    monkeypatch.setattr(browser_worker, 'CALL_TIMEOUT', 0.3)
+    pool = RemoteBrowserPool([address], token='secret')
+    driver = pool.checkout()
+    try:
+        assert drivers[0].page_load_timeout < 90
+        with pytest.raises(BrowserWorkerError, match='timed out'):
+            driver.execute_script('slow', 0.6)
+        assert driver.node == address and len(drivers) == 1
+        assert not pool._is_down(address)
+
+        # The late reply to the slow call is skipped, not taken for this one
+        time.sleep(0.4)
+        assert driver.execute_script('fast') == 'fast'
+    finally:
+        driver.quit()
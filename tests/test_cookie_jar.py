@@ -0,0 +1,102 @@
+import time
+
+from cookie_jar import CookieJarStore, default_path, domain_match, parse_set_cookie, path_match
+from shared_store import SharedStore
+
+
+def test_domain_and_path_matching():
+    assert domain_match('www.example.com', 'example.com')
+    assert not domain_match('badexample.com', 'example.com')
+    assert not domain_match('10.0.0.1', '0.0.1')
+    assert path_match('/docs/a', '/docs')
+    assert path_match('/docs/a', '/docs/')
+    assert not path_match('/docsearch', '/docs')
+    assert default_path('/a/b/c') == '/a/b'
+    assert default_path('/a') == '/'
+
+
+def test_parse_rejects_foreign_and_top_level_domains():
+    assert parse_set_cookie('a=1; Domain=other.com', 'https://example.com/') is None
+    assert parse_set_cookie('a=1; Domain=com', 'https://example.com/') is None
+    assert parse_set_cookie('a=1; Secure', 'http://example.com/') is None
+    assert parse_set_cookie('no-equals-sign', 'https://example.com/') is None
+
+    cookie = parse_set_cookie('a=1; Domain=.Example.com; Path=/x', 'https://www.example.com/')
+    assert (cookie.domain, cookie.path, cookie.host_only) == ('example.com', '/x', False)
+
+
+def test_max_age_wins_over_expires():
+    now = 1000.0
+    cookie = parse_set_cookie('a=1; Expires=Wed, 01 Jan 2100 00:00:00 GMT; Max-Age=10',
+                              'https://example.com/', now)
+    assert cookie.expires == now + 10
+
+
+def test_cookie_header_follows_scope_and_orders_by_path():
+    jar = CookieJarStore()
+    jar.store_from_headers('s', 'https://www.example.com/app/page', [
+        'host=1',
+        'wide=2; Domain=example.com; Path=/',
+        'deep=3; Path=/app/deeper',
+        'secret=4; Secure',
+    ])
+
+    assert jar.cookie_header('s', 'https://www.example.com/app/deeper/x') == 'deep=3; host=1; secret=4; wide=2'
+    assert jar.cookie_header('s', 'http://www.example.com/app/') == 'host=1; wide=2'
+    assert jar.cookie_header('s', 'https://api.example.com/') == 'wide=2'
+    assert jar.cookie_header('s', 'https://example.org/') is None
+    assert jar.cookie_header('other', 'https://www.example.com/') is None
+
+
+def test_expired_cookie_deletes_and_limits_drop_oldest():
+    jar = CookieJarStore(max_cookies_per_session=2)
+    jar.store_from_headers('s', 'https://example.com/', ['a=1'])
+    jar.store_from_headers('s', 'https://example.com/', ['a=1; Max-Age=0'])
+    assert jar.cookie_header('s', 'https://example.com/') is None
+
+    for name in 'xyz':
+        jar.store_from_headers('s', 'https://example.com/', [f'{name}=1'])
+        time.sleep(0.001)
+    assert jar.cookie_header('s', 'https://example.com/') == 'y=1; z=1'
+
+
+def test_sessions_are_shared_between_workers(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    first, second = CookieJarStore(shared_store=store), CookieJarStore(shared_store=store)
+
+    first.store_from_headers('s', 'https://example.com/', ['a=1'])
+    assert second.cookie_header('s', 'https://example.com/') == 'a=1'
+
+    second.clear_session('s')
+    assert first.cookie_header('s', 'https://example.com/') is None
+
+
+def test_parallel_updates_from_workers_are_merged(tmp_path):
+    path = str(tmp_path / 'shared.sqlite3')
+    first = CookieJarStore(shared_store=SharedStore(path))
+    second = CookieJarStore(shared_store=SharedStore(path))
+    first.store_from_headers('s', 'https://example.com/', ['a=1'])
+    assert second.cookie_header('s', 'https://example.com/') == 'a=1'
+
+    # Both workers hold a copy of the jar; neither update may drop the other's cookie
+    first.store_from_headers('s', 'https://example.com/', ['b=2'])
+    second.store_from_headers('s', 'https://example.com/', ['c=3'])
+    assert first.cookie_header('s', 'https://example.com/') == 'a=1; b=2; c=3'
+    assert second.cookie_header('s', 'https://example.com/') == 'a=1; b=2; c=3'
+
+
+def test_unchanged_shared_jar_is_not_reloaded(tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    writer, reader = CookieJarStore(shared_store=store), CookieJarStore(shared_store=store)
+    writer.store_from_headers('s', 'https://example.com/', ['a=1'])
+
+    loads = []
+    load_shared = reader._load_shared
+    monkeypatch.setattr(reader, '_load_shared', lambda session_id: loads.append(session_id) or load_shared(session_id))
+    for _ in range(3):
+        assert reader.cookie_header('s', 'https://example.com/') == 'a=1'
+    assert loads == ['s']
+
+    writer.store_from_headers('s', 'https://example.com/', ['a=2'])
+    assert reader.cookie_header('s', 'https://example.com/') == 'a=2'
+    assert loads == ['s', 's']
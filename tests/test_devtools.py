@@ -0,0 +1,57 @@
+import json
+import threading
+
+from devtools import DevToolsSession
+
+
+class FakeWebSocket:
+    def __init__(self, messages):
+        self.messages = [json.dumps(message) for message in messages]
+
+    def recv(self):
+        if not self.messages:
+            raise ConnectionError('closed')
+        return self.messages.pop(0)
+
+    def close(self):
+        pass
+
+
+def connection(messages=()):
+    """DevToolsSession over a fake socket, without connecting"""
+    devtools = DevToolsSession.__new__(DevToolsSession)
+    devtools.timeout = 1
+    devtools._pending = {}
+    devtools._handlers = {}
+    devtools._send_lock = threading.Lock()
+    devtools._lock = threading.Lock()
+    devtools.closed = False
+    devtools._ws = FakeWebSocket(messages)
+    return devtools
+
+
+def test_closing_a_target_session_drops_its_handlers():
+    devtools = connection()
+    page = devtools.target_session('A')
+    other = devtools.target_session('B')
+    page.on('Page.screencastFrame', lambda params: None)
+    page.on('Network.requestWillBeSent', lambda params: None)
+    other.on('Page.screencastFrame', lambda params: None)
+
+    page.close()
+    assert page.closed
+    assert list(devtools._handlers) == [('B', 'Page.screencastFrame')]
+
+
+def test_detached_targets_lose_their_handlers():
+    seen = []
+    devtools = connection([
+        {'sessionId': 'A', 'method': 'Page.frameNavigated', 'params': {'n': 1}},
+        {'method': 'Target.detachedFromTarget', 'params': {'sessionId': 'A'}},
+        {'sessionId': 'A', 'method': 'Page.frameNavigated', 'params': {'n': 2}},
+    ])
+    devtools.on('Page.frameNavigated', lambda params: seen.append(params['n']), 'A')
+
+    devtools._read_loop()
+    assert seen == [1]
+    assert devtools._handlers == {}
@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('requests')
+
+from flask import Flask
+from requests.structures import CaseInsensitiveDict
+
+import dom_view
+from dom_view import resource_response, sanitize_dom
+
+
+class FakeUpstream:
+    def __init__(self, content_type, body=b'data', status=200):
+        self.headers = CaseInsensitiveDict({'Content-Type': content_type} if content_type else {})
+        self.status_code = status
+        self.url = 'https://example.com/static/a'
+        self.body = body
+        self.closed = False
+
+    @property
+    def text(self):
+        return self.body.decode()
+
+    def iter_content(self, size):
+        yield self.body
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fetch(monkeypatch):
+    app = Flask(__name__)
+
+    def fetch(upstream, url='https://example.com/static/a'):
+        monkeypatch.setattr(dom_view.requests, 'get', lambda *args, **kwargs: upstream)
+        with app.test_request_context('/resource'):
+            response = resource_response(url, {})
+            response.direct_passthrough = False
+            return response
+    return fetch
+
+
+def test_sanitize_dom_strips_scripts_frames_handlers_and_javascript_urls():
+    page = sanitize_dom(
+        '<html><head><base href="https://evil.example/"><script src="a.js"></script>'
+        '<meta http-equiv="Content-Security-Policy" content="script-src *"></head>'
+        '<body onload="steal()"><iframe src="https://ads.example/"></iframe>'
+        '<img src="a.png" onerror=alert(1) srcset="b.png 2x"><a href="javascript:alert(1)">x</a>'
+        '<script>alert(2)</script><p>kept</p></body></html>'
+    )
+    assert '<p>kept</p>' in page
+    assert '<img src="a.png">' in page
+    for dropped in ('<script', 'steal', 'iframe', '<base', 'Content-Security-Policy', 'onerror',
+                    'srcset', 'javascript:'):
+        assert dropped not in page
+
+
+def test_resource_passes_images_inline_with_a_sandbox(fetch):
+    response = fetch(FakeUpstream('image/png', b'\x89PNG'))
+    assert response.status_code == 200
+    assert response.get_data() == b'\x89PNG'
+    assert response.headers['Content-Type'] == 'image/png'
+    assert response.headers['Content-Security-Policy'] == "default-src 'none'; sandbox"
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert 'Content-Disposition' not in response.headers
+
+
+def test_resource_marks_stylesheets_and_media_as_downloads(fetch):
+    css = fetch(FakeUpstream('text/css; charset=utf-8', b'body { background: url(bg.png) }'))
+    assert css.status_code == 200
+    assert '/resource?url=https%3A%2F%2Fexample.com%2Fstatic%2Fbg.png' in css.get_data(as_text=True)
+    assert css.headers['Content-Disposition'] == 'attachment'
+
+    video = fetch(FakeUpstream('video/mp4'))
+    assert video.status_code == 200
+    assert video.headers['Content-Disposition'] == 'attachment'
+
+
+@pytest.mark.parametrize('content_type', ['text/html', 'image/svg+xml', 'application/javascript',
+                                          'text/xml', 'application/octet-stream', None])
+def test_resource_refuses_types_that_could_run_script(fetch, content_type):
+    upstream = FakeUpstream(content_type, b'<script>alert(1)</script>')
+    response = fetch(upstream)
+    assert response.status_code == 415
+    assert b'<script>' not in response.get_data()
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert upstream.closed
+
+
+def test_resource_refuses_other_schemes(fetch):
+    response = fetch(FakeUpstream('image/png'), url='file:///etc/passwd')
+    assert response.status_code == 400
+    assert response.mimetype == 'text/plain'
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from flask import Flask  # noqa: E402
+
+from frame_diff import FrameDiffer, delta_response  # noqa: E402
+from frames import Frame  # noqa: E402
+
+
+def png_frame(frame_id, pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'PNG')
+    return Frame(frame_id, buffer.getvalue(), 'png')
+
+
+def blank(width=256, height=128):
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def test_changed_tiles_finds_only_tiles_over_the_threshold():
+    differ = FrameDiffer(tile_size=64)
+    old = blank()
+    new = old.copy()
+    new[10, 70] = 255          # tile (0, 1)
+    new[100, 200] = 255        # tile (1, 3)
+    new[5, 5] = 5              # under the threshold
+
+    rows, cols, grid_columns, total = differ.changed_tiles(old, new)
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 3)]
+    assert (grid_columns, total) == (4, 8)
+
+
+def test_delta_packs_changed_tiles_into_an_atlas():
+    differ = FrameDiffer(tile_size=64)
+    old = blank()
+    new = old.copy()
+    new[0:64, 128:192] = 200
+
+    delta = differ.delta(png_frame(2, new), png_frame(1, old))
+    assert delta.tiles == [2]
+    assert delta.atlas_columns == 1
+    atlas = np.asarray(Image.open(io.BytesIO(delta.atlas)).convert('RGB'))
+    assert atlas.shape == (64, 64, 3)
+    assert (atlas == 200).all()
+
+
+def test_large_changes_fall_back_to_a_full_frame():
+    differ = FrameDiffer(tile_size=64)
+    new = blank()
+    new[:] = 255
+    assert differ.delta(png_frame(2, new), png_frame(1, blank())) is None
+
+
+def test_full_frame_is_sent_after_keyframe_interval_deltas():
+    differ = FrameDiffer(tile_size=64, keyframe_interval=2)
+    frames = []
+    for frame_id in range(1, 6):
+        pixels = blank()
+        pixels[0:10, 0:10] = frame_id * 40
+        frames.append(png_frame(frame_id, pixels))
+
+    app = Flask(__name__)
+    full = []
+    with app.test_request_context():
+        for since, frame in zip(frames, frames[1:]):
+            full.append(delta_response(differ, frame, since).headers.get('X-Frame-Full') == '1')
+    assert full == [False, False, True, False]
+
+
+def test_decoded_frames_are_bounded_by_bytes():
+    pixels = blank()
+    differ = FrameDiffer(tile_size=64, pixel_cache_mb=pixels.nbytes * 2.5 / (1024 * 1024))
+    for frame_id in range(1, 6):
+        differ._decode(png_frame(frame_id, pixels))
+    assert len(differ._pixels) == 2
+    assert differ._pixel_bytes == 2 * pixels.nbytes
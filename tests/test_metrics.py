@@ -0,0 +1,56 @@
+import sqlite3
+
+from metrics import Metrics
+from shared_store import SharedStore
+
+
+def test_local_metrics():
+    metrics = Metrics()
+    metrics.incr('hits')
+    metrics.incr('hits', 2)
+    metrics.observe('seconds', 1.0)
+    metrics.observe('seconds', 3.0)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'hits': 3}
+    assert snapshot['observations']['seconds'] == {'count': 2, 'total': 4.0, 'max': 3.0, 'avg': 2.0}
+    assert snapshot['shared'] is False
+
+
+def test_shared_metrics_are_buffered_until_flushed(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    metrics = Metrics(store, flush_interval=3600)
+    metrics.incr('hits')
+    metrics.observe('seconds', 2.0)
+    assert store.counters() == {}
+
+    metrics.flush()
+    metrics.incr('hits')
+    metrics.flush()
+    assert store.counters()['hits']['count'] == 2
+    assert store.counters()['seconds'] == {'kind': 'observation', 'count': 1, 'total': 2.0, 'max': 2.0}
+
+
+def test_busy_store_keeps_metrics_for_the_next_flush(tmp_path):
+    class BusyStore(SharedStore):
+        busy = True
+
+        def add_counters(self, counters, observations):
+            if self.busy:
+                raise sqlite3.OperationalError('database is locked')
+            super().add_counters(counters, observations)
+
+    store = BusyStore(str(tmp_path / 'shared.sqlite3'))
+    metrics = Metrics(store, flush_interval=3600)
+    metrics.incr('hits', 2)
+    metrics.observe('seconds', 1.5)
+
+    # Recording and reading never raise while the store is busy
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'hits': 2}
+    assert snapshot['observations']['seconds']['count'] == 1
+
+    store.busy = False
+    metrics.incr('hits')
+    metrics.flush()
+    assert store.counters()['hits']['count'] == 3
@@ -0,0 +1,95 @@
+import base64
+
+import pytest
+
+pytest.importorskip('flask')
+
+import page_tiles
+from page_tiles import MAX_PAGE_HEIGHT, PageTiles
+
+
+class FakeDriver:
+    def __init__(self, width=1000, height=3000):
+        self.size = {'width': width, 'height': height}
+        self.epoch = 0
+        self.captures = 0
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Page.getLayoutMetrics':
+            return {'cssContentSize': dict(self.size)}
+        self.captures += 1
+        return {'data': base64.b64encode(b'tile%d' % self.captures).decode()}
+
+    def execute_script(self, script, *args):
+        return ['https://example.com/', self.epoch]
+
+
+class FakeViewport:
+    key = '1280x800@1'
+    dpr = 1
+
+
+class FakeBrowser:
+    def __init__(self, driver):
+        self.driver = driver
+        self.viewport = FakeViewport()
+
+
+@pytest.fixture
+def tiles(monkeypatch):
+    monkeypatch.setenv('BROWSER_PAGE_TILE_SIZE', '512')
+    driver = FakeDriver()
+    return PageTiles(FakeBrowser(driver), cache_mb=1), driver
+
+
+def test_manifest_levels_stop_once_the_width_fits(tiles):
+    pyramid, driver = tiles
+    manifest = pyramid.manifest()
+    assert [(level['columns'], level['rows']) for level in manifest['levels']] == [(2, 6), (1, 3)]
+    assert manifest['levels'][1]['scale'] == 0.5
+    assert manifest['tile_url'] == f"/api/tiles/{manifest['state']}/{{level}}/{{x}}/{{y}}"
+
+
+def test_manifest_caps_page_height(tiles):
+    pyramid, driver = tiles
+    driver.size = {'width': 100, 'height': 10 ** 6}
+    manifest = pyramid.manifest()
+    assert manifest['height'] == MAX_PAGE_HEIGHT
+    assert manifest['levels'] == [{'level': 0, 'scale': 1, 'columns': 1, 'rows': 59}]
+
+
+def test_tiles_are_cached_and_out_of_range_tiles_are_none(tiles):
+    pyramid, driver = tiles
+    state = pyramid.manifest()['state']
+    assert pyramid.tile(state, 0, 1, 5) == pyramid.tile(state, 0, 1, 5)
+    assert driver.captures == 1
+    assert pyramid.tile(state, 0, 2, 0) is None
+    assert pyramid.tile(state, 4, 0, 0) is None
+
+
+def test_previous_state_tiles_are_served_for_a_grace_period(tiles, monkeypatch):
+    pyramid, driver = tiles
+    old_state = pyramid.manifest()['state']
+    old_tile = pyramid.tile(old_state, 0, 0, 0)
+
+    driver.epoch += 1
+    new_state = pyramid.manifest()['state']
+    assert new_state != old_state
+    assert pyramid.tile(old_state, 0, 0, 0) == old_tile
+    # Tiles the old state never rendered can't be made any more
+    assert pyramid.tile(old_state, 0, 1, 0) is None
+
+    now = page_tiles.time.time()
+    monkeypatch.setattr(page_tiles.time, 'time', lambda: now + page_tiles.PREVIOUS_STATE_GRACE + 1)
+    assert pyramid.tile(old_state, 0, 0, 0) is None
+    assert pyramid.tile(new_state, 0, 0, 0) is not None
+
+
+def test_size_or_viewport_changes_make_a_new_state(tiles):
+    pyramid, driver = tiles
+    first = pyramid.manifest()['state']
+    assert pyramid.manifest()['state'] == first
+    driver.size['height'] += 1
+    second = pyramid.manifest()['state']
+    pyramid.browser.viewport.key = '390x844@3'
+    assert len({first, second, pyramid.manifest()['state']}) == 3
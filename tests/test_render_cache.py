@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip('flask')
+
+import render_cache
+from frames import Frame, next_frame_id
+from render_cache import RenderCache, render_key
+
+
+def frame(size=100):
+    return Frame(next_frame_id(), b'x' * size, 'jpeg')
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RenderCache(max_bytes=0)
+    cache.put('k', 'https://example.com/', frame(), '<html>')
+    assert not cache.enabled
+    assert cache.get('k') is None
+
+
+def test_key_separates_viewport_and_profile():
+    keys = {render_key('https://example.com/', viewport, profile)
+            for viewport in ('1280x800@1', '390x844@3') for profile in ('default', 'strict')}
+    assert len(keys) == 4
+
+
+def test_hit_miss_and_frame_lookup():
+    cache = RenderCache(max_bytes=10_000, ttl=60)
+    shot = frame()
+    cache.put('k', 'https://example.com/final', shot, '<html>')
+
+    entry = cache.get('k')
+    assert entry.final_url == 'https://example.com/final'
+    assert cache.frame(shot.frame_id) is shot
+    assert cache.get('other') is None
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_lru_eviction_by_bytes():
+    cache = RenderCache(max_bytes=2_500, ttl=60)
+    shots = [frame(1000) for _ in range(3)]
+    cache.put('a', 'u', shots[0], '')
+    cache.put('b', 'u', shots[1], '')
+    cache.get('a')
+    cache.put('c', 'u', shots[2], '')
+
+    assert cache.get('b') is None
+    assert cache.frame(shots[1].frame_id) is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['bytes'] <= 2_500
+
+    cache.put('huge', 'u', frame(5_000), '')
+    assert cache.get('huge') is None
+
+
+def test_replacing_a_key_drops_the_old_frame():
+    cache = RenderCache(max_bytes=10_000, ttl=60)
+    old, new = frame(), frame()
+    cache.put('k', 'u', old, '')
+    cache.put('k', 'u', new, '')
+    assert cache.frame(old.frame_id) is None
+    assert cache.stats()['bytes'] == cache.get('k').size
+
+
+def test_expired_renders_and_their_frames_are_gone(monkeypatch):
+    cache = RenderCache(max_bytes=10_000, ttl=60)
+    shot = frame()
+    cache.put('k', 'u', shot, '')
+
+    now = render_cache.time.time()
+    monkeypatch.setattr(render_cache.time, 'time', lambda: now + 61)
+    assert cache.frame(shot.frame_id) is None
+    assert cache.get('k') is None
+    assert cache.stats()['bytes'] == 0
@@ -0,0 +1,121 @@
+"""Shared renders must never carry a returning user's logins to anyone else"""
+
+import base64
+import importlib
+import os
+import re
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('selenium')
+
+
+class FakeDriver:
+    def __init__(self):
+        self.current_url = 'about:blank'
+        self.cookies = []
+
+    def get(self, url):
+        self.current_url = url
+        if '/magic-link' in url:
+            self.cookies.append({'name': 'auth', 'value': 'token', 'domain': 'example.com'})
+
+    @property
+    def page_source(self):
+        return f'<html><body>{self.current_url}</body></html>'
+
+    def execute_script(self, script, *args):
+        return 'complete'
+
+    def execute_cdp_cmd(self, command, params):
+        if command == 'Page.captureScreenshot':
+            return {'data': base64.b64encode(b'\xff\xd8' + os.urandom(16)).decode()}
+        if command == 'Network.getAllCookies':
+            return {'cookies': list(self.cookies)}
+        return {}
+
+    def set_window_size(self, *args):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('BROWSER_POOL_SIZE', '0')
+    monkeypatch.setenv('BROWSER_ASYNC_NAVIGATION', '0')
+    module = importlib.import_module('app_advanced')
+
+    from render_cache import RenderCache
+    monkeypatch.setattr(module, 'render_cache', RenderCache(max_bytes=10 * 1024 * 1024, ttl=60))
+    monkeypatch.setattr(module.browser_manager, 'acquire_driver', lambda use_proxy=False: FakeDriver())
+    monkeypatch.setattr(module.time, 'sleep', lambda seconds: None)
+    yield module
+    for browser in module.browser_manager.sessions():
+        module.browser_manager.evict(browser.session_id)
+
+
+def frame_id(response):
+    return int(re.search(r'/api/frame/(\d+)', response.get_data(as_text=True)).group(1))
+
+
+def test_anonymous_render_is_shared_but_its_frame_only_with_served_sessions(app_module):
+    first, second, third = (app_module.app.test_client() for _ in range(3))
+
+    rendered = first.get('/proxy?url=https://example.com/')
+    assert rendered.status_code == 200
+    assert app_module.render_cache.stats()['entries'] == 1
+
+    shared = second.get('/proxy?url=https://example.com/')
+    shared_id = frame_id(shared)
+    assert app_module.render_cache.frame(shared_id) is not None
+    assert second.get(f'/api/frame/{shared_id}').status_code == 200
+
+    # A session that was never sent this render can't fetch it by id
+    third.get('/')
+    assert third.get(f'/api/frame/{shared_id}').status_code != 200
+
+
+def test_render_of_a_restored_profile_is_not_shared(app_module, monkeypatch):
+    # The snapshot shows up only when the browser is created (e.g. another
+    # worker saved it), so the early cacheability check can't see it
+    monkeypatch.setattr(app_module.profile_store, 'has', lambda session_id: False)
+    monkeypatch.setattr(app_module.profile_store, 'restore', lambda session_id, driver: True)
+
+    client = app_module.app.test_client()
+    assert client.get('/proxy?url=https://example.com/account').status_code == 200
+    assert app_module.render_cache.stats()['entries'] == 0
+
+
+def test_session_with_a_saved_profile_skips_the_cache(app_module, monkeypatch):
+    anonymous = app_module.app.test_client()
+    anonymous.get('/proxy?url=https://example.com/')
+    hits = app_module.render_cache.stats()['hits']
+
+    monkeypatch.setattr(app_module.profile_store, 'has', lambda session_id: True)
+    returning = app_module.app.test_client()
+    page = returning.get('/proxy?url=https://example.com/')
+    assert page.status_code == 200
+    assert app_module.render_cache.stats()['hits'] == hits
+    assert app_module.render_cache.frame(frame_id(page)) is None
+
+
+def test_render_after_a_navigation_set_cookies_is_not_shared(app_module):
+    client = app_module.app.test_client()
+    # A GET that signs the browser in; its cookies only exist after it loads
+    client.get('/proxy?url=https://example.com/magic-link?token=1')
+    entries = app_module.render_cache.stats()['entries']
+
+    page = client.get('/proxy?url=https://www.example.com/account')
+    assert page.status_code == 200
+    assert app_module.render_cache.stats()['entries'] == entries
+    assert app_module.render_cache.frame(frame_id(page)) is None
+
+    # Nor does the session get anyone else's render any more
+    app_module.app.test_client().get('/proxy?url=https://example.org/')
+    hits = app_module.render_cache.stats()['hits']
+    client.get('/proxy?url=https://example.org/')
+    assert app_module.render_cache.stats()['hits'] == hits
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from rewrite_pool import RewritePool, default_pool_size
+from server_env import WORKERS_ENV
+
+
+def test_pool_size_is_split_between_server_workers(monkeypatch):
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    monkeypatch.delenv('PROXY_REWRITE_WORKERS', raising=False)
+
+    monkeypatch.delenv(WORKERS_ENV, raising=False)
+    assert default_pool_size() == 8
+
+    monkeypatch.setenv(WORKERS_ENV, '4')
+    assert RewritePool().max_workers == 2
+
+    monkeypatch.setenv(WORKERS_ENV, '16')
+    assert default_pool_size() == 1
+
+
+def test_explicit_pool_size_wins(monkeypatch):
+    monkeypatch.setenv(WORKERS_ENV, '4')
+    monkeypatch.setenv('PROXY_REWRITE_WORKERS', '3')
+    assert RewritePool().max_workers == 3
+
+
+def test_importing_the_pool_leaves_the_launcher_out():
+    code = 'import sys, rewrite_pool; print("serve" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == 'False', result.stderr
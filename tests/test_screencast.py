@@ -0,0 +1,59 @@
+import threading
+
+from frames import FrameRing
+from screencast import Screencast, StreamSlots, max_streams
+from server_env import THREADS_ENV
+
+
+class FakeDevTools:
+    closed = False
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, method, params=None):
+        self.sent.append((method, params))
+        return {}
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.frames = FrameRing()
+
+    def devtools(self):
+        raise AssertionError('acknowledge must not reconnect through the driver lock')
+
+
+def test_acknowledge_adapts_without_the_driver_lock():
+    browser = FakeBrowser()
+    screencast = Screencast(browser, 'jpeg')
+    screencast._devtools = FakeDevTools()
+    screencast._running = True
+    screencast._last_adapt = 0
+    screencast._recent.extend(range(10, 20))
+
+    done = threading.Event()
+    with browser.lock:
+        thread = threading.Thread(target=lambda: (screencast.acknowledge(10), done.set()), daemon=True)
+        thread.start()
+        assert done.wait(2)
+
+    assert screencast.level == 1
+    assert [method for method, _ in screencast._devtools.sent] == ['Page.stopScreencast', 'Page.startScreencast']
+
+
+def test_stream_slots_limit_live_streams():
+    slots = StreamSlots(limit=2)
+    assert slots.acquire() and slots.acquire()
+    assert not slots.acquire()
+    slots.release()
+    assert slots.acquire()
+
+
+def test_stream_limit_defaults_to_half_the_server_threads(monkeypatch):
+    monkeypatch.delenv('BROWSER_MAX_STREAMS', raising=False)
+    monkeypatch.setenv(THREADS_ENV, '16')
+    assert max_streams() == 8
+    monkeypatch.setenv('BROWSER_MAX_STREAMS', '3')
+    assert max_streams() == 3
@@ -0,0 +1,107 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+import serve
+from serve import ThreadPoolWSGIServer
+
+
+def test_thread_pool_server_bounds_concurrency_and_releases_slots():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def app(environ, start_response):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    server = ThreadPoolWSGIServer('127.0.0.1', 0, app, threads=1, queue=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/'
+        results = []
+        clients = [threading.Thread(target=lambda: results.append(requests.get(url, timeout=10).status_code))
+                   for _ in range(4)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        assert results == [200] * 4
+        assert peak[0] == 1
+        # Every slot is free again once the connections are closed
+        deadline = time.time() + 5
+        while server._slots._value != 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert server._slots._value == 1
+    finally:
+        server.drain()
+
+
+def test_drain_closes_the_listener():
+    def app(environ, start_response):
+        start_response('200 OK', [])
+        return [b'ok']
+
+    server = ThreadPoolWSGIServer('127.0.0.1', 0, app, threads=1)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    assert requests.get(f'http://127.0.0.1:{port}/', timeout=5).status_code == 200
+    server.drain()
+    with pytest.raises(OSError):
+        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+
+
+class FakeWorkers:
+    """Stands in for fork and waitpid: every spawned worker exits at once"""
+
+    def __init__(self, monkeypatch, master):
+        self.exited = []
+        self.spawned = 0
+        self.next_pid = 1000
+        monkeypatch.setattr(serve.os, 'waitpid', self.waitpid)
+        monkeypatch.setattr(serve.os, 'close', lambda fd: None)
+        monkeypatch.setattr(master, 'spawn', lambda: self.spawn(master))
+
+    def spawn(self, master):
+        self.next_pid += 1
+        self.spawned += 1
+        master.workers[self.next_pid] = master.generation
+        master.started[self.next_pid] = time.time()
+        self.exited.append(self.next_pid)
+        return -1
+
+    def waitpid(self, pid, options):
+        if not self.exited:
+            return 0, 0
+        return self.exited.pop(0), 256
+
+
+def test_workers_failing_on_start_are_respawned_with_backoff(monkeypatch):
+    master = serve.Master(serve.parse_args(['app', '--workers', '1']))
+    master.generation = 1
+    workers = FakeWorkers(monkeypatch, master)
+    workers.spawn(master)
+
+    master.respawn_crashed()
+    assert workers.spawned == 1 and master.pending_respawns == 1
+    assert master.respawn_at > time.time()
+
+    master.respawn_at = 0
+    master.respawn_crashed()
+    assert workers.spawned == 2 and master.pending_respawns == 0
+
+    for _ in range(2 * serve.MAX_QUICK_FAILURES):
+        master.respawn_at = 0
+        master.respawn_crashed()
+        if master.failed:
+            break
+    assert master.failed and master.stopping
+    assert master.quick_failures == serve.MAX_QUICK_FAILURES
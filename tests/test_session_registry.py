@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+
+from frames import FRAME_IDS_PER_PROCESS, next_frame_id
+from session_registry import SessionRegistry
+from shared_store import SharedStore
+
+
+def test_frame_ids_differ_between_processes():
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, str(next_frame_id()).encode())
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    child_id = int(os.read(read_fd, 64))
+    os.close(read_fd)
+
+    own_id = next_frame_id()
+    assert own_id // FRAME_IDS_PER_PROCESS == os.getpid()
+    assert child_id // FRAME_IDS_PER_PROCESS == pid
+    assert next_frame_id() == own_id + 1
+    assert own_id < 2 ** 53
+
+
+def test_claims_without_a_browser_expire(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    registry = SessionRegistry(store)
+    registry.register('127.0.0.1:1')
+    other = SessionRegistry(store)
+    other.register('127.0.0.1:2')
+
+    registry.claim('cached-only')
+    registry.claim('has-browser')
+
+    registry.release_unheld({'has-browser'})
+    assert other.owner('cached-only') == '127.0.0.1:1'
+
+    registry.release_unheld({'has-browser'}, older_than=-1)
+    assert other.owner('cached-only') is None
+    assert other.owner('has-browser') == '127.0.0.1:1'
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+import requests
+
+import upstream_client
+from upstream_client import UpstreamClient
+
+httpx = pytest.importorskip('httpx')
+pytestmark = pytest.mark.skipif(not upstream_client.HTTP2_AVAILABLE, reason='httpx[http2] not installed')
+
+
+def client_raising(error):
+    client = UpstreamClient(http2=True)
+
+    def fail(*args):
+        raise error
+
+    client._request_http2 = fail
+    return client
+
+
+def test_http2_read_timeout_maps_to_requests_timeout():
+    with pytest.raises(requests.exceptions.Timeout) as raised:
+        client_raising(httpx.ReadTimeout('slow')).request('GET', 'https://example.com/')
+    assert not isinstance(raised.value, requests.exceptions.ConnectionError)
+
+
+def test_http2_connect_timeout_maps_to_connect_timeout():
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        client_raising(httpx.ConnectTimeout('unreachable')).request('GET', 'https://example.com/')
+
+
+def test_http2_other_errors_map_to_connection_error():
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client_raising(httpx.ConnectError('refused')).request('GET', 'https://example.com/')
+
+
+def flaky_client(failures):
+    """Client whose HTTP/2 path raises a protocol error `failures` times, then answers"""
+    client = UpstreamClient(http2=True)
+    calls = {'http2': 0, 'http1': 0}
+    response = upstream_client.UpstreamResponse(200, {}, b'', lambda: '', 'HTTP/2', [])
+
+    def http2(*args):
+        calls['http2'] += 1
+        if calls['http2'] <= failures:
+            raise httpx.RemoteProtocolError('connection closed')
+        return response
+
+    def http1(*args):
+        calls['http1'] += 1
+        return upstream_client.UpstreamResponse(200, {}, b'', lambda: '', 'HTTP/1.1', [])
+
+    client._request_http2, client._request_http1 = http2, http1
+    return client, calls
+
+
+def test_one_protocol_error_is_retried_over_http2():
+    client, calls = flaky_client(failures=1)
+    assert client.request('GET', 'https://example.com/').http_version == 'HTTP/2'
+    assert calls == {'http2': 2, 'http1': 0}
+    assert not client._pinned_to_http1('https://example.com')
+
+
+def test_repeated_protocol_errors_pin_the_origin_for_a_while(monkeypatch):
+    client, calls = flaky_client(failures=2)
+    assert client.request('GET', 'https://example.com/').http_version == 'HTTP/1.1'
+    client.request('GET', 'https://example.com/')
+    assert calls == {'http2': 2, 'http1': 2}
+
+    now = time.time()
+    monkeypatch.setattr(upstream_client.time, 'time', lambda: now + upstream_client.HTTP1_PIN_SECONDS + 1)
+    assert client.request('GET', 'https://example.com/').http_version == 'HTTP/2'
+
+
+def test_pinned_origins_are_capped(monkeypatch):
+    monkeypatch.setattr(upstream_client, 'MAX_HTTP1_ORIGINS', 2)
+    client = UpstreamClient(http2=True)
+    for origin in ('https://a', 'https://b', 'https://c'):
+        client._pin_to_http1(origin)
+    assert list(client._http1_only_origins) == ['https://b', 'https://c']
+
+
+def test_post_is_not_replayed_after_a_protocol_error():
+    client, calls = flaky_client(failures=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.request('POST', 'https://example.com/form', data=b'a=1')
+    assert calls == {'http2': 1, 'http1': 0}
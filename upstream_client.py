@@ -0,0 +1,213 @@
+"""
+Upstream Client Module
+Fetches origin URLs for the proxy, multiplexing concurrent requests to the same
+origin over one HTTP/2 connection when httpx[http2] is installed, and falling
+back to requests over HTTP/1.1 otherwise
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from metrics import metrics
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    import httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTP2_AVAILABLE = False
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Connection-specific headers are illegal in HTTP/2 requests
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade', 'te'}
+
+# Methods safe to send again after an HTTP/2 protocol error
+REPLAYABLE_METHODS = ('GET', 'HEAD')
+
+# Seconds an origin that keeps failing over HTTP/2 is sent HTTP/1.1 instead,
+# and how many such origins are remembered
+HTTP1_PIN_SECONDS = 600
+MAX_HTTP1_ORIGINS = 1024
+
+
+class UpstreamResponse:
+    """Transport-independent view of an origin response"""
+
+    def __init__(self, status_code: int, headers: CaseInsensitiveDict, content: bytes,
+                 text_getter: Callable[[], str], http_version: str,
+                 set_cookie_headers: List[str]):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.http_version = http_version
+        self.set_cookie_headers = set_cookie_headers
+        self._text_getter = text_getter
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._text_getter()
+        return self._text
+
+    @property
+    def is_redirect(self) -> bool:
+        return self.status_code in REDIRECT_STATUSES and 'Location' in self.headers
+
+
+class UpstreamClient:
+    """
+    Shared client for origin requests
+
+    With HTTP/2 enabled, one httpx client is shared by every request thread so
+    subresource fetches to the same origin become streams on a single
+    connection. A GET or HEAD that fails at the HTTP/2 protocol level is
+    retried once on a new connection (an idle connection the server closed
+    fails that way too); if that fails as well, the origin is served over
+    HTTP/1.1 for HTTP1_PIN_SECONDS. Other methods are not replayed.
+    """
+
+    def __init__(self, http2: Optional[bool] = None, timeout: float = 30):
+        """
+        Initialize upstream client
+
+        Args:
+            http2: Use HTTP/2 when available (defaults to the PROXY_HTTP2 env var)
+            timeout: Request timeout in seconds
+        """
+        if http2 is None:
+            http2 = os.environ.get('PROXY_HTTP2', '0') == '1'
+
+        self.http2_enabled = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self._http1_only_origins: 'OrderedDict[str, float]' = OrderedDict()  # origin -> until
+        self._lock = threading.Lock()
+        self._client = None
+
+        if http2 and not HTTP2_AVAILABLE:
+            print("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1")
+
+    def _http2_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    http2=True,
+                    verify=False,
+                    follow_redirects=False,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=200, max_keepalive_connections=50)
+                )
+            return self._client
+
+    def _pinned_to_http1(self, origin: str) -> bool:
+        with self._lock:
+            until = self._http1_only_origins.get(origin)
+            if until is not None and until <= time.time():
+                del self._http1_only_origins[origin]
+                until = None
+        return until is not None
+
+    def _pin_to_http1(self, origin: str) -> None:
+        with self._lock:
+            self._http1_only_origins[origin] = time.time() + HTTP1_PIN_SECONDS
+            self._http1_only_origins.move_to_end(origin)
+            while len(self._http1_only_origins) > MAX_HTTP1_ORIGINS:
+                self._http1_only_origins.popitem(last=False)
+
+    def request(self, method: str, url: str, headers: Dict[str, str] = None,
+                data: bytes = None) -> UpstreamResponse:
+        """
+        Send one request without following redirects
+
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            headers: Request headers
+            data: Optional request body
+
+        Returns:
+            UpstreamResponse
+        """
+        origin = '{0.scheme}://{0.netloc}'.format(urlparse(url))
+        use_http2 = (self.http2_enabled and url.startswith('https://')
+                     and not self._pinned_to_http1(origin))
+
+        start = time.perf_counter()
+        if use_http2:
+            try:
+                try:
+                    response = self._request_http2(method, url, headers, data)
+                except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+                    if method.upper() not in REPLAYABLE_METHODS:
+                        # The origin may have acted on it; don't send it twice
+                        raise requests.exceptions.ConnectionError(str(e)) from e
+                    metrics.incr('upstream.http2_retries')
+                    response = self._request_http2(method, url, headers, data)
+            except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+                # Failed twice: some origins advertise h2 but misbehave
+                print(f"HTTP/2 failed for {origin}, falling back to HTTP/1.1: {e}")
+                self._pin_to_http1(origin)
+                metrics.incr('upstream.http2_fallbacks')
+                start = time.perf_counter()
+                response = self._request_http1(method, url, headers, data)
+            except httpx.ConnectTimeout as e:
+                raise requests.exceptions.ConnectTimeout(str(e)) from e
+            except httpx.TimeoutException as e:
+                # Read, write and pool timeouts; callers see what requests would raise
+                raise requests.exceptions.ReadTimeout(str(e)) from e
+            except httpx.HTTPError as e:
+                raise requests.exceptions.ConnectionError(str(e)) from e
+        else:
+            response = self._request_http1(method, url, headers, data)
+
+        protocol = response.http_version.lower().replace('/', '')
+        metrics.observe(f'upstream.seconds.{protocol}', time.perf_counter() - start)
+        metrics.incr(f'upstream.requests.{protocol}')
+        return response
+
+    def _request_http2(self, method, url, headers, data) -> UpstreamResponse:
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        response = self._http2_client().request(method, url, headers=headers, content=data)
+        return UpstreamResponse(
+            response.status_code,
+            CaseInsensitiveDict(response.headers.items()),
+            response.content,
+            lambda: response.text,
+            response.http_version,
+            response.headers.get_list('set-cookie')
+        )
+
+    def _request_http1(self, method, url, headers, data) -> UpstreamResponse:
+        response = requests.request(
+            method,
+            url,
+            data=data,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=False,
+            verify=False
+        )
+        version = {10: 'HTTP/1.0', 11: 'HTTP/1.1'}.get(response.raw.version, 'HTTP/1.1')
+        return UpstreamResponse(
+            response.status_code,
+            response.headers,
+            response.content,
+            lambda: response.text,
+            version,
+            response.raw.headers.getlist('Set-Cookie')
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
@@ -0,0 +1,90 @@
+"""
+Viewport Module
+Sizes a session's browser to the client that views it (CSS size and device
+pixel ratio), so screenshots carry no pixels the client would scale away
+"""
+
+import os
+from typing import Optional
+
+# Limits on what clients may ask for
+MIN_WIDTH, MAX_WIDTH = 320, 2560
+MIN_HEIGHT, MAX_HEIGHT = 240, 1600
+
+# Highest device pixel ratio rendered (BROWSER_MAX_DPR env var); phones report
+# 3 or more, which quadruples the bytes of 1.5 for little visible gain
+DEFAULT_MAX_DPR = 2.0
+
+
+class Viewport:
+    """Page size in CSS pixels plus device pixel ratio"""
+
+    __slots__ = ('width', 'height', 'dpr', 'mobile')
+
+    def __init__(self, width: int, height: int, dpr: float = 1.0, mobile: bool = False):
+        self.width = width
+        self.height = height
+        self.dpr = dpr
+        self.mobile = mobile
+
+    @property
+    def key(self) -> str:
+        """Compact form for render cache keys and the Flask session"""
+        return f"{self.width}x{self.height}@{self.dpr:g}{'m' if self.mobile else ''}"
+
+    @classmethod
+    def from_key(cls, key: Optional[str]) -> Optional['Viewport']:
+        try:
+            size, scale = key.split('@')
+            width, height = size.split('x')
+            mobile = scale.endswith('m')
+            return cls(int(width), int(height), float(scale.rstrip('m')), mobile)
+        except (AttributeError, ValueError):
+            return None
+
+    def to_dict(self) -> dict:
+        return {'width': self.width, 'height': self.height, 'dpr': self.dpr, 'mobile': self.mobile}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Viewport) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+
+DEFAULT_VIEWPORT = Viewport(1920, 1080)
+
+
+def max_dpr() -> float:
+    return float(os.environ.get('BROWSER_MAX_DPR', DEFAULT_MAX_DPR))
+
+
+def parse_viewport(data: dict) -> Viewport:
+    """
+    Build a viewport from a client report, clamped to supported limits
+
+    Raises:
+        ValueError: Missing or non-numeric width, height or dpr
+    """
+    try:
+        width = int(data['width'])
+        height = int(data['height'])
+        dpr = float(data.get('dpr', 1))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('width and height are required numbers')
+
+    width = min(max(width, MIN_WIDTH), MAX_WIDTH)
+    height = min(max(height, MIN_HEIGHT), MAX_HEIGHT)
+    # Quarter steps keep similar devices on the same render cache keys
+    dpr = round(min(max(dpr, 1.0), max_dpr()) * 4) / 4
+    return Viewport(width, height, dpr, bool(data.get('mobile')))
+
+
+def apply_viewport(driver, viewport: Viewport) -> None:
+    """Resize a driver's page through DevTools device metrics emulation"""
+    driver.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+        'width': viewport.width,
+        'height': viewport.height,
+        'deviceScaleFactor': viewport.dpr,
+        'mobile': viewport.mobile
+    })